@@ -0,0 +1,4 @@
+import re
+
+# Accounts the importers fall back to when nothing categorized a row
+UNCATEGORIZED_ACCOUNT = re.compile(r"^Expenses:FIXME$|:Uncategorized(:|$)|:Unclassified(:|$)")
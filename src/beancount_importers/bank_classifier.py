@@ -1,5 +1,7 @@
+from bisect import bisect_right, insort
 from collections import defaultdict
 import datetime
+import math
 from beancount.core import data
 import sys
 
@@ -31,19 +33,104 @@ for account, payee_list in ACCOUNT_PAYEES.items():
     for payee in payee_list:
         payee_to_account_mapping[payee] = account
 
+REFUND_WINDOW = datetime.timedelta(days=30)
+
+
 def filter_refunds(entries):
-    entries_by_amount = defaultdict(list)
-    for entry in entries:
+    """Mark uncategorized refunds and the expenses they refund as skipped.
+
+    Expenses are indexed by amount and kept sorted by date, so each refund only
+    looks at the unmatched expenses inside its window and a matched pair is
+    removed from the index straight away.
+    """
+    expenses_by_amount = defaultdict(list)
+    # Amounts whose expenses didn't arrive in date order
+    unordered_amounts = set()
+    for seq, entry in enumerate(entries):
         if isinstance(entry, data.Balance):
             continue
-        if entry.postings[1].account and "Expenses" in entry.postings[1].account and entry.postings[0].units.number < 0:
-            entries_by_amount[entry.postings[0].units.number].append(entry)
-        for candidate in entries_by_amount[-entry.postings[0].units.number]:
-            if "skip_transaction" in entry.meta or "skip_transaction" in candidate.meta:
-                continue
-            if 'Unclassified' in entry.postings[1].account and entry.date - candidate.date < datetime.timedelta(days=30):
-                entry.meta["skip_transaction"] = True
-                candidate.meta["skip_transaction"] = True
-            else:
-                pass
+        number = entry.postings[0].units.number
+        account = entry.postings[1].account
+        if number < 0:
+            if account and "Expenses" in account and "skip_transaction" not in entry.meta:
+                expenses = expenses_by_amount[number]
+                if expenses and expenses[-1][0] > entry.date:
+                    insort(expenses, (entry.date, seq, entry))
+                    unordered_amounts.add(number)
+                else:
+                    expenses.append((entry.date, seq, entry))
+            continue
+
+        candidates = expenses_by_amount.get(-number)
+        if not candidates or "skip_transaction" in entry.meta:
+            continue
+        if not account or "Unclassified" not in account:
+            continue
+
+        # After every expense dated on or before the window's start (bisect's key
+        # argument needs Python 3.10)
+        start = bisect_right(candidates, (entry.date - REFUND_WINDOW, math.inf))
+        if start == len(candidates):
+            continue
+        match = start
+        if -number in unordered_amounts:
+            # Prefer the expense seen first rather than the earliest one
+            match = min(range(start, len(candidates)), key=lambda i: candidates[i][1])
+        candidate = candidates.pop(match)[2]
+        entry.meta["skip_transaction"] = True
+        candidate.meta["skip_transaction"] = True
     return entries
+
+
+def filter_currencies(entries, currencies):
+    """Keep the transactions and balances of a multi-currency statement held in one of currencies."""
+    currencies = set(currencies)
+    return [
+        entry
+        for entry in entries
+        if (entry.amount if isinstance(entry, data.Balance) else entry.postings[0].units).currency
+        in currencies
+    ]
+
+
+class PrefixMatcher:
+    """Match a string against many prefix rules in a single pass.
+
+    Rules are compiled into a character trie. When several prefixes match, the
+    one that comes last in the rules mapping wins, same as checking every rule
+    with startswith in order.
+    """
+
+    def __init__(self, rules):
+        self.root = {}
+        for order, (prefix, value) in enumerate(rules.items()):
+            node = self.root
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[None] = (order, value)
+
+    def match(self, text, default=None):
+        node = self.root
+        best = node.get(None)
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(None)
+            if found is not None and (best is None or found[0] > best[0]):
+                best = found
+        return best[1] if best is not None else default
+
+    def match_all(self, text):
+        """Values of every prefix of text among the rules, shortest prefix first."""
+        node = self.root
+        found = node.get(None)
+        if found is not None:
+            yield found[1]
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(None)
+            if found is not None:
+                yield found[1]
@@ -0,0 +1,128 @@
+from collections import defaultdict
+import datetime
+from operator import attrgetter
+
+from beancount.core import data
+from beangulp.importers.csvbase import EMPTY, CSVReader, Importer, Order
+
+from beancount_importers import metrics
+from beancount_importers.columnar import read_columns, reader_layout
+
+RECURRING = frozenset(["recurring"])
+
+
+def recurring_flags(narrations):
+    """Whether each row is a standing order or a direct debit."""
+    return [
+        narration == "Standing order" or narration.startswith("Direct debit")
+        for narration in narrations
+    ]
+
+
+def hashtags(narrations):
+    """Tags written as #words in each row's description."""
+    return [
+        frozenset(word[1:] for word in narration.split(" ") if word.startswith("#"))
+        if "#" in narration
+        else EMPTY
+        for narration in narrations
+    ]
+
+
+def statement_tags(narrations):
+    return [
+        tags | RECURRING if recurring else tags
+        for recurring, tags in zip(recurring_flags(narrations), hashtags(narrations))
+    ]
+
+
+class BatchImporter(Importer):
+    """csvbase importer categorizing a whole statement at once.
+
+    Subclasses implement categorize_batch(columns), which gets every row of the
+    file as one list per column and returns the account and tags of each row,
+    an account of None dropping the row like finalize() returning None. Each
+    transaction is then built exactly once with both of its postings, instead
+    of being rebuilt by finalize() row by row.
+    """
+
+    # Keep each row's description as source_desc metadata, for beancount-import
+    describe_source = False
+    # Parse each column a distinct cell at a time rather than row by row
+    columnar = True
+
+    def read_columns(self, filepath):
+        # An importer reading its file its own way keeps doing so
+        if self.columnar and type(self).read is CSVReader.read:
+            return read_columns(self, filepath)
+        offset = reader_layout(self)[0] + bool(self.names) + 1
+        rows = []
+        linenos = []
+        for lineno, row in enumerate(self.read(filepath), offset):
+            # Skip empty lines
+            if row:
+                rows.append(row)
+                linenos.append(lineno)
+        columns = {name: list(map(attrgetter(name), rows)) for name in self.columns}
+        columns["lineno"] = linenos
+        return columns
+
+    def extract(self, filepath, existing):
+        with metrics.stage("parse"):
+            columns = self.read_columns(filepath)
+        with metrics.stage("categorize"):
+            accounts, tags = self.categorize_batch(columns)
+        with metrics.stage("build"):
+            return self.build_entries(filepath, columns, accounts, tags)
+
+    def build_entries(self, filepath, columns, accounts, tags):
+
+        count = len(accounts)
+        default_account = self.account(filepath)
+        dates = columns["date"]
+        narrations = columns["narration"]
+        amounts = columns["amount"]
+        linenos = columns["lineno"]
+        flags = columns.get("flag", [self.flag] * count)
+        payees = columns.get("payee", [None] * count)
+        source_accounts = columns.get("account", [default_account] * count)
+        currencies = columns.get("currency", [self.currency] * count)
+        links = [frozenset([link]) if link else EMPTY for link in columns.get("link", [None] * count)]
+        if "tag" in columns:
+            tags = [row_tags | {tag} if tag else row_tags for row_tags, tag in zip(tags, columns["tag"])]
+        row_balances = columns.get("balance")
+
+        entries = []
+        balances = defaultdict(list)
+        for i, account in enumerate(accounts):
+            if account is None:
+                continue
+            units = data.Amount(amounts[i], currencies[i])
+            meta = data.new_metadata(filepath, linenos[i])
+            if self.describe_source:
+                meta["source_desc"] = narrations[i]
+            entries.append(
+                data.Transaction(meta, dates[i], flags[i], payees[i], narrations[i], tags[i], links[i], [
+                    data.Posting(source_accounts[i], units, None, None, None, None),
+                    data.Posting(account, -units, None, None, None, None),
+                ])
+            )
+            if row_balances is not None and row_balances[i] is not None:
+                date = dates[i] + datetime.timedelta(days=1)
+                balance = data.Amount(row_balances[i], currencies[i])
+                meta = data.new_metadata(filepath, linenos[i])
+                balances[currencies[i]].append(
+                    data.Balance(meta, date, source_accounts[i], balance, None, None)
+                )
+
+        if not entries:
+            return []
+
+        # Same ordering rules as csvbase.Importer.extract
+        if self.order is None:
+            self.order = Order.ASCENDING if entries[0].date <= entries[-1].date else Order.DESCENDING
+        if self.order is Order.DESCENDING:
+            entries.reverse()
+        for currency_balances in balances.values():
+            entries.append(currency_balances[-1 if self.order is Order.ASCENDING else 0])
+        return entries
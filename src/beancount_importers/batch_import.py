@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import os
+import sys
+import time
+
+from beancount.core import data
+from beancount.parser import printer
+import click
+
+from beancount_importers import metrics
+from beancount_importers.beancount_import_run import load_import_config_from_file
+from beancount_importers.identify import source_files
+from beancount_importers.transfers import is_leg, match_transfers, merge_transfer
+from beancount_importers.watch import statement_state, wait_for_change
+
+# Data sources of the current process, set up once per worker
+_data_sources = None
+# Whether workers send back the metrics of each file they extract
+_metrics_enabled = False
+
+
+def init_worker(importers_config_file, data_dir, cache_dir, metrics_enabled=False):
+    global _data_sources, _metrics_enabled
+    _data_sources = load_import_config_from_file(
+        importers_config_file, data_dir, os.devnull, cache_dir
+    )["all"]["data_sources"]
+    _metrics_enabled = metrics_enabled
+
+
+def source_key(source):
+    return os.path.basename(source["directory"])
+
+
+def entry_sortkey(entry):
+    return (
+        data.entry_sortkey(entry)[:2]
+        + (entry.meta.get("filename", ""), entry.meta.get("lineno", 0))
+    )
+
+
+def extract_file(source_index, filepath):
+    """Extract a file and render its entries, so formatting also runs in the workers.
+
+    Entries that could be one leg of a transfer between two sources are also
+    sent back, with their position, to be paired up once every file is in,
+    and so are the file's metrics when enabled.
+    """
+    started = time.perf_counter()
+    source = _data_sources[source_index]
+    importer = source["importer"]
+    rendered = None
+    legs = []
+    recorder = metrics.Metrics() if _metrics_enabled else None
+    with metrics.recording(recorder), metrics.scope(source_key(source), filepath):
+        with metrics.stage("identify"):
+            identified = importer.identify(filepath)
+        if identified:
+            with metrics.stage("extract"):
+                entries = importer.extract(filepath, [])
+            metrics.count("files")
+            metrics.count("entries", len(entries))
+            with metrics.stage("render"):
+                eprinter = printer.EntryPrinter()
+                accounts = {source["account"] for source in _data_sources}
+                rendered = []
+                for position, entry in enumerate(entries):
+                    rendered.append((entry_sortkey(entry), type(entry).__name__, eprinter(entry)))
+                    if is_leg(entry, accounts):
+                        legs.append((position, entry))
+    report = recorder.report() if recorder is not None else None
+    return source_index, filepath, rendered, legs, time.perf_counter() - started, report
+
+
+def merge_transfers(entries, legs, window):
+    """Replace each pair of transfer legs by a single transaction in the rendered entries."""
+    locations = {id(entry): location for location, entry in legs}
+    accounts = {source["account"] for source in _data_sources}
+    pairs = match_transfers([entry for _, entry in legs], accounts, window)
+    eprinter = printer.EntryPrinter()
+    for outgoing, incoming in pairs:
+        index, position = locations[id(outgoing)]
+        merged = merge_transfer(outgoing, incoming)
+        entries[index][position] = (entry_sortkey(merged), "Transaction", eprinter(merged))
+        index, position = locations[id(incoming)]
+        entries[index][position] = None
+    for index, source_entries in enumerate(entries):
+        entries[index] = [entry for entry in source_entries if entry is not None]
+    return len(pairs)
+
+
+def write_entries(filename, rendered):
+    # Same layout as printer.print_entries() for the sorted entries
+    rendered = sorted(rendered)
+    previous_type = rendered[0][1] if rendered else None
+    with open(filename, "w", encoding="utf-8") as fh:
+        for _, entry_type, text in rendered:
+            if entry_type in ("Transaction", "Commodity") or entry_type != previous_type:
+                fh.write("\n")
+                previous_type = entry_type
+            fh.write(text)
+
+
+def import_statements(
+    importers_config_file,
+    data_dir,
+    cache_dir,
+    metrics_enabled,
+    jobs,
+    transfers,
+    transfer_days,
+    combined,
+    output_dir,
+):
+    """Extract every statement and write the entries of each source, once."""
+    started = time.perf_counter()
+    keys = [source_key(source) for source in _data_sources]
+    tasks = [
+        (index, filepath)
+        for index, source in enumerate(_data_sources)
+        for filepath in source_files(source["directory"])
+    ]
+
+    entries = [[] for _ in keys]
+    timings = [0.0 for _ in keys]
+    files = [0 for _ in keys]
+    legs = []
+
+    def collect(results):
+        for index, filepath, rendered, file_legs, elapsed, report in results:
+            timings[index] += elapsed
+            if report is not None:
+                metrics.current.merge(report)
+            if rendered is not None:
+                legs.extend(
+                    ((index, len(entries[index]) + position), entry)
+                    for position, entry in file_legs
+                )
+                entries[index].extend(rendered)
+                files[index] += 1
+
+    if jobs <= 1 or len(tasks) <= 1:
+        collect(extract_file(*task) for task in tasks)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=init_worker,
+            initargs=(importers_config_file, data_dir, cache_dir, metrics_enabled),
+        ) as pool:
+            collect(pool.map(extract_file, *zip(*tasks)))
+
+    if transfers:
+        with metrics.stage("match_transfers"):
+            merged = merge_transfers(entries, legs, datetime.timedelta(days=transfer_days))
+        print(f"Merged {merged} transfers between sources", file=sys.stderr)
+
+    with metrics.stage("write"):
+        os.makedirs(output_dir, exist_ok=True)
+        if combined:
+            write_entries(
+                os.path.join(output_dir, "all.bean"),
+                [entry for source_entries in entries for entry in source_entries],
+            )
+        else:
+            for key, source_entries in zip(keys, entries):
+                write_entries(os.path.join(output_dir, f"{key}.bean"), source_entries)
+
+    for key, count, source_entries, elapsed in zip(keys, files, entries, timings):
+        print(
+            f"{key:<20} {count:>5} files {len(source_entries):>8} entries {elapsed:8.3f}s",
+            file=sys.stderr,
+        )
+    print(f"Done in {time.perf_counter() - started:.3f}s", file=sys.stderr)
+
+
+@click.command()
+@click.option(
+    "--importers_config_file",
+    type=click.Path(exists=True),
+    required=True,
+    help="Path to the importers config file",
+)
+@click.option(
+    "--data_dir",
+    type=click.Path(),
+    default="beancount_import_data",
+    help="Directory with your import data (e.g. bank statements in csv)",
+)
+@click.option(
+    "--output_dir",
+    type=click.Path(),
+    default="beancount_batch_output",
+    help="Where to write the extracted entries",
+)
+@click.option(
+    "--combined/--per-source",
+    default=False,
+    help="Write all entries into all.bean instead of one <source>.bean per source",
+)
+@click.option(
+    "--cache_dir",
+    type=click.Path(),
+    default="beancount_import_cache",
+    help="Where to keep entries extracted from unchanged statements between runs "
+    + "(pass an empty value to disable)",
+)
+@click.option(
+    "--match_transfers/--no-match_transfers",
+    "transfers",
+    default=True,
+    help="Merge money leaving one source and arriving in another into one transaction",
+)
+@click.option(
+    "--transfer_days",
+    type=int,
+    default=3,
+    help="How many days apart the two legs of a transfer can be",
+)
+@click.option(
+    "--jobs",
+    type=int,
+    default=os.cpu_count(),
+    help="Number of worker processes",
+)
+@click.option(
+    "--metrics_json",
+    type=click.Path(dir_okay=False),
+    help="Write timings and counters per source, file and stage to this JSON file",
+)
+@click.option(
+    "--metrics_prometheus",
+    type=click.Path(dir_okay=False),
+    help="Write the metrics in the Prometheus text format, e.g. for the node exporter's "
+    + "textfile collector",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False),
+    help="Profile the run with cProfile and write the stats to this file "
+    + "(only covers the main process, use with --jobs 1)",
+)
+@click.option(
+    "--trace_memory/--no-trace_memory",
+    default=False,
+    help="Trace allocations with tracemalloc and add the peak and the top allocation sites "
+    + "to the JSON metrics",
+)
+@click.option(
+    "--watch/--no-watch",
+    default=False,
+    help="Keep running and extract again whenever statements are added or changed",
+)
+@click.option(
+    "--watch_interval",
+    type=float,
+    default=2.0,
+    help="How often to look for new or changed statements, in seconds",
+)
+def main(
+    watch_interval,
+    watch,
+    trace_memory,
+    profile,
+    metrics_prometheus,
+    metrics_json,
+    jobs,
+    transfer_days,
+    transfers,
+    cache_dir,
+    combined,
+    output_dir,
+    data_dir,
+    importers_config_file,
+):
+    """Extract every file of every configured source without starting the UI."""
+    recorder = None
+    if metrics_json or metrics_prometheus or profile or trace_memory:
+        recorder = metrics.Metrics(profile=bool(profile), trace_memory=trace_memory)
+        metrics.enable(recorder)
+    metrics_enabled = recorder is not None
+    init_worker(importers_config_file, data_dir, cache_dir, metrics_enabled)
+    directories = [source["directory"] for source in _data_sources]
+    try:
+        while True:
+            state = statement_state(directories)
+            import_statements(
+                importers_config_file,
+                data_dir,
+                cache_dir,
+                metrics_enabled,
+                jobs,
+                transfers,
+                transfer_days,
+                combined,
+                output_dir,
+            )
+            if not watch:
+                break
+            if recorder is not None:
+                recorder.export(metrics_json, metrics_prometheus)
+            print("Waiting for statements to be added or changed", file=sys.stderr)
+            wait_for_change(directories, state, watch_interval)
+    finally:
+        if recorder is not None:
+            recorder.stop()
+            recorder.export(metrics_json, metrics_prometheus, profile)
+
+
+if __name__ == "__main__":
+    main()
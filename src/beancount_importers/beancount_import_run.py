@@ -1,118 +1,268 @@
 #!/usr/bin/env python3
 
+import atexit
+import datetime
 import os
+from importlib.metadata import entry_points
 from pathlib import Path
 
-import beancount_import.webserver
 import click
 import yaml
-from uabean.importers import binance, ibkr, kraken, monobank
 
-import beancount_importers.import_monzo as import_monzo
-import beancount_importers.import_revolut as import_revolut
-import beancount_importers.import_wise as import_wise
-import beancount_importers.import_nationwide as import_nationwide
+from beancount_importers import metrics
+from beancount_importers.extract_cache import CachedImporter
+from beancount_importers.imported_index import ImportedIndex
 
+BEANGULP_SOURCE = "beancount_import.source.generic_importer_source_beangulp"
 
-def get_importer_config(type, account, currency, importer_params):
+# Packages can register extra importer types under this entry point group. The
+# entry point should resolve to a callable taking (account, currency,
+# importer_params) and returning a beangulp importer.
+IMPORTERS_ENTRY_POINT_GROUP = "beancount_importers.importers"
+
+
+def cache_importer(importer, module, cache_dir, importer_params, type, account, currency):
+    if not cache_dir:
+        return importer
+    imported = getattr(importer, "imported", None)
+    if imported is not None:
+        importer.imported = None
+    return CachedImporter(
+        importer,
+        cache_dir,
+        type,
+        account,
+        currency,
+        importer_params,
+        modules=[module],
+        imported=imported,
+    )
+
+
+# Importer modules are only imported once a configured source needs them, so
+# that e.g. a Monzo-only setup doesn't pay for loading uabean at startup.
+
+
+def monzo_source(type, account, currency, importer_params, cache_dir, imported):
+    import beancount_importers.import_monzo as import_monzo
+
+    return dict(
+        importer=cache_importer(
+            import_monzo.get_importer(account, currency, importer_params, imported),
+            import_monzo,
+            cache_dir,
+            importer_params,
+            type,
+            account,
+            currency,
+        ),
+        description=(
+            "In the app go to Help > Download a statement. "
+            "The easiest way would be just to download monthly statements every month."
+        ),
+        emoji="💷"
+    )
+
+
+def wise_source(type, account, currency, importer_params, cache_dir, imported):
+    import beancount_importers.import_wise as import_wise
+
+    return dict(
+        importer=cache_importer(
+            import_wise.get_importer(account, currency, importer_params, imported),
+            import_wise,
+            cache_dir,
+            importer_params,
+            type,
+            account,
+            currency,
+        ),
+        description="Can be downloaded online from https://wise.com/balances/statements",
+        emoji="💵"
+    )
+
+
+def revolut_source(type, account, currency, importer_params, cache_dir, imported):
+    import beancount_importers.import_revolut as import_revolut
+
+    return dict(
+        importer=cache_importer(
+            import_revolut.get_importer(account, currency, importer_params),
+            import_revolut,
+            cache_dir,
+            importer_params,
+            type,
+            account,
+            currency,
+        ),
+        emoji="💵"
+    )
+
+
+def nationwide_source(type, account, currency, importer_params, cache_dir, imported):
+    import beancount_importers.import_nationwide as import_nationwide
+
+    return dict(
+        importer=cache_importer(
+            import_nationwide.get_importer(account, currency, importer_params),
+            import_nationwide,
+            cache_dir,
+            importer_params,
+            type,
+            account,
+            currency,
+        ),
+        emoji="💵"
+    )
+
+
+def ibkr_source(type, account, currency, importer_params, cache_dir, imported):
+    from uabean.importers import ibkr
+
+    return dict(
+        importer=ibkr.Importer(
+            use_existing_holdings=False, **(importer_params or {})
+        ),
+        description=(
+            "Go to Performance & Reports > Flex Queries. "
+            'Create new one. Enable "Interest accruals", "Cash Transactions", "Trades", "Transfers". '
+            'From "Cash Transactions" disable fields "FIGI", "Issuer Country Code", "Available For Trading Date". '
+            'From "Trades" disable "Sub Category", "FIGI", "Issuer Country Code", "Related Trade ID", '
+            '"Orig *", "Related Transaction ID", "RTN", "Initial Investment". Otherwise importer may break.'
+        ),
+        emoji="📈"
+    )
+
+
+def monobank_source(type, account, currency, importer_params, cache_dir, imported):
+    from uabean.importers import monobank
+
+    mapped_account_config = {}
+    for p in importer_params.get("account_config", []):
+        tp = p[0]
+        currency = p[1]
+        account = p[2]
+        mapped_account_config[(tp, currency)] = account
+    mapped_params = importer_params.copy()
+    mapped_params["account_config"] = mapped_account_config
+    return dict(
+        importer=monobank.Importer(**mapped_params),
+        emoji="💵"
+    )
+
+
+def kraken_source(type, account, currency, importer_params, cache_dir, imported):
+    from uabean.importers import kraken
+
+    return dict(
+        importer=kraken.Importer(**(importer_params or {})),
+        emoji="🎰"
+    )
+
+
+def binance_source(type, account, currency, importer_params, cache_dir, imported):
+    from uabean.importers import binance
+
+    return dict(
+        importer=binance.Importer(**(importer_params or {})),
+        emoji="🎰"
+    )
+
+
+IMPORTER_SOURCES = {
+    "monzo": monzo_source,
+    "wise": wise_source,
+    "revolut": revolut_source,
+    "nationwide": nationwide_source,
+    "ibkr": ibkr_source,
+    "monobank": monobank_source,
+    "kraken": kraken_source,
+    "binance": binance_source,
+}
+
+
+def importer_entry_points():
+    discovered = entry_points()
+    if hasattr(discovered, "select"):
+        return discovered.select(group=IMPORTERS_ENTRY_POINT_GROUP)
+    # Before Python 3.10 entry_points() is a dict by group, without selection
+    return discovered.get(IMPORTERS_ENTRY_POINT_GROUP, [])
+
+
+def plugin_source(type):
+    for entry_point in importer_entry_points():
+        if entry_point.name == type:
+            get_importer = entry_point.load()
+
+            def source(type, account, currency, importer_params, cache_dir, imported):
+                return dict(
+                    importer=get_importer(account, currency, importer_params),
+                    emoji="💵"
+                )
+
+            return source
+    return None
+
+
+def get_importer_config(
+    type, account, currency, importer_params, cache_dir=None, imported=None, classifier=None
+):
+    source = IMPORTER_SOURCES.get(type) or plugin_source(type)
+    if source is None:
+        return None
     common = dict(type=type, account=account, currency=currency)
-    if type == "monzo":
-        return dict(
-            **common,
-            module="beancount_import.source.generic_importer_source_beangulp",
-            importer=import_monzo.get_importer(account, currency, importer_params),
-            description=(
-                "In the app go to Help > Download a statement. "
-                "The easiest way would be just to download monthly statements every month."
-            ),
-            emoji="💷"
-        )
-    elif type == "wise":
-        return dict(
-            **common,
-            module="beancount_import.source.generic_importer_source_beangulp",
-            importer=import_wise.get_importer(account, currency),
-            description="Can be downloaded online from https://wise.com/balances/statements",
-            emoji="💵"
-        )
-    elif type == "revolut":
-        return dict(
-            **common,
-            module="beancount_import.source.generic_importer_source_beangulp",
-            importer=import_revolut.get_importer(account, currency),
-            emoji="💵"
-        )
-    elif type == "nationwide":
-        return dict(
-            **common,
-            module="beancount_import.source.generic_importer_source_beangulp",
-            importer=import_nationwide.get_importer(account, currency),
-            emoji="💵"
-        )
-    elif type == "ibkr":
-        return dict(
-            **common,
-            module="beancount_import.source.generic_importer_source_beangulp",
-            importer=ibkr.Importer(
-                use_existing_holdings=False, **(importer_params or {})
-            ),
-            description=(
-                "Go to Performance & Reports > Flex Queries. "
-                'Create new one. Enable "Interest accruals", "Cash Transactions", "Trades", "Transfers". '
-                'From "Cash Transactions" disable fields "FIGI", "Issuer Country Code", "Available For Trading Date". '
-                'From "Trades" disable "Sub Category", "FIGI", "Issuer Country Code", "Related Trade ID", '
-                '"Orig *", "Related Transaction ID", "RTN", "Initial Investment". Otherwise importer may break.'
-            ),
-            emoji="📈"
-        )
-    elif type == "monobank":
-        mapped_account_config = {}
-        for p in importer_params.get("account_config", []):
-            tp = p[0]
-            currency = p[1]
-            account = p[2]
-            mapped_account_config[(tp, currency)] = account
-        mapped_params = importer_params.copy()
-        mapped_params["account_config"] = mapped_account_config
-        return dict(
-            **common,
-            module="beancount_import.source.generic_importer_source_beangulp",
-            importer=monobank.Importer(**mapped_params),
-            emoji="💵"
-        )
-    elif type == "kraken":
-        return dict(
-            **common,
-            module="beancount_import.source.generic_importer_source_beangulp",
-            importer=kraken.Importer(**(importer_params or {})),
-            emoji="🎰"
-        )
-    elif type == "binance":
-        return dict(
-            **common,
-            module="beancount_import.source.generic_importer_source_beangulp",
-            importer=binance.Importer(**(importer_params or {})),
-            emoji="🎰"
+    config = dict(
+        **common,
+        module=BEANGULP_SOURCE,
+        **source(type, account, currency, importer_params, cache_dir, imported),
+    )
+    if classifier is not None and type in RULES_IMPORTERS:
+        from beancount_importers.classifier import ClassifiedImporter
+
+        config["importer"] = ClassifiedImporter(config["importer"], classifier)
+    return config
+
+
+# Importer types reading categorization rules from their params. The top level
+# "rules" of the config file are shared by all of their sources, after the
+# source's own rules.
+RULES_IMPORTERS = {"monzo", "wise", "revolut", "nationwide"}
+
+
+def source_params(params, shared_rules):
+    importer_params = params.get("params")
+    if shared_rules and params["importer"] in RULES_IMPORTERS:
+        importer_params = dict(importer_params or {})
+        importer_params["rules"] = importer_params.get("rules", []) + shared_rules
+    return importer_params
+
+
+def source_config(key, params, shared_rules, data_dir, cache_dir=None, imported=None, classifier=None):
+    """Data source of one entry of the importers config file."""
+    return dict(
+        directory=os.path.join(data_dir, key),
+        **get_importer_config(
+            params["importer"],
+            params.get("account"),
+            params.get("currency"),
+            source_params(params, shared_rules),
+            cache_dir,
+            imported,
+            classifier,
         )
-    else:
-        return None
+    )
 
 
-def load_import_config_from_file(filename, data_dir, output_dir):
+def load_import_config_from_file(
+    filename, data_dir, output_dir, cache_dir=None, imported=None, classifier=None
+):
     with open(filename, "r") as config_file:
         parsed_config = yaml.safe_load(config_file)
-        data_sources = []
-        for key, params in parsed_config["importers"].items():
-            config = dict(
-                directory=os.path.join(data_dir, key),
-                **get_importer_config(
-                    params["importer"],
-                    params.get("account"),
-                    params.get("currency"),
-                    params.get("params"),
-                )
-            )
-            data_sources.append(config)
+        shared_rules = parsed_config.get("rules") or []
+        data_sources = [
+            source_config(key, params, shared_rules, data_dir, cache_dir, imported, classifier)
+            for key, params in parsed_config["importers"].items()
+        ]
         return dict(
             all=dict(
                 data_sources=data_sources,
@@ -121,118 +271,46 @@ def load_import_config_from_file(filename, data_dir, output_dir):
         )
 
 
-def get_import_config(data_dir, output_dir):
-    import_config = {
-        "monzo": dict(
-            data_sources=[
-                dict(
-                    module="beancount_import.source.generic_importer_source_beangulp",
-                    importer=import_monzo.get_importer("Assets:Monzo:Cash", "GBP"),
-                    account="Assets:Monzo:Cash",
-                    directory=os.path.join(data_dir, "monzo"),
-                )
-            ],
-            transactions_output=os.path.join(output_dir, "monzo", "transactions.bean"),
-        ),
-        "wise_usd": dict(
-            data_sources=[
-                dict(
-                    module="beancount_import.source.generic_importer_source_beangulp",
-                    importer=import_wise.get_importer("Assets:Wise:Cash", "USD"),
-                    account="Assets:Wise:Cash",
-                    directory=os.path.join(data_dir, "wise_usd"),
-                )
-            ],
-            transactions_output=os.path.join(
-                output_dir, "wise_usd", "transactions.bean"
-            ),
-        ),
-        "wise_gbp": dict(
-            data_sources=[
-                dict(
-                    module="beancount_import.source.generic_importer_source_beangulp",
-                    importer=import_wise.get_importer("Assets:Wise:Cash", "GBP"),
-                    account="Assets:Wise:Cash",
-                    directory=os.path.join(data_dir, "wise_gbp"),
-                )
-            ],
-            transactions_output=os.path.join(
-                output_dir, "wise_gbp", "transactions.bean"
-            ),
-        ),
-        "wise_eur": dict(
-            data_sources=[
-                dict(
-                    module="beancount_import.source.generic_importer_source_beangulp",
-                    importer=import_wise.get_importer("Assets:Wise:Cash", "EUR"),
-                    account="Assets:Wise:Cash",
-                    directory=os.path.join(data_dir, "wise_eur"),
-                )
-            ],
-            transactions_output=os.path.join(
-                output_dir, "wise_eur", "transactions.bean"
-            ),
-        ),
-        "revolut_usd": dict(
-            data_sources=[
-                dict(
-                    module="beancount_import.source.generic_importer_source_beangulp",
-                    importer=import_revolut.get_importer("Assets:Revolut:Cash", "USD"),
-                    account="Assets:Revolut:Cash",
-                    directory=os.path.join(data_dir, "revolut_usd"),
-                )
-            ],
-            transactions_output=os.path.join(
-                output_dir, "revolut", "transactions.bean"
-            ),
-        ),
-        "revolut_gbp": dict(
-            data_sources=[
-                dict(
-                    module="beancount_import.source.generic_importer_source_beangulp",
-                    importer=import_revolut.get_importer("Assets:Revolut:Cash", "GBP"),
-                    account="Assets:Revolut:Cash",
-                    directory=os.path.join(data_dir, "revolut_gbp"),
-                )
-            ],
-            transactions_output=os.path.join(
-                output_dir, "revolut", "transactions.bean"
-            ),
-        ),
-        "revolut_eur": dict(
-            data_sources=[
-                dict(
-                    module="beancount_import.source.generic_importer_source_beangulp",
-                    importer=import_revolut.get_importer("Assets:Revolut:Cash", "EUR"),
-                    account="Assets:Revolut:Cash",
-                    directory=os.path.join(data_dir, "revolut_eur"),
-                )
-            ],
-            transactions_output=os.path.join(
-                output_dir, "revolut", "transactions.bean"
-            ),
-        ),
-        "ibkr": dict(
-            data_sources=[
-                dict(
-                    module="beancount_import.source.generic_importer_source_beangulp",
-                    importer=ibkr.Importer(),
-                    account="Assets:IB",
-                    directory=os.path.join(data_dir, "ibkr"),
-                )
-            ],
-            transactions_output=os.path.join(output_dir, "ibkr", "transactions.bean"),
-        ),
-    }
-    import_config_all = dict(
-        data_sources=[],
-        transactions_output=os.path.join(output_dir, "transactions.bean"),
-    )
-    for k, v in import_config.items():
-        import_config_all["data_sources"].extend(v["data_sources"])
+# Sources used when no importers config file is given:
+# key -> (importer type, account, currency, output subdirectory)
+DEFAULT_SOURCES = {
+    "monzo": ("monzo", "Assets:Monzo:Cash", "GBP", "monzo"),
+    "wise_usd": ("wise", "Assets:Wise:Cash", "USD", "wise_usd"),
+    "wise_gbp": ("wise", "Assets:Wise:Cash", "GBP", "wise_gbp"),
+    "wise_eur": ("wise", "Assets:Wise:Cash", "EUR", "wise_eur"),
+    "revolut_usd": ("revolut", "Assets:Revolut:Cash", "USD", "revolut"),
+    "revolut_gbp": ("revolut", "Assets:Revolut:Cash", "GBP", "revolut"),
+    "revolut_eur": ("revolut", "Assets:Revolut:Cash", "EUR", "revolut"),
+    "ibkr": ("ibkr", "Assets:IB", None, "ibkr"),
+}
 
-    import_config["all"] = import_config_all
-    return import_config
+
+def get_import_config(
+    data_dir, output_dir, target_config="all", cache_dir=None, imported=None, classifier=None
+):
+    """Build the default import config, only for the sources of target_config."""
+    keys = DEFAULT_SOURCES.keys() if target_config == "all" else [target_config]
+    data_sources = []
+    for key in keys:
+        type, account, currency, output_subdir = DEFAULT_SOURCES[key]
+        data_sources.append(
+            dict(
+                directory=os.path.join(data_dir, key),
+                **get_importer_config(
+                    type, account, currency, None, cache_dir, imported, classifier
+                ),
+            )
+        )
+    if target_config == "all":
+        transactions_output = os.path.join(output_dir, "transactions.bean")
+    else:
+        transactions_output = os.path.join(output_dir, output_subdir, "transactions.bean")
+    return {
+        target_config: dict(
+            data_sources=data_sources,
+            transactions_output=transactions_output,
+        )
+    }
 
 
 @click.command()
@@ -266,37 +344,253 @@ def get_import_config(data_dir, output_dir):
     help="Note that specifying particular config will also result in transactions "
     + "being imported into specific output file for that config",
 )
+@click.option(
+    "--cache_dir",
+    type=click.Path(),
+    default="beancount_import_cache",
+    help="Where to keep entries extracted from unchanged statements between runs "
+    + "(pass an empty value to disable)",
+)
+@click.option(
+    "--cache_ledger/--no-cache_ledger",
+    default=True,
+    help="Keep the loaded journal in --cache_dir, so that starting up only parses "
+    + "the ledger files that changed since the last run",
+)
+@click.option(
+    "--skip_imported/--keep_imported",
+    default=True,
+    help="Drop statement rows whose Monzo transaction id or Wise reference id is "
+    + "already in the ledger but no longer matches the imported posting",
+)
+@click.option(
+    "--classify/--no-classify",
+    default=False,
+    help="Predict the account of rows the importers leave uncategorized with a model "
+    + "trained on the ledger, instead of leaving them to beancount-import's predictions",
+)
+@click.option(
+    "--min_confidence",
+    type=float,
+    default=0.8,
+    help="Least probability of the predicted account for it to be used",
+)
+@click.option(
+    "--match_transfers/--no-match_transfers",
+    "transfers",
+    default=True,
+    help="Book money leaving one source and arriving in another against each other's account",
+)
+@click.option(
+    "--transfer_days",
+    type=int,
+    default=3,
+    help="How many days apart the two legs of a transfer can be",
+)
+@click.option(
+    "--metrics_json",
+    type=click.Path(dir_okay=False),
+    help="Write timings and counters per source, file and stage to this JSON file, "
+    + "updated while the server runs",
+)
+@click.option(
+    "--metrics_prometheus",
+    type=click.Path(dir_okay=False),
+    help="Write the metrics in the Prometheus text format, e.g. for the node exporter's "
+    + "textfile collector",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False),
+    help="Profile the main thread with cProfile and write the stats to this file on exit",
+)
+@click.option(
+    "--trace_memory/--no-trace_memory",
+    default=False,
+    help="Trace allocations with tracemalloc and add the peak and the top allocation sites "
+    + "to the JSON metrics",
+)
+@click.option(
+    "--shard_by_source/--no-shard_by_source",
+    default=False,
+    help="Write the transactions, balances and accounts of each source account "
+    + "into a directory of their own",
+)
+@click.option(
+    "--shard_period",
+    type=click.Choice(["none", "year", "month"]),
+    default="none",
+    help="Write transactions and balances into one file per year or month",
+)
+@click.option(
+    "--watch/--no-watch",
+    default=False,
+    help="Import statements added to or changed in the data directories while running, "
+    + "and rebuild the sources whose settings changed in the importers config file",
+)
+@click.option(
+    "--watch_interval",
+    type=float,
+    default=0,
+    help="Poll the data directories every this many seconds instead of relying on "
+    + "filesystem events (e.g. for network drives)",
+)
 @click.option("--address", default="127.0.0.1", help="Web server address")
 @click.option("--port", default="8101", help="Web server port")
 def main(
     port,
     address,
+    watch_interval,
+    watch,
+    shard_period,
+    shard_by_source,
+    trace_memory,
+    profile,
+    metrics_prometheus,
+    metrics_json,
+    transfer_days,
+    transfers,
+    min_confidence,
+    classify,
+    skip_imported,
+    cache_ledger,
+    cache_dir,
     target_config,
     output_dir,
     data_dir,
     importers_config_file,
     journal_file,
 ):
+    recorder = None
+    if metrics_json or metrics_prometheus or profile or trace_memory:
+        recorder = metrics.Metrics(profile=bool(profile), trace_memory=trace_memory)
+        metrics.enable(recorder)
+        files = dict(json_file=metrics_json, prometheus_file=metrics_prometheus)
+        # Dumping the profile stops the profiler, so only on exit
+        exporter = metrics.PeriodicExport(recorder, **files)
+        atexit.register(recorder.export, profile_file=profile, **files)
+        atexit.register(recorder.stop)
+    imported = None
+    if skip_imported:
+        imported = ImportedIndex(
+            [journal_file],
+            os.path.join(cache_dir, "imported_ids.json") if cache_dir else None,
+        )
+    classifier = None
+    if classify:
+        from beancount_importers.classifier import PayeeClassifier
+
+        classifier = PayeeClassifier(
+            [journal_file],
+            os.path.join(cache_dir, "payee_classifier.json") if cache_dir else None,
+            min_confidence,
+        )
     import_config = None
     if importers_config_file:
         import_config = load_import_config_from_file(
-            importers_config_file, data_dir, output_dir
+            importers_config_file, data_dir, output_dir, cache_dir, imported, classifier
         )
     else:
-        import_config = get_import_config(data_dir, output_dir)
+        import_config = get_import_config(
+            data_dir, output_dir, target_config, cache_dir, imported, classifier
+        )
+    # Usually included by the ledger already, indexed once either way
+    for index in (imported, classifier):
+        if index is not None:
+            index.filenames.append(os.path.join(output_dir, "index.bean"))
+    matcher = None
+    if transfers:
+        from beancount_importers.transfers import TransferMatcher
+
+        matcher = TransferMatcher(datetime.timedelta(days=transfer_days))
+
+    def finish_source(source):
+        if recorder is not None:
+            # Inside the transfer matcher, which extracts the files of every source
+            # at once, so each file still counts for its own source
+            source["importer"] = metrics.MeteredImporter(
+                source["importer"],
+                os.path.basename(source["directory"]),
+                recorder,
+                exporter.changed,
+            )
+        if matcher is not None and source["type"] in RULES_IMPORTERS:
+            source["importer"] = matcher.wrap(
+                source["importer"], source["directory"], source["account"]
+            )
+        return source
+
+    for source in import_config[target_config]["data_sources"]:
+        finish_source(source)
     # Create output structure if it doesn't exist
-    os.makedirs(
-        os.path.dirname(import_config[target_config]["transactions_output"]),
-        exist_ok=True,
+    from beancount_importers import output_shards
+
+    output_accounts = [
+        source["account"]
+        for source in import_config[target_config]["data_sources"]
+        if source["account"]
+    ]
+    output_options, output_files, includes = output_shards.output_options(
+        output_dir,
+        import_config[target_config]["transactions_output"],
+        output_accounts,
+        shard_by_source,
+        None if shard_period == "none" else shard_period,
     )
-    Path(import_config[target_config]["transactions_output"]).touch()
-    for file in [
-        "accounts.bean",
-        "balance_accounts.bean",
-        "prices.bean",
-        "ignored.bean",
-    ]:
-        Path(os.path.join(output_dir, file)).touch()
+    for file in output_files + [os.path.join(output_dir, "ignored.bean")]:
+        os.makedirs(os.path.dirname(file) or ".", exist_ok=True)
+        Path(file).touch()
+    output_shards.write_index(os.path.join(output_dir, "index.bean"), includes)
+    output_shards.install()
+
+    if cache_dir:
+        from beancount_importers import extract_cache
+
+        extract_cache.install(cache_dir)
+
+    if cache_ledger and cache_dir:
+        from beancount_importers.ledger_cache import LedgerCache
+
+        LedgerCache(os.path.join(cache_dir, "ledger")).install()
+
+    if watch:
+        from beancount_importers import watch as statement_watch
+
+        statement_watch.install(
+            [source["directory"] for source in import_config[target_config]["data_sources"]],
+            watch_interval,
+        )
+        if importers_config_file:
+            from beancount_importers import config_reload
+
+            def build_source(key, params, shared_rules):
+                return finish_source(
+                    source_config(key, params, shared_rules, data_dir, cache_dir, imported, classifier)
+                )
+
+            def remove_source(source):
+                if matcher is not None:
+                    matcher.remove(source["directory"])
+
+            def update_output(data_sources):
+                # Removed sources keep their shards, what was written to them
+                # stays included
+                for source in data_sources:
+                    if source["account"] and source["account"] not in output_accounts:
+                        output_accounts.append(source["account"])
+                return output_shards.update_output(
+                    output_dir,
+                    import_config[target_config]["transactions_output"],
+                    output_accounts,
+                    shard_by_source,
+                    None if shard_period == "none" else shard_period,
+                )
+
+            config_reload.install(
+                importers_config_file, build_source, remove_source, update_output
+            )
+
+    import beancount_import.webserver
 
     beancount_import.webserver.main(
         {},
@@ -304,15 +598,8 @@ def main(
         address=address,
         journal_input=journal_file,
         ignored_journal=os.path.join(output_dir, "ignored.bean"),
-        default_output=import_config[target_config]["transactions_output"],
-        open_account_output_map=[
-            (".*", os.path.join(output_dir, "accounts.bean")),
-        ],
-        balance_account_output_map=[
-            (".*", os.path.join(output_dir, "balance_accounts.bean")),
-        ],
-        price_output=os.path.join(output_dir, "prices.bean"),
         data_sources=import_config[target_config]["data_sources"],
+        **output_options,
     )
 
 
@@ -0,0 +1,660 @@
+#!/usr/bin/env python3
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import datetime
+from decimal import Decimal
+from functools import partial
+import gc
+import importlib
+import importlib.metadata
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from beancount.core import data
+from beangulp.importers import csvbase
+import click
+
+from beancount_importers import import_monzo
+from beancount_importers.bank_classifier import PrefixMatcher, filter_refunds
+from beancount_importers.batch_categorize import BatchImporter
+from beancount_importers.columnar import StatementImporter
+from beancount_importers.rules import RuleSet
+from beancount_importers.transfers import match_transfers
+
+
+def legacy_filter_refunds(entries):
+    # The original quadratic scan, kept as a baseline for comparison
+    entries_by_amount = defaultdict(list)
+    for entry in entries:
+        if isinstance(entry, data.Balance):
+            continue
+        if entry.postings[1].account and "Expenses" in entry.postings[1].account and entry.postings[0].units.number < 0:
+            entries_by_amount[entry.postings[0].units.number].append(entry)
+        for candidate in entries_by_amount[-entry.postings[0].units.number]:
+            if "skip_transaction" in entry.meta or "skip_transaction" in candidate.meta:
+                continue
+            if 'Unclassified' in entry.postings[1].account and entry.date - candidate.date < datetime.timedelta(days=30):
+                entry.meta["skip_transaction"] = True
+                candidate.meta["skip_transaction"] = True
+    return entries
+
+
+def legacy_match_payee(rules, payee, default=None):
+    # The loop NationwideReader.categorize used to run for every row
+    posting_account = default
+    for mapped_payee, acct in rules.items():
+        if payee.startswith(mapped_payee):
+            posting_account = acct
+    return posting_account
+
+
+def generate_entries(count, seed=0, amounts=50, refund_rate=0.05, shuffle=False):
+    """Synthetic history of small card payments sharing a handful of amounts."""
+    rng = random.Random(seed)
+    start = datetime.date(2015, 1, 1)
+    prices = [Decimal(rng.randint(100, 5000)) / 100 for _ in range(amounts)]
+    entries = []
+    for i in range(count):
+        date = start + datetime.timedelta(days=i * 3650 // max(count, 1))
+        number = rng.choice(prices)
+        if rng.random() < refund_rate:
+            account = "Income:Unclassified:Monzo"
+        else:
+            account = "Expenses:Shopping"
+            number = -number
+        units = data.Amount(number, "GBP")
+        entries.append(
+            data.Transaction(
+                data.new_metadata("<bench>", i), date, "*", "Payee", "", frozenset(), frozenset(), [
+                    data.Posting("Assets:Monzo:Cash", units, None, None, None, None),
+                    data.Posting(account, -units, None, None, None, None),
+                ]
+            )
+        )
+    if shuffle:
+        rng.shuffle(entries)
+    return entries
+
+
+def legacy_match_rules(ruleset, payee, narration, amount, id=None):
+    # Checking every rule in order, what the compiled indexes have to agree with
+    for rule in ruleset.rules:
+        if rule.matches(payee or "", narration or "", amount, None if id is None else str(id)):
+            return rule.account
+    return None
+
+
+def generate_rules(count, seed=0, regex_rate=0.01):
+    """Rules of every kind, mostly exact and prefix payees like a real config."""
+    rng = random.Random(seed)
+    rules = []
+    for i in range(count):
+        account = f"Expenses:Rule{i}"
+        kind = rng.random()
+        if kind < regex_rate:
+            rules.append({"payee_regex": f"MERCH{i}[0-9]+$", "account": account})
+        elif kind < 0.4:
+            rules.append({"payee": f"Merchant {i}", "account": account})
+        elif kind < 0.6:
+            rules.append({"payee_prefix": f"SHOP{i} ", "account": account})
+        elif kind < 0.75:
+            rules.append({"id": f"tx_{i}", "account": account})
+        elif kind < 0.85:
+            rules.append({"narration_prefix": f"Payment to {i} ", "account": account})
+        else:
+            rules.append({"payee": f"Merchant {i}", "sign": "negative", "min_amount": -100, "account": account})
+    rules.append({"min_amount": 5000, "account": "Income:Large"})
+    return rules
+
+
+def generate_rows(count, rule_count, seed=0):
+    """(payee, narration, amount, id) rows hitting rules of every kind and missing them."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        target = rng.randrange(rule_count * 2)
+        payee = rng.choice([f"Merchant {target}", f"SHOP{target} LONDON", f"MERCH{target}{i % 97}"])
+        narration = rng.choice(["Card payment", f"Payment to {target} ref {i}"])
+        amount = Decimal(rng.randint(-20000, 20000)) / 100
+        rows.append((payee, narration, amount, f"tx_{rng.randrange(rule_count * 2)}"))
+    return rows
+
+
+def generate_transfers(count, seed=0, accounts=("Assets:Monzo:Cash", "Assets:Revolut:Cash", "Assets:Wise:Cash")):
+    """Uncategorized legs over ten years, about half of them transfers between the accounts."""
+    rng = random.Random(seed)
+    start = datetime.date(2015, 1, 1)
+    entries = []
+
+    def leg(date, account, number, other):
+        units = data.Amount(number, "GBP")
+        return data.Transaction(
+            data.new_metadata("<bench>", len(entries)), date, "*", "Payee", "", frozenset(), frozenset(), [
+                data.Posting(account, units, None, None, None, None),
+                data.Posting(other, -units, None, None, None, None),
+            ]
+        )
+
+    while len(entries) < count:
+        date = start + datetime.timedelta(days=rng.randrange(3650))
+        number = Decimal(rng.choice([1000, 2000, 5000, 10000, rng.randint(100, 100000)])) / 100
+        source, target = rng.sample(accounts, 2)
+        entries.append(leg(date, source, -number, "Expenses:FIXME"))
+        if rng.random() < 0.5:
+            delay = datetime.timedelta(days=rng.randint(0, 2))
+            entries.append(leg(date + delay, target, number, "Income:Uncategorized:Bank"))
+    rng.shuffle(entries)
+    return entries, accounts
+
+
+def cents(number):
+    # Exported amounts always show two decimal places
+    return Decimal(number).scaleb(-2)
+
+
+MONZO_CATEGORIES = ["Eating out", "Groceries", "Shopping", "Transport", "Bills", "General", "Savings"]
+
+
+def write_monzo_statement(filepath, count, seed=0):
+    """Monzo export with card payments, direct debits, #tagged rows, pots and declined cards."""
+    rng = random.Random(seed)
+    start = datetime.date(2015, 1, 1)
+    with open(filepath, "w", newline="") as fd:
+        writer = csv.writer(fd)
+        writer.writerow(["Transaction ID", "Date", "Name", "Description", "Currency", "Amount", "Category"])
+        for i in range(count):
+            date = start + datetime.timedelta(days=i * 3650 // max(count, 1))
+            kind = rng.random()
+            amount = -cents(rng.randint(100, 20000))
+            name = f"Merchant {rng.randrange(2000)}"
+            description = "Card payment"
+            if kind < 0.1:
+                description = f"Direct debit {rng.randrange(50)}"
+            elif kind < 0.15:
+                description = f"Dinner #trip{rng.randrange(5)} #food"
+            elif kind < 0.2:
+                name, description, amount = "Savings Pot", "Pot", -amount
+            elif kind < 0.22:
+                amount = cents(0)
+            writer.writerow([
+                f"tx_{i}", date.strftime("%d/%m/%Y"), name, description, "GBP", amount,
+                rng.choice(MONZO_CATEGORIES),
+            ])
+
+
+WISE_HEADER = [
+    "TransferWise ID", "Date", "Amount", "Currency", "Description", "Payment Reference",
+    "Running Balance", "Exchange From", "Exchange To", "Exchange Rate", "Payer Name", "Payee Name",
+    "Payee Account Number", "Merchant", "Card Last Four Digits", "Card Holder Full Name",
+    "Attachment", "Note", "Total fees",
+]
+
+
+def write_wise_statement(filepath, count, seed=0):
+    """Multi-currency Wise export with card payments, transfers out and money received."""
+    rng = random.Random(seed)
+    start = datetime.date(2015, 1, 1)
+    balances = {"GBP": Decimal("1000.00"), "EUR": Decimal("500.00"), "USD": Decimal("200.00")}
+    with open(filepath, "w", newline="") as fd:
+        writer = csv.writer(fd)
+        writer.writerow(WISE_HEADER)
+        for i in range(count):
+            date = start + datetime.timedelta(days=i * 3650 // max(count, 1))
+            currency = rng.choice(list(balances))
+            kind = rng.random()
+            merchant = payee = payer = ""
+            if kind < 0.7:
+                amount = -cents(rng.randint(100, 20000))
+                merchant = f"Merchant {rng.randrange(2000)}"
+                description = f"Card transaction of {-amount} {currency} issued by {merchant}"
+                reference = f"CARD-{i}"
+            elif kind < 0.85:
+                amount = -cents(rng.randint(1000, 100000))
+                payee = f"Person {rng.randrange(100)}"
+                description = f"Sent money to {payee}"
+                reference = f"TRANSFER-{i}"
+            else:
+                amount = cents(rng.randint(1000, 300000))
+                payer = f"Person {rng.randrange(100)}"
+                description = f"Received money from {payer}"
+                reference = f"TRANSFER-{i}"
+            balances[currency] += amount
+            row = dict.fromkeys(WISE_HEADER, "")
+            row.update({
+                "TransferWise ID": reference, "Date": date.strftime("%d-%m-%Y"), "Amount": amount,
+                "Currency": currency, "Description": description, "Running Balance": balances[currency],
+                "Payer Name": payer, "Payee Name": payee, "Merchant": merchant, "Total fees": "0",
+            })
+            writer.writerow(row.values())
+
+
+def write_revolut_statement(filepath, count, seed=0):
+    """Revolut export with card payments, top-ups and cashback."""
+    rng = random.Random(seed)
+    start = datetime.datetime(2015, 1, 1, 9)
+    balance = Decimal("100.00")
+    with open(filepath, "w", newline="") as fd:
+        writer = csv.writer(fd)
+        writer.writerow([
+            "Type", "Product", "Started Date", "Completed Date", "Description", "Amount", "Fee",
+            "Currency", "State", "Balance",
+        ])
+        for i in range(count):
+            started = start + datetime.timedelta(minutes=i * 5256000 // max(count, 1))
+            kind = rng.random()
+            if kind < 0.8:
+                kind, amount = "CARD_PAYMENT", -cents(rng.randint(100, 10000))
+                description = f"Merchant {rng.randrange(2000)}"
+            elif kind < 0.95:
+                kind, amount, description = "TOPUP", cents(rng.choice([1000, 2000, 5000]) * 100), "Top-Up by *1234"
+            else:
+                kind, amount, description = "REWARD", cents(rng.randint(1, 500)), "Metal Cashback"
+            balance += amount
+            completed = started + datetime.timedelta(hours=rng.randint(0, 48))
+            writer.writerow([
+                kind, "Current", started.strftime("%Y-%m-%d %H:%M:%S"),
+                completed.strftime("%Y-%m-%d %H:%M:%S"), description, amount, "0.00", "GBP",
+                "COMPLETED", balance,
+            ])
+
+
+def nationwide_money(number):
+    return f"£{number:,.2f}" if number else ""
+
+
+def write_nationwide_statement(filepath, count, seed=0):
+    """Nationwide export, iso-8859-1 with £ amounts and the account summary preamble."""
+    rng = random.Random(seed)
+    start = datetime.date(2015, 1, 1)
+    balance = Decimal("1234.56")
+    rows = []
+    for i in range(count):
+        date = start + datetime.timedelta(days=i * 3650 // max(count, 1))
+        kind = rng.random()
+        paid_out = paid_in = Decimal(0)
+        if kind < 0.75:
+            kind, description = "Visa purchase", f"MERCHANT {rng.randrange(2000)}"
+            paid_out = cents(rng.randint(100, 30000))
+        elif kind < 0.85:
+            kind, description = "Direct debit", f"Direct debit {rng.randrange(50)}"
+            paid_out = cents(rng.randint(1000, 50000))
+        elif kind < 0.9:
+            kind, description = "Interest", "Interest added"
+            paid_in = cents(rng.randint(1, 2000))
+        else:
+            kind, description = "Transfer from", f"Transfer from {rng.randrange(10)}"
+            paid_in = cents(rng.randint(10000, 300000))
+        balance += paid_in - paid_out
+        rows.append([
+            date.strftime("%d %b %Y"), kind, description, nationwide_money(paid_out),
+            nationwide_money(paid_in), nationwide_money(balance),
+        ])
+    with open(filepath, "w", newline="", encoding="iso-8859-1") as fd:
+        writer = csv.writer(fd, quoting=csv.QUOTE_ALL)
+        writer.writerow(["Account Name:", "FlexDirect ****12345"])
+        writer.writerow(["Account Balance:", nationwide_money(balance)])
+        writer.writerow(["Available Balance: ", nationwide_money(balance)])
+        fd.write("\r\n")
+        writer.writerow(["Date", "Transaction type", "Description", "Paid out", "Paid in", "Balance"])
+        writer.writerows(rows)
+
+
+STATEMENT_WRITERS = {
+    "monzo": write_monzo_statement,
+    "wise": write_wise_statement,
+    "revolut": write_revolut_statement,
+    "nationwide": write_nationwide_statement,
+}
+
+
+def skipped(entries):
+    return [i for i, entry in enumerate(entries) if "skip_transaction" in entry.meta]
+
+
+def timed(fn, *args):
+    # Like timeit, keep the collector from charging the whole heap to the run
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        result = fn(*args)
+        return time.perf_counter() - started, result
+    finally:
+        gc.enable()
+
+
+def timed_stage(stages, name, fn):
+    """fn, adding the time spent in each of its calls to stages[name]."""
+
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stages[name] += time.perf_counter() - started
+
+    return wrapper
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def benchmark_importer(name, filepath, rows):
+    """Throughput and time per stage of one importer, meant to run in a fresh process."""
+    try:
+        module = importlib.import_module(f"beancount_importers.import_{name}")
+    except ImportError as e:
+        return dict(format=name, skipped=str(e))
+    importer = module.get_importer(f"Assets:{name.title()}:Cash", "GBP", {})
+
+    stages = dict(parse=0.0, categorize=0.0)
+    if isinstance(importer, BatchImporter):
+        importer.read_columns = timed_stage(stages, "parse", importer.read_columns)
+        importer.categorize_batch = timed_stage(stages, "categorize", importer.categorize_batch)
+    elif isinstance(importer, StatementImporter):
+        # Rows are parsed and categorized in the same loop, parsing is the rest
+        importer.base.categorizer = timed_stage(stages, "categorize", importer.base.categorizer)
+    rss_before = peak_rss_mb()
+    elapsed, entries = timed(importer.extract, filepath, [])
+    if isinstance(importer, BatchImporter):
+        stages["build"] = elapsed - stages["parse"] - stages["categorize"]
+    else:
+        stages["parse"] = elapsed - stages["categorize"]
+    stages["filter_refunds"], _ = timed(filter_refunds, entries)
+
+    return dict(
+        format=name,
+        rows=rows,
+        entries=len(entries),
+        file_mb=round(os.path.getsize(filepath) / (1 << 20), 2),
+        seconds=round(elapsed, 4),
+        rows_per_sec=round(rows / elapsed),
+        peak_rss_mb=round(peak_rss_mb(), 1),
+        extract_rss_mb=round(peak_rss_mb() - rss_before, 1),
+        stages={stage: round(seconds, 4) for stage, seconds in stages.items()},
+    )
+
+
+def package_version():
+    try:
+        return importlib.metadata.version("beancount-importers")
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("--sizes", default="10000,100000,1000000", help="Comma-separated entry counts")
+@click.option("--legacy-limit", default=100000, help="Largest size to also run the legacy scan on")
+def refunds(sizes, legacy_limit):
+    """Time filter_refunds against the legacy scan."""
+    for size in [int(s) for s in sizes.split(",")]:
+        elapsed, result = timed(filter_refunds, generate_entries(size))
+        line = f"{size:>9} entries  indexed {elapsed:8.3f}s"
+        if size <= legacy_limit:
+            legacy_elapsed, legacy_result = timed(legacy_filter_refunds, generate_entries(size))
+            assert skipped(result) == skipped(legacy_result), "skip_transaction marks differ"
+            line += f"  legacy {legacy_elapsed:8.3f}s"
+        click.echo(line)
+
+
+@cli.command()
+@click.option("--rules", "rule_count", default=500, help="Number of by_payee rules")
+@click.option("--rows", default=100000, help="Number of payees to classify")
+def payees(rule_count, rows):
+    """Time PrefixMatcher against the per-row startswith loop."""
+    rng = random.Random(0)
+    words = ["".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ ") for _ in range(rng.randint(3, 16)))
+             for _ in range(rule_count)]
+    rules = {word: f"Expenses:Rule{i}" for i, word in enumerate(words)}
+    # Shorter prefixes of other rules make sure the last-match ordering is exercised
+    rules.update({word[:2]: "Expenses:Short" for word in words[::10]})
+    payees = [rng.choice(words) + " REF " + str(i) if rng.random() < 0.7 else f"UNKNOWN {i}"
+              for i in range(rows)]
+
+    def compiled():
+        matcher = PrefixMatcher(rules)
+        return [matcher.match(payee, "Expenses:FIXME") for payee in payees]
+
+    def legacy():
+        return [legacy_match_payee(rules, payee, "Expenses:FIXME") for payee in payees]
+
+    elapsed, result = timed(compiled)
+    legacy_elapsed, legacy_result = timed(legacy)
+    assert result == legacy_result, "matched accounts differ"
+    click.echo(f"{len(rules)} rules x {rows} rows  trie {elapsed:.3f}s  legacy {legacy_elapsed:.3f}s")
+
+
+@cli.command()
+@click.option("--rules", "rule_count", default=10000, help="Number of categorization rules")
+@click.option("--rows", default=1000000, help="Number of rows to categorize")
+@click.option("--legacy-rows", default=2000, help="Rows also checked against every rule in order")
+def rules(rule_count, rows, legacy_rows):
+    """Time the compiled RuleSet, and check it against an in-order scan of the rules."""
+    config = generate_rules(rule_count)
+    compile_elapsed, ruleset = timed(RuleSet, config)
+    sample = generate_rows(rows, rule_count)
+
+    def compiled():
+        return [ruleset.match(*row) for row in sample]
+
+    elapsed, result = timed(compiled)
+    matched = sum(account is not None for account in result)
+    click.echo(
+        f"{len(config)} rules compiled in {compile_elapsed:.3f}s, {rows} rows in {elapsed:.3f}s "
+        f"({rows / elapsed:,.0f} rows/s, {matched} matched)"
+    )
+
+    if legacy_rows:
+        legacy_elapsed, legacy_result = timed(
+            lambda: [legacy_match_rules(ruleset, *row) for row in sample[:legacy_rows]]
+        )
+        assert result[:legacy_rows] == legacy_result, "matched accounts differ"
+        click.echo(f"in-order scan {legacy_rows / legacy_elapsed:,.0f} rows/s on the first {legacy_rows} rows")
+
+
+@cli.command()
+@click.option("--sizes", default="10000,100000,1000000", help="Comma-separated leg counts")
+def transfers(sizes):
+    """Time match_transfers on growing histories of candidate legs."""
+    for size in [int(s) for s in sizes.split(",")]:
+        entries, accounts = generate_transfers(size)
+        elapsed, pairs = timed(match_transfers, entries, accounts)
+        click.echo(f"{len(entries):>9} legs  {len(pairs):>8} transfers  {elapsed:8.3f}s")
+
+
+@cli.command()
+@click.option("--rows", default=200000, help="Rows in the generated Monzo export")
+@click.option("--rules", "rule_count", default=1000, help="Number of categorization rules")
+def categorize(rows, rule_count):
+    """Time extracting a Monzo export with the batch hook against per-row finalize()."""
+    importer = import_monzo.get_importer("Assets:Monzo:Cash", "GBP", {"rules": generate_rules(rule_count)})
+    fd, filepath = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        write_monzo_statement(filepath, rows)
+        # Warm the page cache so both paths read the file from memory
+        importer.extract(filepath, [])
+        per_row_elapsed, per_row = timed(csvbase.Importer.extract, importer, filepath, [])
+        elapsed, batch = timed(importer.extract, filepath, [])
+    finally:
+        os.remove(filepath)
+    assert batch == per_row, "extracted entries differ"
+    click.echo(
+        f"{rows} rows  batch {elapsed:.3f}s ({rows / elapsed:,.0f} rows/s)  "
+        f"per-row {per_row_elapsed:.3f}s ({rows / per_row_elapsed:,.0f} rows/s)"
+    )
+
+
+def use_columnar(importer, enabled):
+    """Switch an importer between the columnar parsing and the csvbase/CSVImporter one."""
+    if isinstance(importer, BatchImporter):
+        importer.columnar = enabled
+    elif isinstance(importer, StatementImporter):
+        importer.use_parser_hooks(enabled)
+
+
+@cli.command()
+@click.option("--rows", default=100000, help="Rows in each generated statement")
+@click.option("--formats", default=",".join(STATEMENT_WRITERS), help="Comma-separated bank formats")
+def parse(rows, formats):
+    """Time extracting each bank's statements with the columnar parsing and without."""
+    for name in formats.split(","):
+        try:
+            module = importlib.import_module(f"beancount_importers.import_{name}")
+        except ImportError as e:
+            click.echo(f"{name:<11} skipped, {e}")
+            continue
+        importer = module.get_importer(f"Assets:{name.title()}:Cash", "GBP", {})
+        fd, filepath = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+        try:
+            STATEMENT_WRITERS[name](filepath, rows)
+            use_columnar(importer, False)
+            legacy_elapsed, legacy = timed(importer.extract, filepath, [])
+            use_columnar(importer, True)
+            elapsed, entries = timed(importer.extract, filepath, [])
+        finally:
+            os.remove(filepath)
+        assert entries == legacy, f"{name} entries differ"
+        click.echo(
+            f"{name:<11} {rows} rows  columnar {elapsed:7.3f}s ({rows / elapsed:>9,.0f} rows/s)  "
+            f"row by row {legacy_elapsed:7.3f}s ({rows / legacy_elapsed:>9,.0f} rows/s)"
+        )
+
+
+# pull_monzo.py and the Monzo API stub of its tests sit next to the package in a checkout
+CHECKOUT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@cli.command()
+@click.option("--accounts", default=4, help="Accounts to download")
+@click.option("--transactions", default=300, help="Transactions per account")
+@click.option("--latency", default=0.05, help="Seconds the stub API takes to answer each request")
+@click.option("--concurrency", "concurrencies", default="1,4", help="Comma-separated --concurrency values")
+def monzo(accounts, transactions, latency, concurrencies):
+    """Time pull_monzo downloading from a local API stub at each --concurrency.
+
+    Needs a checkout (for src/pull_monzo.py and tests/monzo_stub.py) and the
+    Python version pull_monzo.py runs on.
+    """
+    sys.path[:0] = [os.path.join(CHECKOUT, "src"), os.path.join(CHECKOUT, "tests")]
+    try:
+        import pull_monzo
+        from monzo_stub import MonzoStub, make_transactions
+    except (ImportError, SyntaxError) as e:
+        raise click.ClickException(f"can't load pull_monzo and its API stub: {e}")
+
+    ids = [f"acc_{i}" for i in range(accounts)]
+    pull_monzo.ACCOUNTS = {account_id: f"benchmark_{account_id}" for account_id in ids}
+    cwd = os.getcwd()
+    with MonzoStub(latency) as stub, tempfile.TemporaryDirectory() as directory:
+        for account_id in ids:
+            pots = [dict(id=f"pot_{account_id}", name="Savings")]
+            stub.add_account(account_id, make_transactions(account_id, transactions), pots)
+        pull_monzo.API_ROOT = stub.url
+        # The token file and exports go to the temporary directory
+        os.chdir(directory)
+        try:
+            for concurrency in concurrencies.split(","):
+                out_dir = f"concurrency_{concurrency}"
+                for name in pull_monzo.ACCOUNTS.values():
+                    os.makedirs(os.path.join(out_dir, name))
+                pull_monzo.save_tokens(stub.access_token, stub.refresh_token)
+                stub.max_active = 0
+                sent = len(stub.requests)
+                args = ["--save", "--out-dir", out_dir, "--start-date", "2024-01-01"]
+                args += ["--concurrency", concurrency]
+                elapsed, _ = timed(partial(pull_monzo.download.main, args, standalone_mode=False))
+                click.echo(
+                    f"concurrency {concurrency:>3}  {elapsed:7.3f}s  "
+                    f"{len(stub.requests) - sent} requests, up to {stub.max_active} at once"
+                )
+        finally:
+            os.chdir(cwd)
+
+
+@cli.command()
+@click.option("--rows", default=10000, help="Rows in each statement")
+@click.option("--formats", default=",".join(STATEMENT_WRITERS), help="Comma-separated bank formats")
+@click.option("--output-dir", default="beancount_import_data", help="Statements go to <output-dir>/<format>/")
+@click.option("--seed", default=0, help="Same seed, same statements")
+def generate(rows, formats, output_dir, seed):
+    """Write synthetic statements for each bank format."""
+    for name in formats.split(","):
+        directory = os.path.join(output_dir, name)
+        os.makedirs(directory, exist_ok=True)
+        filepath = os.path.join(directory, f"synthetic_{name}_{rows}.csv")
+        STATEMENT_WRITERS[name](filepath, rows, seed)
+        click.echo(filepath)
+
+
+@cli.command()
+@click.option("--rows", default=100000, help="Rows in each generated statement")
+@click.option("--formats", default=",".join(STATEMENT_WRITERS), help="Comma-separated bank formats")
+@click.option("--output", type=click.Path(dir_okay=False), help="Write the results to this JSON file")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False), help="Earlier JSON results to compare with")
+def importers(rows, formats, output, baseline):
+    """Rows/s, peak RSS and time per stage of every importer on generated statements.
+
+    Each importer runs in a fresh interpreter so that its peak RSS is its own.
+    """
+    previous = {}
+    if baseline:
+        with open(baseline) as fd:
+            previous = {result["format"]: result for result in json.load(fd)["results"]}
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        for name in formats.split(","):
+            filepath = os.path.join(directory, f"{name}.csv")
+            STATEMENT_WRITERS[name](filepath, rows)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(benchmark_importer, name, filepath, rows).result()
+            results.append(result)
+
+            if "skipped" in result:
+                click.echo(f"{name:<11} skipped, {result['skipped']}")
+                continue
+            stages = "  ".join(f"{stage} {seconds:.3f}s" for stage, seconds in result["stages"].items())
+            line = (
+                f"{name:<11} {result['rows_per_sec']:>9,} rows/s  peak RSS {result['peak_rss_mb']:7.1f} MB  "
+                f"{stages}"
+            )
+            if name in previous and "rows_per_sec" in previous[name]:
+                change = result["rows_per_sec"] / previous[name]["rows_per_sec"] - 1
+                line += f"  ({change:+.1%} vs baseline)"
+            click.echo(line)
+
+    if output:
+        report = dict(
+            version=package_version(),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            date=datetime.datetime.now().isoformat(timespec="seconds"),
+            rows=rows,
+            results=results,
+        )
+        with open(output, "w") as fd:
+            json.dump(report, fd, indent=2)
+
+
+if __name__ == "__main__":
+    cli()
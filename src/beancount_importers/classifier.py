@@ -0,0 +1,162 @@
+from collections import defaultdict
+import math
+import re
+import zlib
+
+from beancount.core import data
+
+from beancount_importers.accounts import UNCATEGORIZED_ACCOUNT
+from beancount_importers.wrapped import WrappedImporter
+from beancount_importers import metrics
+from beancount_importers.ledger_index import LedgerIndex
+
+# Tokens are hashed into this many buckets, so the model stays small whatever
+# the ledger's vocabulary
+HASH_BITS = 20
+HASH_MASK = (1 << HASH_BITS) - 1
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+# Accounts on the bank side of a transaction
+SOURCE_ACCOUNT = re.compile(r"^(Assets|Liabilities):")
+
+
+def features(payee, narration, number):
+    tokens = ["p:" + token for token in TOKEN.findall((payee or "").lower())]
+    tokens.extend("n:" + token for token in TOKEN.findall((narration or "").lower()))
+    tokens.append("s:-" if number < 0 else "s:+")
+    # Order of magnitude of the amount, enough to tell a coffee from the rent
+    tokens.append(f"m:{len(str(abs(int(number))))}")
+    return [zlib.crc32(token.encode()) & HASH_MASK for token in tokens]
+
+
+def training_example(entry):
+    """(features, account) learnt from a categorized ledger transaction, or None."""
+    if not isinstance(entry, data.Transaction) or len(entry.postings) != 2:
+        return None
+    first, second = entry.postings
+    # Postings written by beancount-import carry the bank's original description
+    if second.meta and "source_desc" in second.meta:
+        first, second = second, first
+    elif not (first.meta and "source_desc" in first.meta):
+        if not SOURCE_ACCOUNT.match(first.account):
+            first, second = second, first
+        if not SOURCE_ACCOUNT.match(first.account) or SOURCE_ACCOUNT.match(second.account):
+            return None
+    if first.units is None or UNCATEGORIZED_ACCOUNT.search(second.account):
+        return None
+    narration = (first.meta or {}).get("source_desc", entry.narration)
+    return features(entry.payee, narration, first.units.number), second.account
+
+
+class PayeeClassifier(LedgerIndex):
+    """Naive Bayes over hashed payee, narration and amount tokens, trained on the ledger.
+
+    Each ledger file keeps its own counts, so accepting new transactions only
+    retrains on the output file they were written to.
+    """
+
+    format = 1
+
+    def __init__(self, filenames, index_file=None, min_confidence=0.8):
+        super().__init__(filenames, index_file)
+        self.min_confidence = min_confidence
+        self.class_counts = {}
+        self.feature_counts = {}
+        self.log_priors = {}
+        self.log_norms = {}
+        self.predictions = {}
+
+    def scan_entries(self, entries):
+        counts = defaultdict(lambda: defaultdict(int))
+        examples = defaultdict(int)
+        for entry in entries:
+            example = training_example(entry)
+            if example is None:
+                continue
+            tokens, account = example
+            examples[account] += 1
+            for token in tokens:
+                counts[account][token] += 1
+        # JSON keys are strings, tokens are turned back into ints in rebuild()
+        return dict(
+            examples=examples,
+            counts={account: {str(t): n for t, n in c.items()} for account, c in counts.items()},
+        )
+
+    def rebuild(self):
+        class_counts = defaultdict(int)
+        token_totals = defaultdict(int)
+        feature_counts = defaultdict(lambda: defaultdict(int))
+        for scanned in self.files.values():
+            for account, count in scanned["data"]["examples"].items():
+                class_counts[account] += count
+            for account, counts in scanned["data"]["counts"].items():
+                for token, count in counts.items():
+                    feature_counts[int(token)][account] += count
+                    token_totals[account] += count
+
+        vocabulary = len(feature_counts) + 1
+        examples = sum(class_counts.values())
+        self.class_counts = dict(class_counts)
+        self.feature_counts = {token: dict(counts) for token, counts in feature_counts.items()}
+        self.log_priors = {account: math.log(count / examples) for account, count in class_counts.items()}
+        # Laplace smoothing, log of the denominator every token of a class shares
+        self.log_norms = {account: math.log(token_totals[account] + vocabulary) for account in class_counts}
+        self.predictions = {}
+
+    def predict(self, payee, narration, number):
+        """(account, confidence) of the most likely account, or (None, 0) with no training data."""
+        tokens = features(payee, narration, number)
+        key = tuple(tokens)
+        if key in self.predictions:
+            return self.predictions[key]
+        if not self.log_priors:
+            return None, 0.0
+
+        # Only classes that saw a token get more than the smoothed count for it,
+        # so start from every class missing all tokens and add the seen ones
+        scores = {
+            account: prior - len(tokens) * self.log_norms[account]
+            for account, prior in self.log_priors.items()
+        }
+        for token in tokens:
+            for account, count in self.feature_counts.get(token, {}).items():
+                scores[account] += math.log(count + 1)
+
+        best = max(scores, key=scores.get)
+        if not any(best in self.feature_counts.get(token, ()) for token in tokens[:-2]):
+            # Nothing but the amount points at it, e.g. a payee never seen before
+            self.predictions[key] = None, 0.0
+        else:
+            total = sum(math.exp(score - scores[best]) for score in scores.values())
+            self.predictions[key] = best, 1.0 / total
+        return self.predictions[key]
+
+    def classify(self, entries):
+        """Give uncategorized transactions the predicted account when confident enough."""
+        for i, entry in enumerate(entries):
+            if not isinstance(entry, data.Transaction) or "skip_transaction" in entry.meta:
+                continue
+            if len(entry.postings) != 2 or not UNCATEGORIZED_ACCOUNT.search(entry.postings[1].account):
+                continue
+            source = entry.postings[0]
+            account, confidence = self.predict(entry.payee, entry.narration, source.units.number)
+            if account is None or confidence < self.min_confidence:
+                continue
+            entries[i] = entry._replace(postings=[source, entry.postings[1]._replace(account=account)])
+        return entries
+
+
+class ClassifiedImporter(WrappedImporter):
+    """Runs the classifier over every extracted statement, outside of the extract cache."""
+
+    def __init__(self, importer, classifier):
+        super().__init__(importer)
+        self.classifier = classifier
+
+    def extract(self, filepath, existing):
+        entries = self.importer.extract(filepath, existing)
+        self.classifier.refresh()
+        with metrics.stage("classify"):
+            return self.classifier.classify(list(entries))
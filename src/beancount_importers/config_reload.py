@@ -0,0 +1,153 @@
+import os
+import sys
+import traceback
+
+import watchdog.observers
+import yaml
+
+from beancount_importers import metrics
+from beancount_importers.beancount_import_run import source_params
+from beancount_importers.watch import ReloadOnChange
+
+
+def read_config(filename):
+    with open(filename, "r") as config_file:
+        return yaml.safe_load(config_file)
+
+
+def source_specs(parsed_config):
+    """What each source of a parsed importers config is built from, by key."""
+    shared_rules = parsed_config.get("rules") or []
+    return {
+        key: dict(
+            importer=params["importer"],
+            account=params.get("account"),
+            currency=params.get("currency"),
+            params=source_params(params, shared_rules),
+        )
+        for key, params in parsed_config["importers"].items()
+    }
+
+
+class ConfigWatcher(ReloadOnChange):
+    """Rebuilds the sources whose entry of the importers config file changed.
+
+    The new and old importers sections are compared source by source, with
+    the shared rules folded into the params of the sources using them. Only
+    changed and added sources get new importers, and beancount-import gets
+    them along with the sources it already has for the rest. The extract
+    cache is keyed by the importer params, so only the rebuilt sources'
+    statements are extracted again. update_output, given the new data
+    sources, returns the output options to write their entries with.
+    """
+
+    def __init__(
+        self,
+        application,
+        filename,
+        specs,
+        build_source,
+        remove_source,
+        update_output=None,
+    ):
+        super().__init__(application)
+        self.filename = os.path.realpath(filename)
+        self.specs = specs
+        self.build_source = build_source
+        self.remove_source = remove_source
+        self.update_output = update_output
+
+    def watches(self, event):
+        # Editors often save by renaming a new file over the old one
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        return any(path and os.path.realpath(path) == self.filename for path in paths)
+
+    def reload(self):
+        from beancount_import import reconcile
+
+        try:
+            parsed_config = read_config(self.filename)
+            specs = source_specs(parsed_config)
+        except (OSError, yaml.YAMLError, AttributeError, KeyError, TypeError) as e:
+            # Most likely saved half way through an edit, keep the current sources
+            print(f"Not reloading {self.filename}: {e}", file=sys.stderr)
+            return
+        if specs == self.specs:
+            return
+
+        reconciler = self.application.reconciler
+        loaded = reconciler.loaded_future.result()
+        current = {
+            os.path.basename(data_source["directory"]): (data_source, source)
+            for data_source, source in zip(reconciler.options["data_sources"], loaded.sources)
+        }
+        shared_rules = parsed_config.get("rules") or []
+        data_sources = []
+        sources = []
+        rebuilt = []
+        try:
+            for key, params in parsed_config["importers"].items():
+                if key in current and self.specs.get(key) == specs[key]:
+                    data_source, source = current[key]
+                else:
+                    data_source = self.build_source(key, params, shared_rules)
+                    source = reconcile.load_source(data_source, log_status=reconciler.log_status)
+                    rebuilt.append(data_source)
+                data_sources.append(data_source)
+                sources.append(source)
+        except Exception:
+            traceback.print_exc()
+            print(f"Not reloading {self.filename}", file=sys.stderr)
+            return
+        for key in current.keys() - specs.keys():
+            self.remove_source(current[key][0])
+        # With --watch, statements dropped into a new source's directory are
+        # picked up too
+        statement_watcher = getattr(self.application, "statement_watcher", None)
+        if statement_watcher is not None:
+            for data_source in rebuilt:
+                statement_watcher.watch(data_source["directory"])
+        if self.update_output is not None:
+            # New source accounts get their own output shards with --shard_by_source
+            options = reconciler.options
+            options.update(self.update_output(data_sources))
+            reconciler.entry_file_selector = reconcile.EntryFileSelector.from_args(options)
+
+        names = [os.path.basename(data_source["directory"]) for data_source in rebuilt]
+        print(
+            f"Reloaded {self.filename}, rebuilt sources: {', '.join(names) or 'none'}",
+            file=sys.stderr,
+        )
+        metrics.count("config_reloads")
+        metrics.count("sources_rebuilt", len(rebuilt))
+        self.specs = specs
+        reconciler.options["data_sources"] = data_sources
+        reconciler.loaded_future = reconcile.call_in_new_thread(
+            reconcile.LoadedReconciler,
+            reconciler=reconciler,
+            classifier=loaded.classifier,
+            sources=sources,
+        )
+        self.application.reset()
+
+    def start(self):
+        observer = watchdog.observers.Observer()
+        observer.schedule(self, os.path.dirname(self.filename))
+        observer.daemon = True
+        observer.start()
+
+
+def install(filename, build_source, remove_source, update_output=None):
+    """Make beancount-import's web server follow changes to the importers config file."""
+    from beancount_import import webserver
+
+    specs = source_specs(read_config(filename))
+    init = webserver.Application.__init__
+
+    def __init__(application, *args, **kwargs):
+        init(application, *args, **kwargs)
+        ConfigWatcher(
+            application, filename, specs, build_source, remove_source, update_output
+        ).start()
+
+    webserver.Application.__init__ = __init__
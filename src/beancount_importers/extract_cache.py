@@ -0,0 +1,153 @@
+from collections import defaultdict
+import hashlib
+import json
+import os
+import pickle
+
+from beancount.core import data
+
+import beancount_importers
+from beancount_importers import bank_classifier, batch_categorize, columnar, metrics, rules
+from beancount_importers.wrapped import WrappedImporter
+
+# Bump when the layout of the cached files changes
+CACHE_FORMAT = 1
+
+# Modules shared by the importers that decide what gets extracted, hashed into
+# the cache key along with the importer's own module. The package version
+# doesn't change in a development checkout, so it's not enough on its own.
+EXTRACTING_MODULES = (bank_classifier, batch_categorize, columnar, rules)
+
+# cache_dir -> names of the cache files this process read or wrote
+USED = defaultdict(set)
+
+
+def file_digest(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprint(*modules) -> str:
+    """Hash the source of the modules that decide how rows get categorized."""
+    digest = hashlib.sha256()
+    for module in modules:
+        with open(module.__file__, "rb") as fh:
+            digest.update(fh.read())
+    return digest.hexdigest()
+
+
+class CachedImporter(WrappedImporter):
+    """Wraps an importer and keeps its extracted entries on disk.
+
+    Entries are pickled under a key made of the file content, the importer
+    type, account, currency and params, the package version and the source of
+    the parsing and categorizing modules, so editing any of those invalidates
+    the cache.
+    """
+
+    def __init__(self, importer, cache_dir, type, account, currency, importer_params, modules=(), imported=None):
+        super().__init__(importer)
+        self.cache_dir = cache_dir
+        # Cached entries must not depend on the ledger, so transactions already
+        # imported are dropped after loading them rather than by the importer
+        self.imported = imported
+        self.key = json.dumps(
+            dict(
+                format=CACHE_FORMAT,
+                type=type,
+                account=account,
+                currency=currency,
+                params=importer_params,
+                version=beancount_importers.__version__,
+                source=source_fingerprint(*EXTRACTING_MODULES, *modules),
+            ),
+            sort_keys=True,
+            default=str,
+        )
+
+    def cache_path(self, filepath):
+        digest = hashlib.sha256(self.key.encode())
+        # Entries carry the file name in their metadata, so it is part of the key too
+        digest.update(os.path.abspath(filepath).encode())
+        digest.update(file_digest(filepath).encode())
+        return os.path.join(self.cache_dir, digest.hexdigest() + ".pickle")
+
+    def extract(self, filepath, existing):
+        entries = self.extract_cached(filepath, existing)
+        if self.imported is not None:
+            self.imported.refresh()
+            entries = [
+                entry
+                for entry in entries
+                if not (isinstance(entry, data.Transaction) and self.imported.already_imported(entry))
+            ]
+        return entries
+
+    def extract_cached(self, filepath, existing):
+        with metrics.stage("cache_load"):
+            cache_path = self.cache_path(filepath)
+            try:
+                with open(cache_path, "rb") as fh:
+                    entries = pickle.load(fh)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                # Missing or unreadable cache file, extract again and (over)write it
+                entries = None
+        USED[self.cache_dir].add(os.path.basename(cache_path))
+        if entries is not None:
+            metrics.count("cache_hits")
+            return entries
+        metrics.count("cache_misses")
+
+        entries = self.importer.extract(filepath, existing)
+
+        with metrics.stage("cache_store"):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as fh:
+                pickle.dump(entries, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        return entries
+
+
+def prune(cache_dir):
+    """Forget the entries of statements this process did not extract.
+
+    Those are statements since changed or deleted, or extracted with other
+    importer settings or code, which would otherwise be kept forever.
+    """
+    used = USED[cache_dir]
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+    for name in names:
+        if name.endswith(".pickle") and name not in used:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+
+def install(cache_dir):
+    """Make beancount-import prune the extract cache once its first load is done.
+
+    Loading creates every source, which extracts every statement, so by then
+    all the entries still needed have been used. Nothing is pruned if the
+    load fails.
+    """
+    from beancount_import import webserver
+
+    init = webserver.Application.__init__
+
+    def prune_loaded(future):
+        if future.exception() is None:
+            prune(cache_dir)
+
+    def __init__(application, *args, **kwargs):
+        init(application, *args, **kwargs)
+        application.reconciler.loaded_future.add_done_callback(prune_loaded)
+
+    webserver.Application.__init__ = __init__
@@ -0,0 +1,78 @@
+import codecs
+import csv
+from glob import glob
+import os
+from typing import Optional
+
+# Enough to hold the preamble and header row of every supported statement
+HEAD_SIZE = 8192
+
+# Statement format -> (index of the header line, columns the importer needs).
+# Formats are checked in order and the first match wins, so every file is
+# routed to a single importer type.
+FINGERPRINTS = {
+    "monzo": (
+        0,
+        {"Transaction ID", "Date", "Name", "Description", "Amount", "Currency", "Category"},
+    ),
+    "wise": (
+        0,
+        {"TransferWise ID", "Date", "Amount", "Currency", "Description", "Merchant", "Running Balance"},
+    ),
+    "revolut": (0, {"Started Date", "Description", "Amount", "Currency", "Balance"}),
+    # Nationwide statements start with account name and balances, then a blank line
+    "nationwide": (
+        4,
+        {"Date", "Transaction type", "Description", "Paid out", "Paid in", "Balance"},
+    ),
+}
+
+# (absolute path, mtime, size) -> detected format
+_verdicts = {}
+
+
+def sniff_format(filepath: str) -> Optional[str]:
+    with open(filepath, "rb") as fh:
+        head = fh.read(HEAD_SIZE)
+    if head.startswith(codecs.BOM_UTF8):
+        head = head[len(codecs.BOM_UTF8):]
+    # Header names are plain ASCII, latin-1 decodes any statement encoding safely
+    lines = head.decode("latin-1").splitlines()
+    last_line = max(line for line, _ in FINGERPRINTS.values())
+    try:
+        rows = list(csv.reader(lines[: last_line + 1]))
+    except csv.Error:
+        return None
+    for name, (line, columns) in FINGERPRINTS.items():
+        if len(rows) > line and columns <= {column.strip() for column in rows[line]}:
+            return name
+    return None
+
+
+def detect_format(filepath: str) -> Optional[str]:
+    """Return the statement format of a file, or None if no importer handles it.
+
+    Only the first few KB of the file are read, and the verdict is remembered
+    until the file's mtime or size changes, so the importers of a directory
+    scan share a single read per file.
+    """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    key = (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+    if key not in _verdicts:
+        try:
+            _verdicts[key] = sniff_format(filepath)
+        except OSError:
+            return None
+    return _verdicts[key]
+
+
+def source_files(directory):
+    # Same lookup as beancount-import's importer source
+    return sorted(
+        os.path.abspath(f)
+        for f in glob(os.path.join(directory, "**", "*"), recursive=True)
+        if os.path.isfile(f)
+    )
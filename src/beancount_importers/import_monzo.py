@@ -2,8 +2,12 @@ from beancount.core import data
 
 import beangulp
 from beancount_importers.bank_classifier import payee_to_account_mapping
+from beancount_importers.batch_categorize import BatchImporter, statement_tags
+from beancount_importers.identify import detect_format
+from beancount_importers.imported_index import posting_key
+from beancount_importers.rules import RuleSet
 
-from beangulp.importers.csvbase import Date, Amount, Column, Importer
+from beangulp.importers.csvbase import Date, Amount, Column
 
 CATEGORY_TO_ACCOUNT_MAPPING = {
     "Eating out": "Expenses:EatingOut",
@@ -23,9 +27,12 @@ TRANSACTIONS_CLASSIFIED_BY_ID = {}
 
 UNCATEGORIZED_EXPENSES_ACCOUNT = "Expenses:FIXME"
 
+SAVINGS_POT_PAYEES = {"Savings Pot", "Savings Monzo Pot"}
+SAVINGS_POT_ACCOUNT = "Assets:Monzo:Personal:Savings"
 
-def get_importer(account, currency, importer_params):
-    class MonzoImporter(Importer):
+
+def get_importer(account, currency, importer_params, imported=None):
+    class MonzoImporter(BatchImporter):
         date = Date("Date", frmt="%d/%m/%Y")
         narration = Column("Description")
         payee = Column("Name")
@@ -35,12 +42,21 @@ def get_importer(account, currency, importer_params):
         link = Column("Transaction ID")
         
         names = True
+        describe_source = True
 
         params = importer_params if importer_params is not None else {}
+        rules = RuleSet(params.get("rules", []))
         my_account = account
+        # ImportedIndex of the ledger, rows it already holds are dropped uncategorized
+        imported = None
       
         def identify(self, filepath: str) -> bool:
-            return filepath.endswith("csv") 
+            return detect_format(filepath) == "monzo"
+
+        def extract(self, filepath, existing):
+            if self.imported is not None:
+                self.imported.refresh()
+            return super().extract(filepath, existing)
 
         def categorize(self, params, txn, row):
             payee = txn.payee
@@ -55,7 +71,13 @@ def get_importer(account, currency, importer_params):
                 txn = txn._replace(tags=txn.tags.union(frozenset(tags)))
                 
             posting_account = None
-            if txn.postings[0].units.number <= 0:
+            if self.rules:
+                posting_account = self.rules.match(
+                    payee, description, txn.postings[0].units.number, getattr(row, "link", None)
+                )
+            if posting_account:
+                pass
+            elif txn.postings[0].units.number <= 0:
                 # Expenses
                 posting_account = payee_to_account_mapping.get(payee)
 
@@ -67,8 +89,8 @@ def get_importer(account, currency, importer_params):
                         )
             else:
                 if not params.get("ignore_bank_categories"):
-                    if payee == "Savings Pot" or payee == "Savings Monzo Pot":
-                        posting_account = "Assets:Monzo:Personal:Savings"
+                    if payee in SAVINGS_POT_PAYEES:
+                        posting_account = SAVINGS_POT_ACCOUNT
     
             if not posting_account:
                 posting_account = UNCATEGORIZED_EXPENSES_ACCOUNT
@@ -84,9 +106,52 @@ def get_importer(account, currency, importer_params):
             # Don't need the active card checks 
             if txn.postings[0].units.number == 0:
                 return None
+            if self.imported is not None and self.imported.already_imported(txn):
+                return None
             return self.categorize(self.params, txn, row)
+
+        def categorize_batch(self, columns):
+            # Same decisions as finalize() and categorize(), one column at a time
+            payees = columns["payee"]
+            narrations = columns["narration"]
+            amounts = columns["amount"]
+            links = columns["link"]
+
+            keep = [number != 0 for number in amounts]
+            if self.imported is not None and self.imported.ids:
+                changed = self.imported.changed
+                for i, (date, number, currency, link) in enumerate(
+                    zip(columns["date"], amounts, columns["currency"], links)
+                ):
+                    if keep[i] and link:
+                        key = posting_key(self.my_account, date, data.Amount(number, currency), narrations[i])
+                        keep[i] = not changed((link,), key)
+
+            rule_accounts = self.rules.match_batch(payees, narrations, amounts, links)
+
+            use_categories = not self.params.get("ignore_bank_categories")
+            accounts = []
+            for payee, number, category, rule_account, kept in zip(
+                payees, amounts, columns["category"], rule_accounts, keep
+            ):
+                if not kept:
+                    accounts.append(None)
+                    continue
+                account = rule_account
+                if account:
+                    pass
+                elif number <= 0:
+                    account = payee_to_account_mapping.get(payee)
+                    if not account and use_categories:
+                        account = CATEGORY_TO_ACCOUNT_MAPPING.get(category)
+                elif use_categories and payee in SAVINGS_POT_PAYEES:
+                    account = SAVINGS_POT_ACCOUNT
+                accounts.append(account or UNCATEGORIZED_EXPENSES_ACCOUNT)
+            return accounts, statement_tags(narrations)
     
-    return MonzoImporter(account=account, currency=currency)
+    importer = MonzoImporter(account=account, currency=currency)
+    importer.imported = imported
+    return importer
 
 if __name__ == "__main__":
     ingest = beangulp.Ingest([get_importer("Assets:Monzo:Cash", "GBP", {})], [])
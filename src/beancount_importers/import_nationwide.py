@@ -4,8 +4,11 @@ import dateutil
 from beancount.core import data
 
 import beangulp
-from beancount_importers.bank_classifier import payee_to_account_mapping
-from beangulp.importers.csvbase import Date, Amount, CreditOrDebit, CSVReader, Column, Importer
+from beancount_importers.bank_classifier import PrefixMatcher, payee_to_account_mapping
+from beancount_importers.batch_categorize import RECURRING, BatchImporter, recurring_flags
+from beancount_importers.identify import detect_format
+from beancount_importers.rules import RuleSet
+from beangulp.importers.csvbase import Date, Amount, CreditOrDebit, CSVReader, Column, EMPTY
 
 TRANSACTIONS_CLASSIFIED_BY_PAYEE = {
     "ATM Withdrawal": "Assets:Physical:Cash",
@@ -16,7 +19,7 @@ UNCATEGORIZED_EXPENSES_ACCOUNT = "Expenses:FIXME"
 
 
 def get_importer(account, currency, importer_params = None):
-    class NationwideReader(Importer):
+    class NationwideReader(BatchImporter):
         date = Date(0, frmt="%d %b %Y")
         tx_type = Column(1)
         narration = Column(2)
@@ -27,12 +30,16 @@ def get_importer(account, currency, importer_params = None):
         encoding = "iso-8859-1"
         header = 4
         names = True
+        # Not checked against a beangulp with CreditOrDebit yet, parse row by row
+        columnar = False
         
         params = importer_params if importer_params is not None else {}
+        payee_rules = PrefixMatcher(TRANSACTIONS_CLASSIFIED_BY_PAYEE | params.get('by_payee', {}))
+        rules = RuleSet(params.get('rules', []))
         my_account = account
         
         def identify(self, filepath: str) -> bool:
-            return filepath.endswith("csv") 
+            return detect_format(filepath) == "nationwide"
             
         def categorize(self, params, txn, row):
             payee = txn.payee
@@ -42,13 +49,14 @@ def get_importer(account, currency, importer_params = None):
                 txn = txn._replace(tags=txn.tags.union(frozenset(['recurring'])))
                 
             posting_account = UNCATEGORIZED_EXPENSES_ACCOUNT
-            if description.startswith("Interest added"):
+            rule_account = self.rules.match(payee, description, txn.postings[0].units.number) if self.rules else None
+            if rule_account:
+                posting_account = rule_account
+            elif description.startswith("Interest added"):
                 accounts_parts = self.my_account.split(':')
                 posting_account = 'Income:Uncategorized:' + ':'.join(accounts_parts[1:])
             else: 
-                for mapped_payee, acct in (TRANSACTIONS_CLASSIFIED_BY_PAYEE | self.params.get('by_payee', {})).items():
-                    if payee.startswith(mapped_payee):
-                        posting_account = acct
+                posting_account = self.payee_rules.match(payee, UNCATEGORIZED_EXPENSES_ACCOUNT)
 
             txn.postings.append(
                 data.Posting(posting_account, -txn.postings[0].units, None, None, None, None)
@@ -59,6 +67,24 @@ def get_importer(account, currency, importer_params = None):
             
         def finalize(self, txn, row):
             return self.categorize(self.params, txn, row)
+
+        def categorize_batch(self, columns):
+            # Same decisions as categorize(), one column at a time
+            payees = columns["payee"]
+            narrations = columns["narration"]
+            rule_accounts = self.rules.match_batch(payees, narrations, columns["amount"])
+
+            interest_account = 'Income:Uncategorized:' + ':'.join(self.my_account.split(':')[1:])
+            accounts = []
+            for payee, narration, rule_account in zip(payees, narrations, rule_accounts):
+                if rule_account:
+                    accounts.append(rule_account)
+                elif narration.startswith("Interest added"):
+                    accounts.append(interest_account)
+                else:
+                    accounts.append(self.payee_rules.match(payee, UNCATEGORIZED_EXPENSES_ACCOUNT))
+            tags = [RECURRING if recurring else EMPTY for recurring in recurring_flags(narrations)]
+            return accounts, tags
         
     return NationwideReader(account=account, currency=currency)
 
@@ -1,7 +1,10 @@
 from beancount.core import data
 
 import beangulp
-from beancount_importers.bank_classifier import payee_to_account_mapping
+from beancount_importers.bank_classifier import filter_currencies, payee_to_account_mapping
+from beancount_importers.columnar import StatementImporter
+from beancount_importers.identify import detect_format
+from beancount_importers.rules import RuleSet
 from beangulp.importers import csv
 
 Col = csv.Col
@@ -10,14 +13,18 @@ Col = csv.Col
 UNCATEGORIZED_EXPENSES_ACCOUNT = "Expenses:FIXME"
 
 
-def categorizer(txn, row):
+def categorizer(txn, row, rules=None):
     payee = row[4]
     comment = row[4]
     if comment.startswith("To "):
         payee = comment[3:]
 
     posting_account = None
-    if txn.postings[0].units.number < 0:
+    if rules:
+        posting_account = rules.match(payee, comment, txn.postings[0].units.number)
+    if posting_account:
+        pass
+    elif txn.postings[0].units.number < 0:
         # Expenses
         posting_account = payee_to_account_mapping.get(payee)
 
@@ -32,9 +39,9 @@ def categorizer(txn, row):
         elif "Referral reward" in comment:
             posting_account = "Income:Revolut:Referrals"
         else:
+            # Top-ups from our other accounts are paired with the outgoing leg by
+            # the transfer matcher
             posting_account = "Income:Uncategorized:Revolut"
-            # Ignore most incoming transactions as they will mostly duplicate Monzo's
-            txn.meta["skip_transaction"] = True
 
     txn.postings.append(
         data.Posting(posting_account, -txn.postings[0].units, None, None, None, None)
@@ -43,8 +50,28 @@ def categorizer(txn, row):
     return txn
 
 
-def get_importer(account, currency):
-    return csv.CSVImporter(
+class RevolutImporter(StatementImporter):
+    def __init__(self, *args, currencies=None, rules=(), **kwargs):
+        super().__init__(*args, categorizer=self.categorize, **kwargs)
+        self.currencies = currencies
+        self.rules = RuleSet(rules)
+
+    def categorize(self, txn, row):
+        return categorizer(txn, row, self.rules)
+
+    def identify(self, filepath):
+        return detect_format(filepath) == "revolut"
+
+    def extract(self, filepath, existing=None):
+        # Statements with every balance are parsed once for all held currencies
+        entries = super().extract(filepath, existing)
+        if self.currencies:
+            entries = filter_currencies(entries, self.currencies)
+        return entries
+
+
+def get_importer(account, currency, importer_params=None):
+    return RevolutImporter(
         {
             Col.DATE: "Started Date",
             Col.NARRATION: "Description",
@@ -55,7 +82,8 @@ def get_importer(account, currency):
         },
         account,
         currency,
-        categorizer=categorizer,
+        currencies=(importer_params or {}).get("currencies"),
+        rules=(importer_params or {}).get("rules", []),
     )
 
 
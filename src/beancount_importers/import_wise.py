@@ -2,7 +2,10 @@ import dateutil
 from beancount.core import data
 
 import beangulp
-from beancount_importers.bank_classifier import payee_to_account_mapping
+from beancount_importers.bank_classifier import filter_currencies, payee_to_account_mapping
+from beancount_importers.columnar import StatementImporter
+from beancount_importers.identify import detect_format
+from beancount_importers.rules import RuleSet
 from beangulp.importers import csv
 
 Col = csv.Col
@@ -17,7 +20,7 @@ TRANSACTIONS_CLASSIFIED_BY_ID = {
 UNCATEGORIZED_EXPENSES_ACCOUNT = "Expenses:FIXME"
 
 
-def categorizer(txn, row):
+def categorizer(txn, row, rules=None):
     transaction_id = row[0]
     payee = row[13]
     comment = row[4]
@@ -26,7 +29,11 @@ def categorizer(txn, row):
         payee = comment[14:]
 
     posting_account = None
-    if txn.postings[0].units.number < 0:
+    if rules:
+        posting_account = rules.match(payee, comment, txn.postings[0].units.number, transaction_id)
+    if posting_account:
+        pass
+    elif txn.postings[0].units.number < 0:
         # Expenses
         posting_account = payee_to_account_mapping.get(payee)
 
@@ -76,8 +83,36 @@ def categorizer(txn, row):
     return txn
 
 
-def get_importer(account, currency):
-    return csv.CSVImporter(
+class WiseImporter(StatementImporter):
+    def __init__(self, *args, currencies=None, imported=None, rules=(), **kwargs):
+        super().__init__(*args, categorizer=self.categorize, **kwargs)
+        self.currencies = currencies
+        self.rules = RuleSet(rules)
+        # ImportedIndex of the ledger, rows it already holds are dropped uncategorized
+        self.imported = imported
+
+    def categorize(self, txn, row):
+        if self.imported is not None and self.imported.already_imported(txn):
+            txn.meta["already_imported"] = True
+            return txn
+        return categorizer(txn, row, self.rules)
+
+    def identify(self, filepath):
+        return detect_format(filepath) == "wise"
+
+    def extract(self, filepath, existing=None):
+        if self.imported is not None:
+            self.imported.refresh()
+        # Statements with every balance are parsed once for all held currencies
+        entries = super().extract(filepath, existing)
+        entries = [entry for entry in entries if not entry.meta.get("already_imported")]
+        if self.currencies:
+            entries = filter_currencies(entries, self.currencies)
+        return entries
+
+
+def get_importer(account, currency, importer_params=None, imported=None):
+    return WiseImporter(
         {
             Col.DATE: "Date",
             Col.NARRATION: "Description",
@@ -89,7 +124,9 @@ def get_importer(account, currency):
         },
         account,
         currency,
-        categorizer=categorizer,
+        currencies=(importer_params or {}).get("currencies"),
+        imported=imported,
+        rules=(importer_params or {}).get("rules", []),
         dateutil_kwds={"parserinfo": dateutil.parser.parserinfo(dayfirst=True)},
     )
 
@@ -0,0 +1,61 @@
+from beancount.core import data
+
+from beancount_importers.ledger_index import LedgerIndex
+
+
+def posting_key(account, date, units, description):
+    # Same fields beancount-import matches imported rows against journal postings with
+    return (account, date.isoformat(), str(units.number.normalize()), units.currency, description)
+
+
+def entry_key(txn):
+    posting = txn.postings[0]
+    return posting_key(posting.account, txn.date, posting.units, txn.narration)
+
+
+class ImportedIndex(LedgerIndex):
+    """Links (Monzo transaction ids, Wise reference ids) of the transactions already in the ledger."""
+
+    format = 2
+
+    def __init__(self, filenames, index_file=None):
+        super().__init__(filenames, index_file)
+        self.ids = {}
+
+    def scan_entries(self, entries):
+        ids = {}
+        for entry in entries:
+            if not isinstance(entry, data.Transaction) or not entry.links:
+                continue
+            keys = [
+                posting_key(posting.account, posting.meta.get("date", entry.date), posting.units, posting.meta["source_desc"])
+                for posting in entry.postings
+                if posting.meta and "source_desc" in posting.meta and posting.units is not None
+            ]
+            for link in entry.links:
+                ids.setdefault(link, []).extend(keys)
+        return ids
+
+    def rebuild(self):
+        self.ids = {}
+        for scanned in self.files.values():
+            for link, keys in scanned["data"].items():
+                self.ids.setdefault(link, set()).update(tuple(key) for key in keys)
+
+    def already_imported(self, txn):
+        """Whether txn is a transaction of the ledger that reappeared in a different shape.
+
+        Rows that still match the imported posting are kept, beancount-import pairs
+        them with the journal itself and would report the posting as an invalid
+        reference without them. Only re-downloaded rows whose date, amount or
+        description changed are dropped, those would otherwise show up again as new.
+        """
+        return self.changed(txn.links, entry_key(txn))
+
+    def changed(self, links, key):
+        """Whether a row with these links and posting_key() was imported in another shape."""
+        for link in links:
+            keys = self.ids.get(link)
+            if keys is not None:
+                return key not in keys
+        return False
@@ -0,0 +1,174 @@
+from contextlib import contextmanager
+import glob
+import hashlib
+import os
+import pickle
+import threading
+
+import beancount
+from beancount.parser import parser
+
+from beancount_importers import metrics
+
+# Bump when what is pickled changes
+FORMAT = 1
+
+
+def file_key(filename, encoding=None):
+    """Hash of a ledger file's name and contents, what its parse only depends on."""
+    digest = hashlib.sha256(f"{FORMAT}\0{beancount.__version__}\0{filename}\0{encoding}\0".encode())
+    with open(filename, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_pickle(filename, value):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp_path = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as fh:
+        pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, filename)
+
+
+def read_pickle(filename):
+    try:
+        with open(filename, "rb") as fh:
+            return pickle.load(fh)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+
+class LedgerCache:
+    """Caches beancount-import's load of the journal between runs.
+
+    The whole load (parsed, booked and validated entries) is kept as a snapshot
+    along with the mtime, size and hash of every file it read and the files
+    each include glob matched. If none of that changed, starting up only
+    unpickles the snapshot: a touched but unchanged file is recognised by its
+    hash. Otherwise the journal is loaded again, but every file is parsed from
+    a per-file cache keyed by its hash, so only the files that changed, usually
+    just the import output, are parsed again. Booking, plugins and validation
+    still run over the whole ledger then.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        # filename -> [mtime_ns, size, key] of the files read by the last load
+        self.files = {}
+        # Include glob -> the files it matched in the last load
+        self.globs = {}
+
+    def snapshot_file(self, filename, encoding):
+        name = hashlib.sha256(f"{filename}\0{encoding}".encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"snapshot-{name}.pickle")
+
+    def parsed_file(self, key):
+        return os.path.join(self.cache_dir, "files", f"{key}.pickle")
+
+    def current_key(self, filename, known, encoding):
+        """file_key() of filename, without reading it if its mtime and size are as known."""
+        stat = os.stat(filename)
+        if known is not None and (known[0], known[1]) == (stat.st_mtime_ns, stat.st_size):
+            return [stat.st_mtime_ns, stat.st_size, known[2]]
+        return [stat.st_mtime_ns, stat.st_size, file_key(filename, encoding)]
+
+    def fresh(self, snapshot):
+        for pattern, matches in snapshot["globs"].items():
+            if sorted(glob.glob(pattern, recursive=True)) != matches:
+                return False
+        for filename, known in snapshot["files"].items():
+            try:
+                if self.current_key(filename, known, snapshot["encoding"])[2] != known[2]:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def parse_file(self, original, file, *args, encoding=None, **kwargs):
+        # Only plain loads of a file are cached, like the loader does them
+        if args or kwargs or not isinstance(file, str):
+            return original(file, *args, encoding=encoding, **kwargs)
+        self.files[file] = self.current_key(file, None, encoding)
+        key = self.files[file][2]
+        cached = read_pickle(self.parsed_file(key))
+        if cached is None:
+            cached = original(file, encoding=encoding)
+            write_pickle(self.parsed_file(key), cached)
+            metrics.count("journal_files_parsed")
+        else:
+            metrics.count("journal_files_cached")
+        cwd = os.path.dirname(file)
+        for include in cached[2]["include"]:
+            pattern = include if os.path.isabs(include) else os.path.join(cwd, include)
+            self.globs[pattern] = sorted(glob.glob(pattern, recursive=True))
+        return cached
+
+    @contextmanager
+    def parsing(self):
+        """Parse ledger files through the per-file cache inside."""
+        original = parser.parse_file
+
+        def parse_file(file, *args, **kwargs):
+            return self.parse_file(original, file, *args, **kwargs)
+
+        parser.parse_file = parse_file
+        try:
+            yield
+        finally:
+            parser.parse_file = original
+
+    def prune(self):
+        """Forget the parse of files the last load did not read."""
+        used = {f"{key}.pickle" for _, _, key in self.files.values()}
+        directory = os.path.join(self.cache_dir, "files")
+        for name in os.listdir(directory):
+            if name.endswith(".pickle") and name not in used:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def load(self, load_file, filename, encoding=None):
+        """load_file(filename, encoding), from the cache when nothing changed.
+
+        Returns the same tuple as beancount_import's journal_editor.load_file,
+        with the current modification times of the files read.
+        """
+        filename = os.path.realpath(filename)
+        snapshot_file = self.snapshot_file(filename, encoding)
+        with self.lock, metrics.stage("journal_load"):
+            snapshot = read_pickle(snapshot_file)
+            if snapshot is not None and snapshot.get("format") == FORMAT and self.fresh(snapshot):
+                metrics.count("journal_snapshot_hits")
+                result = pickle.loads(snapshot["result"])
+                modification_times = {
+                    os.path.realpath(name): os.stat(name).st_mtime for name in snapshot["files"]
+                }
+                return result + (modification_times,)
+
+            self.files = {}
+            self.globs = {}
+            with self.parsing():
+                result = load_file(filename, encoding)
+            write_pickle(snapshot_file, dict(
+                format=FORMAT,
+                encoding=encoding,
+                files=self.files,
+                globs=self.globs,
+                result=pickle.dumps(result[:5], protocol=pickle.HIGHEST_PROTOCOL),
+            ))
+            self.prune()
+            return result
+
+    def install(self):
+        """Make beancount-import load its journal through the cache."""
+        from beancount_import import journal_editor
+
+        load_file = journal_editor.load_file
+
+        def cached_load_file(filename, encoding=None):
+            return self.load(load_file, filename, encoding)
+
+        journal_editor.load_file = cached_load_file
@@ -0,0 +1,97 @@
+from abc import ABC, abstractmethod
+from glob import glob
+import json
+import os
+
+from beancount.parser import parser
+
+from beancount_importers import metrics
+
+
+def parse_ledger_file(filename):
+    """Entries of one ledger file and the files it includes."""
+    entries, _, options_map = parser.parse_file(filename)
+    includes = []
+    directory = os.path.dirname(filename)
+    for include in options_map["include"]:
+        includes.extend(sorted(glob(os.path.join(directory, include))))
+    return entries, includes
+
+
+class LedgerIndex(ABC):
+    """Something derived from the ledger, kept up to date file by file.
+
+    The ledger files and everything they include are parsed on refresh(), and
+    what scan_entries() keeps of each file is saved in index_file, so later
+    refreshes and runs only parse the files whose mtime or size changed.
+    """
+
+    # Bump in subclasses when what scan_entries() returns changes
+    format = 1
+
+    def __init__(self, filenames, index_file=None):
+        self.filenames = filenames
+        self.index_file = index_file
+        self.files = {}
+        self.loaded = False
+        if index_file:
+            try:
+                with open(index_file, "r") as fh:
+                    index = json.load(fh)
+                if index.get("format") == self.format:
+                    self.files = index["files"]
+            except (OSError, ValueError):
+                pass
+
+    @abstractmethod
+    def scan_entries(self, entries):
+        """What to keep of one file's entries, saved as JSON."""
+
+    @abstractmethod
+    def rebuild(self):
+        """Update the index from the scanned data of every file in self.files."""
+
+    def refresh(self):
+        seen = set()
+        pending = list(self.filenames)
+        changed = False
+        while pending:
+            filename = os.path.normpath(os.path.abspath(pending.pop()))
+            if filename in seen:
+                continue
+            seen.add(filename)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            scanned = self.files.get(filename)
+            if scanned is None or (scanned["mtime_ns"], scanned["size"]) != (stat.st_mtime_ns, stat.st_size):
+                with metrics.stage("ledger_parse"):
+                    entries, includes = parse_ledger_file(filename)
+                    scanned = self.files[filename] = dict(
+                        mtime_ns=stat.st_mtime_ns,
+                        size=stat.st_size,
+                        includes=includes,
+                        data=self.scan_entries(entries),
+                    )
+                metrics.count("ledger_files_parsed")
+                changed = True
+            pending.extend(scanned["includes"])
+
+        for filename in self.files.keys() - seen:
+            del self.files[filename]
+            changed = True
+
+        if changed or not self.loaded:
+            with metrics.stage("ledger_rebuild"):
+                self.rebuild()
+            self.loaded = True
+        if changed and self.index_file:
+            self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.index_file) or ".", exist_ok=True)
+        tmp_path = f"{self.index_file}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as fh:
+            json.dump(dict(format=self.format, files=self.files), fh)
+        os.replace(tmp_path, self.index_file)
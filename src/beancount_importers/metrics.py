@@ -0,0 +1,348 @@
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+import cProfile
+import datetime
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from beancount_importers.wrapped import WrappedImporter
+
+# Metrics of the running import, None unless enabled. Everything below is a
+# no-op then, and the per-row timers are not even installed.
+current = None
+
+NO_STAGE = nullcontext()
+
+# Stages not tied to one source, e.g. pairing transfers across all of them
+RUN_SOURCE = ""
+
+PROMETHEUS_PREFIX = "beancount_importers"
+
+# Allocation sites listed in the report when tracing memory
+TOP_ALLOCATIONS = 25
+
+
+def stage(name):
+    """Time a stage of the current source and file."""
+    if current is None:
+        return NO_STAGE
+    return current.stage(name)
+
+
+def scope(source, filepath=None):
+    """Attribute the stages and counters inside to a source and file."""
+    if current is None:
+        return NO_STAGE
+    return current.scope(source, filepath)
+
+
+def count(name, value=1):
+    if current is not None:
+        current.count(name, value)
+
+
+def enable(metrics):
+    """Record the metrics of the whole process from now on."""
+    global current
+    current = metrics
+    metrics.start()
+
+
+@contextmanager
+def recording(metrics):
+    """Make metrics the current ones inside, e.g. for one task of a worker process."""
+    global current
+    previous, current = current, metrics
+    try:
+        yield metrics
+    finally:
+        current = previous
+
+
+class Metrics:
+    """Counters and timings of an import run, per source, per file and per stage.
+
+    Stage timings are exclusive: time spent in a stage nested in another one
+    only counts for the inner stage, so the stages of a file add up to the
+    time spent on it.
+    """
+
+    def __init__(self, profile=False, trace_memory=False):
+        self.started = time.time()
+        self.startup_seconds = None
+        self.source = RUN_SOURCE
+        self.filepath = None
+        # Frames of the running stages: [started, time spent in nested stages]
+        self.running = []
+        # source -> stage -> [calls, seconds]
+        self.stages = defaultdict(lambda: defaultdict(lambda: [0, 0.0]))
+        # source -> counter -> value
+        self.counters = defaultdict(lambda: defaultdict(int))
+        # source -> file -> {"seconds", "stages": {stage: seconds}, "counters"}
+        self.files = defaultdict(dict)
+        self.profiler = cProfile.Profile() if profile else None
+        self.trace_memory = trace_memory
+
+    def start(self):
+        if self.profiler is not None:
+            self.profiler.enable()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def file_metrics(self):
+        if self.filepath is None:
+            return None
+        metrics = self.files[self.source].get(self.filepath)
+        if metrics is None:
+            metrics = self.files[self.source][self.filepath] = dict(
+                seconds=0.0, stages=defaultdict(float), counters=defaultdict(int)
+            )
+        return metrics
+
+    @contextmanager
+    def scope(self, source, filepath=None):
+        previous = self.source, self.filepath
+        self.source, self.filepath = source, filepath
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if filepath is not None:
+                self.file_metrics()["seconds"] += time.perf_counter() - started
+            self.source, self.filepath = previous
+
+    def enter(self):
+        self.running.append([time.perf_counter(), 0.0])
+
+    def leave(self, name):
+        started, nested = self.running.pop()
+        elapsed = time.perf_counter() - started
+        if self.running:
+            self.running[-1][1] += elapsed
+        self.add(name, elapsed - nested)
+
+    @contextmanager
+    def stage(self, name):
+        self.enter()
+        try:
+            yield
+        finally:
+            self.leave(name)
+
+    def timed(self, name, fn):
+        """fn timed as a stage on every call, for per-row callbacks."""
+
+        def wrapper(*args, **kwargs):
+            self.enter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.leave(name)
+
+        return wrapper
+
+    def add(self, name, seconds, calls=1):
+        totals = self.stages[self.source][name]
+        totals[0] += calls
+        totals[1] += seconds
+        file_metrics = self.file_metrics()
+        if file_metrics is not None:
+            file_metrics["stages"][name] += seconds
+
+    def count(self, name, value=1):
+        self.counters[self.source][name] += value
+        file_metrics = self.file_metrics()
+        if file_metrics is not None:
+            file_metrics["counters"][name] += value
+
+    def request_started(self):
+        # beancount-import loads the journal before asking the sources for
+        # anything, so this is how long starting up took
+        if self.startup_seconds is None:
+            self.startup_seconds = time.time() - self.started
+
+    def merge(self, report):
+        """Add up the report() of e.g. a worker process."""
+        for source, metrics in report["sources"].items():
+            for name, totals in metrics["stages"].items():
+                mine = self.stages[source][name]
+                mine[0] += totals["calls"]
+                mine[1] += totals["seconds"]
+            for name, value in metrics["counters"].items():
+                self.counters[source][name] += value
+        for source, files in report["files"].items():
+            self.source = source
+            for filepath, metrics in files.items():
+                self.filepath = filepath
+                mine = self.file_metrics()
+                mine["seconds"] += metrics["seconds"]
+                for name, seconds in metrics["stages"].items():
+                    mine["stages"][name] += seconds
+                for name, value in metrics["counters"].items():
+                    mine["counters"][name] += value
+        self.source, self.filepath = RUN_SOURCE, None
+
+    def report(self):
+        report = dict(
+            started=datetime.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            duration_seconds=round(time.time() - self.started, 6),
+            startup_seconds=self.startup_seconds,
+            sources={
+                source: dict(
+                    stages={
+                        name: dict(calls=calls, seconds=round(seconds, 6))
+                        for name, (calls, seconds) in self.stages[source].items()
+                    },
+                    counters=dict(self.counters[source]),
+                )
+                for source in self.stages.keys() | self.counters.keys()
+            },
+            files={
+                source: {
+                    filepath: dict(
+                        seconds=round(metrics["seconds"], 6),
+                        stages={name: round(seconds, 6) for name, seconds in metrics["stages"].items()},
+                        counters=dict(metrics["counters"]),
+                    )
+                    for filepath, metrics in files.items()
+                }
+                for source, files in self.files.items()
+            },
+        )
+        if self.trace_memory and tracemalloc.is_tracing():
+            traced, peak = tracemalloc.get_traced_memory()
+            statistics = tracemalloc.take_snapshot().statistics("lineno")[:TOP_ALLOCATIONS]
+            report["memory"] = dict(
+                traced_bytes=traced,
+                peak_bytes=peak,
+                top_allocations=[
+                    dict(location=str(stat.traceback), bytes=stat.size, blocks=stat.count)
+                    for stat in statistics
+                ],
+            )
+        return report
+
+    def prometheus(self, report):
+        """The report in the Prometheus text format, per source and stage."""
+        lines = []
+
+        def metric(name, kind, help, samples):
+            name = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                rendered = ",".join(f'{key}="{prometheus_label(label)}"' for key, label in labels.items())
+                lines.append(f"{name}{{{rendered}}} {value}" if rendered else f"{name} {value}")
+
+        sources = report["sources"]
+        metric("stage_seconds_total", "counter", "Time spent in each stage of the import.", [
+            (dict(source=source, stage=name), totals["seconds"])
+            for source, metrics in sorted(sources.items())
+            for name, totals in sorted(metrics["stages"].items())
+        ])
+        metric("stage_calls_total", "counter", "Number of times each stage of the import ran.", [
+            (dict(source=source, stage=name), totals["calls"])
+            for source, metrics in sorted(sources.items())
+            for name, totals in sorted(metrics["stages"].items())
+        ])
+        counters = sorted({name for metrics in sources.values() for name in metrics["counters"]})
+        for counter in counters:
+            metric(f"{counter}_total", "counter", f"Number of {counter.replace('_', ' ')}.", [
+                (dict(source=source), metrics["counters"][counter])
+                for source, metrics in sorted(sources.items())
+                if counter in metrics["counters"]
+            ])
+        if report["startup_seconds"] is not None:
+            metric("startup_seconds", "gauge", "Time until the sources were first asked for entries.", [
+                ({}, report["startup_seconds"])
+            ])
+        if "memory" in report:
+            metric("traced_memory_peak_bytes", "gauge", "Peak memory traced by tracemalloc.", [
+                ({}, report["memory"]["peak_bytes"])
+            ])
+        metric("last_run_timestamp_seconds", "gauge", "When the import run started.", [({}, self.started)])
+        return "\n".join(lines) + "\n"
+
+    def export(self, json_file=None, prometheus_file=None, profile_file=None):
+        report = self.report()
+        if json_file:
+            write_atomically(json_file, json.dumps(report, indent=2))
+        if prometheus_file:
+            # The node exporter must never see a half written textfile
+            write_atomically(prometheus_file, self.prometheus(report))
+        if profile_file and self.profiler is not None:
+            self.profiler.dump_stats(profile_file)
+
+
+def prometheus_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_atomically(filename, text):
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_filename, "w") as fh:
+        fh.write(text)
+    os.replace(tmp_filename, filename)
+
+
+class PeriodicExport:
+    """Exports the metrics of a long running import shortly after they change."""
+
+    def __init__(self, metrics, interval=10.0, **files):
+        self.metrics = metrics
+        self.interval = interval
+        self.files = files
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def changed(self):
+        with self.lock:
+            if self.timer is None:
+                self.timer = threading.Timer(self.interval, self.export)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def export(self):
+        with self.lock:
+            self.timer = None
+        try:
+            self.metrics.export(**self.files)
+        except RuntimeError:
+            # The import changed the metrics while they were being read
+            self.changed()
+
+
+class MeteredImporter(WrappedImporter):
+    """Times identify() and extract() of a source and counts its files and entries."""
+
+    def __init__(self, importer, source, metrics, on_change=None):
+        super().__init__(importer)
+        self.source = source
+        self.metrics = metrics
+        self.on_change = on_change
+
+    def identify(self, filepath):
+        self.metrics.request_started()
+        with self.metrics.scope(self.source), self.metrics.stage("identify"):
+            return self.importer.identify(filepath)
+
+    def extract(self, filepath, existing):
+        self.metrics.request_started()
+        with self.metrics.scope(self.source, filepath):
+            with self.metrics.stage("extract"):
+                entries = self.importer.extract(filepath, existing)
+            self.metrics.count("files")
+            self.metrics.count("entries", len(entries))
+        if self.on_change is not None:
+            self.on_change()
+        return entries
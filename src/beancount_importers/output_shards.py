@@ -0,0 +1,150 @@
+import os
+from pathlib import Path
+import re
+
+from beancount_import import reconcile
+
+# Period of the transaction and balance shards -> file name suffix
+PERIODS = {
+    None: "",
+    "year": "-{date:%Y}",
+    "month": "-{date:%Y-%m}",
+}
+
+INDEX_HEADER = "; Generated by beancount_importers, include this file from your main ledger\n"
+
+
+def account_directory(account):
+    return account.replace(":", "-")
+
+
+def shard_files(directory, period):
+    """Where transactions and balances of a directory go, and the globs including them."""
+    suffix = PERIODS[period]
+    return dict(
+        transactions=os.path.join(directory, f"transactions{suffix}.bean"),
+        balances=os.path.join(directory, f"balances{suffix}.bean"),
+        includes=[
+            os.path.join(directory, "transactions*.bean"),
+            os.path.join(directory, "balances*.bean"),
+        ],
+    )
+
+
+def output_options(output_dir, default_output, accounts, by_source=False, period=None):
+    """beancount-import output options splitting its output by source account and period.
+
+    Entries of each source account go to a directory of their own when
+    by_source is set, and transactions and balances into one file per year or
+    month when period is set. Everything else goes where it always did. Also
+    returns the files to create before starting and the includes of the
+    index, whose globs always match the unsharded file of each directory.
+    """
+    default = shard_files(os.path.dirname(default_output), period)
+    options = dict(
+        default_output=default["transactions"],
+        transaction_output_map=[],
+        open_account_output_map=[],
+        balance_account_output_map=[],
+    )
+    files = [default_output]
+    includes = []
+    if by_source:
+        for account in dict.fromkeys(accounts):
+            directory = os.path.join(output_dir, account_directory(account))
+            shard = shard_files(directory, period)
+            pattern = re.escape(account) + "$"
+            options["transaction_output_map"].append((pattern, shard["transactions"]))
+            options["open_account_output_map"].append((pattern, os.path.join(directory, "accounts.bean")))
+            options["balance_account_output_map"].append((pattern, shard["balances"]))
+            files += [
+                os.path.join(directory, "accounts.bean"),
+                os.path.join(directory, "transactions.bean"),
+                os.path.join(directory, "balances.bean"),
+            ]
+            includes += [os.path.join(directory, "accounts.bean")] + shard["includes"]
+    options["open_account_output_map"].append((".*", os.path.join(output_dir, "accounts.bean")))
+    default_includes = [default["includes"][0]]
+    if period is None:
+        balances = os.path.join(output_dir, "balance_accounts.bean")
+    else:
+        # Sharded like the transactions they go with
+        balances = default["balances"]
+        files.append(os.path.join(os.path.dirname(default_output), "balances.bean"))
+        default_includes.append(default["includes"][1])
+    options["balance_account_output_map"].append((".*", balances))
+    options["price_output"] = os.path.join(output_dir, "prices.bean")
+    files += [
+        os.path.join(output_dir, "accounts.bean"),
+        os.path.join(output_dir, "balance_accounts.bean"),
+        os.path.join(output_dir, "prices.bean"),
+    ]
+    includes = (
+        [
+            os.path.join(output_dir, "accounts.bean"),
+            # Still included, balances written before sharding stay in it
+            os.path.join(output_dir, "balance_accounts.bean"),
+            os.path.join(output_dir, "prices.bean"),
+        ]
+        + default_includes
+        + includes
+    )
+    return options, files, includes
+
+
+def write_index(filename, includes):
+    """Write the include index, only if it changed so the journal isn't reloaded for nothing."""
+    directory = os.path.dirname(filename)
+    text = INDEX_HEADER + "".join(
+        f'include "{os.path.relpath(include, directory)}"\n' for include in includes
+    )
+    try:
+        with open(filename, "r") as fh:
+            if fh.read() == text:
+                return
+    except OSError:
+        pass
+    with open(filename, "w") as fh:
+        fh.write(text)
+
+
+def create_shard(filename):
+    if os.path.exists(filename):
+        return
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    Path(filename).touch()
+    # beancount-import refuses to write files modified since it loaded the
+    # journal, and a new shard is not part of it yet
+    os.utime(filename, ns=(0, 0))
+
+
+def update_output(output_dir, default_output, accounts, by_source=False, period=None):
+    """output_options() for the accounts of a running server, e.g. after sources were added.
+
+    The files of new shards are created and included in the index, so the
+    ledger picks them up when it reloads.
+    """
+    options, files, includes = output_options(
+        output_dir, default_output, accounts, by_source, period
+    )
+    for filename in files:
+        create_shard(filename)
+    write_index(os.path.join(output_dir, "index.bean"), includes)
+    return options
+
+
+class ShardedEntryFileSelector(reconcile.EntryFileSelector):
+    """Picks the shard of an entry's period when its output file is a template."""
+
+    def __call__(self, entry):
+        filename = super().__call__(entry)
+        if "{date" not in filename:
+            return filename
+        filename = filename.format(date=entry.date)
+        create_shard(filename)
+        return filename
+
+
+def install():
+    """Make beancount-import fill in the period of sharded output files."""
+    reconcile.EntryFileSelector = ShardedEntryFileSelector
@@ -0,0 +1,281 @@
+from collections import defaultdict
+from decimal import Decimal
+import re
+
+from beancount_importers.bank_classifier import PrefixMatcher
+
+# Fields a rule can set in importers_config.yml. Every condition given must hold
+# for the rule to match, and the first matching rule in config order wins.
+RULE_FIELDS = {
+    "account",
+    "id",
+    "payee",
+    "payee_prefix",
+    "payee_regex",
+    "narration",
+    "narration_prefix",
+    "narration_regex",
+    "min_amount",
+    "max_amount",
+    "sign",
+}
+
+SIGNS = {"negative": -1, "positive": 1}
+
+
+class Rule:
+    def __init__(self, config):
+        unknown = config.keys() - RULE_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown fields {sorted(unknown)} in categorization rule {config}")
+        if "account" not in config:
+            raise ValueError(f"Categorization rule without an account: {config}")
+        if config.get("sign") not in (None, *SIGNS):
+            raise ValueError(f"Rule sign must be one of {list(SIGNS)}: {config}")
+
+        self.account = config["account"]
+        self.id = None if config.get("id") is None else str(config["id"])
+        self.payee = config.get("payee")
+        self.payee_prefix = config.get("payee_prefix")
+        self.narration = config.get("narration")
+        self.narration_prefix = config.get("narration_prefix")
+        self.payee_regex = re.compile(config["payee_regex"]) if config.get("payee_regex") else None
+        self.narration_regex = (
+            re.compile(config["narration_regex"]) if config.get("narration_regex") else None
+        )
+        # YAML reads 12.50 as a float, go through str to get the decimal as written
+        self.min_amount = None if config.get("min_amount") is None else Decimal(str(config["min_amount"]))
+        self.max_amount = None if config.get("max_amount") is None else Decimal(str(config["max_amount"]))
+        self.sign = SIGNS.get(config.get("sign"))
+
+    def matches(self, payee, narration, amount, id):
+        if self.id is not None and id != self.id:
+            return False
+        if self.payee is not None and payee != self.payee:
+            return False
+        if self.narration is not None and narration != self.narration:
+            return False
+        if self.payee_prefix is not None and not payee.startswith(self.payee_prefix):
+            return False
+        if self.narration_prefix is not None and not narration.startswith(self.narration_prefix):
+            return False
+        if self.min_amount is not None and amount < self.min_amount:
+            return False
+        if self.max_amount is not None and amount > self.max_amount:
+            return False
+        if self.sign is not None and (amount > 0) - (amount < 0) != self.sign:
+            return False
+        if self.payee_regex is not None and not self.payee_regex.search(payee):
+            return False
+        if self.narration_regex is not None and not self.narration_regex.search(narration):
+            return False
+        return True
+
+
+REGEX_METACHARACTERS = set(".^$*+?{}[]\\|()")
+
+
+def literal_prefix(pattern):
+    """Plain characters every match of the regex starts with, "" if unknown."""
+    if pattern.flags != re.compile("").flags:
+        return ""
+    source = pattern.pattern
+    i = 1 if source.startswith("^") else 0
+    literal = []
+    while i < len(source):
+        char = source[i]
+        if char == "\\" and i + 1 < len(source) and not source[i + 1].isalnum():
+            char = source[i + 1]
+            i += 2
+        elif char in REGEX_METACHARACTERS:
+            break
+        else:
+            i += 1
+        literal.append(char)
+    if i < len(source) and source[i] in "*?{":
+        # The last character may be repeated zero times
+        literal = literal[:-1]
+    # An alternation anywhere means matches needn't start with the literal
+    if "|" in source.replace("\\\\", "").replace("\\|", ""):
+        return ""
+    return "".join(literal)
+
+
+class LiteralMatcher:
+    """Aho-Corasick automaton finding which of many literals occur in a text in one pass."""
+
+    def __init__(self, literals):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for literal, values in literals.items():
+            node = 0
+            for char in literal:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][char] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                node = child
+            self.output[node].extend(values)
+
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, text):
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.update(output[node])
+        return found
+
+
+class RegexIndex:
+    """The regex rules of one field behind a single automaton.
+
+    A regex can only match a text containing its literal prefix, so one pass of
+    the automaton over the text leaves the few rules worth searching. Regexes
+    without a literal prefix are searched on every row.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = dict(patterns)
+        by_literal = defaultdict(list)
+        self.unprefixed = []
+        for index, pattern in patterns:
+            literal = literal_prefix(pattern)
+            if literal:
+                by_literal[literal].append(index)
+            else:
+                self.unprefixed.append(index)
+        self.literals = LiteralMatcher(by_literal)
+
+    def candidates(self, text):
+        found = self.literals.find(text)
+        found.update(self.unprefixed)
+        return found
+
+
+class RuleSet:
+    """Categorization rules compiled for constant time lookups.
+
+    Every rule is indexed under one of its conditions, by preference a hash
+    table (id, exact payee or narration), then a prefix trie, then the literal
+    automaton of its field's regexes. A row only checks the rules found through those
+    indexes, plus the few rules with amount or sign conditions alone.
+    """
+
+    def __init__(self, rules):
+        self.rules = [Rule(rule) for rule in rules]
+        self.by_id = defaultdict(list)
+        self.by_payee = defaultdict(list)
+        self.by_narration = defaultdict(list)
+        payee_prefixes = defaultdict(list)
+        narration_prefixes = defaultdict(list)
+        payee_regexes = []
+        narration_regexes = []
+        self.unindexed = []
+        for index, rule in enumerate(self.rules):
+            if rule.id is not None:
+                self.by_id[rule.id].append(index)
+            elif rule.payee is not None:
+                self.by_payee[rule.payee].append(index)
+            elif rule.narration is not None:
+                self.by_narration[rule.narration].append(index)
+            elif rule.payee_prefix is not None:
+                payee_prefixes[rule.payee_prefix].append(index)
+            elif rule.narration_prefix is not None:
+                narration_prefixes[rule.narration_prefix].append(index)
+            elif rule.payee_regex is not None:
+                payee_regexes.append((index, rule.payee_regex))
+            elif rule.narration_regex is not None:
+                narration_regexes.append((index, rule.narration_regex))
+            else:
+                self.unindexed.append(index)
+        self.payee_prefixes = PrefixMatcher(payee_prefixes)
+        self.narration_prefixes = PrefixMatcher(narration_prefixes)
+        self.payee_regexes = RegexIndex(payee_regexes)
+        self.narration_regexes = RegexIndex(narration_regexes)
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def payee_candidates(self, payee):
+        candidates = list(self.by_payee.get(payee, ()))
+        for indexes in self.payee_prefixes.match_all(payee):
+            candidates.extend(indexes)
+        if self.payee_regexes.patterns:
+            candidates.extend(self.payee_regexes.candidates(payee))
+        return candidates
+
+    def narration_candidates(self, narration):
+        candidates = list(self.by_narration.get(narration, ()))
+        for indexes in self.narration_prefixes.match_all(narration):
+            candidates.extend(indexes)
+        if self.narration_regexes.patterns:
+            candidates.extend(self.narration_regexes.candidates(narration))
+        return candidates
+
+    def first_match(self, candidates, payee, narration, amount, id):
+        # candidates are sorted, i.e. in config order
+        for index in candidates:
+            if self.rules[index].matches(payee, narration, amount, id):
+                return self.rules[index].account
+        return None
+
+    def match(self, payee, narration, amount, id=None):
+        """Account of the first rule matching the row, or None."""
+        if not self.rules:
+            return None
+        payee = payee or ""
+        narration = narration or ""
+        id = None if id is None else str(id)
+
+        candidates = self.unindexed + self.payee_candidates(payee) + self.narration_candidates(narration)
+        if id is not None:
+            candidates.extend(self.by_id.get(id, ()))
+        return self.first_match(sorted(candidates), payee, narration, amount, id)
+
+    def match_batch(self, payees, narrations, amounts, ids=None):
+        """match() for every row of a statement given as columns.
+
+        Statements repeat the same payees and descriptions, so the index lookups
+        run once per distinct payee and per distinct narration, and each row
+        only checks the few rules they found.
+        """
+        if not self.rules:
+            return [None] * len(amounts)
+        if ids is None:
+            ids = [None] * len(amounts)
+        by_payee = {}
+        by_narration = {}
+        accounts = []
+        for payee, narration, amount, id in zip(payees, narrations, amounts, ids):
+            payee = payee or ""
+            narration = narration or ""
+            payee_candidates = by_payee.get(payee)
+            if payee_candidates is None:
+                payee_candidates = by_payee[payee] = self.payee_candidates(payee)
+            narration_candidates = by_narration.get(narration)
+            if narration_candidates is None:
+                narration_candidates = by_narration[narration] = self.narration_candidates(narration)
+            candidates = self.unindexed + payee_candidates + narration_candidates
+            if id is not None:
+                id = str(id)
+                candidates.extend(self.by_id.get(id, ()))
+            accounts.append(self.first_match(sorted(candidates), payee, narration, amount, id))
+        return accounts
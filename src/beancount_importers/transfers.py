@@ -0,0 +1,219 @@
+from collections import defaultdict
+import datetime
+import os
+
+from beancount.core import data
+
+from beancount_importers import metrics
+from beancount_importers.accounts import UNCATEGORIZED_ACCOUNT
+from beancount_importers.wrapped import WrappedImporter
+from beancount_importers.identify import source_files
+
+# How far apart the two legs of a transfer can be booked
+TRANSFER_WINDOW = datetime.timedelta(days=3)
+
+
+def entry_date(entry):
+    return entry.date
+
+
+def is_leg(entry, accounts):
+    """Whether entry could be one side of a transfer between two of the accounts."""
+    if not isinstance(entry, data.Transaction) or "skip_transaction" in entry.meta:
+        return False
+    if len(entry.postings) != 2 or entry.postings[0].units is None:
+        return False
+    source, other = entry.postings
+    if source.account not in accounts:
+        return False
+    return bool(UNCATEGORIZED_ACCOUNT.search(other.account)) or (
+        other.account in accounts and other.account != source.account
+    )
+
+
+def legs_fit(outgoing, incoming):
+    if outgoing.postings[0].account == incoming.postings[0].account:
+        return False
+    # A leg already categorized as a transfer only pairs with that account
+    for leg, other in ((outgoing, incoming), (incoming, outgoing)):
+        account = leg.postings[1].account
+        if not UNCATEGORIZED_ACCOUNT.search(account) and account != other.postings[0].account:
+            return False
+    return True
+
+
+def match_transfers(entries, accounts, window=TRANSFER_WINDOW):
+    """Pair money leaving one of the accounts with the same amount arriving in another.
+
+    Incoming legs are hashed by (amount, currency) and then by date, so each
+    outgoing leg probes the days of the window closest first and takes the
+    first leg that fits, removing it from its day straight away.
+    """
+    accounts = set(accounts)
+    incoming = defaultdict(lambda: defaultdict(list))
+    outgoing = []
+    for entry in entries:
+        if not is_leg(entry, accounts):
+            continue
+        units = entry.postings[0].units
+        if units.number > 0:
+            incoming[(units.number, units.currency)][entry.date].append(entry)
+        elif units.number < 0:
+            outgoing.append(entry)
+
+    # Same day first, then a day earlier, a day later and so on
+    offsets = [datetime.timedelta(days=0)]
+    for days in range(1, window.days + 1):
+        offsets.extend((datetime.timedelta(days=-days), datetime.timedelta(days=days)))
+
+    pairs = []
+    for leg in sorted(outgoing, key=entry_date):
+        units = leg.postings[0].units
+        by_date = incoming.get((-units.number, units.currency))
+        if not by_date:
+            continue
+        match = None
+        for offset in offsets:
+            candidates = by_date.get(leg.date + offset)
+            if not candidates:
+                continue
+            for i, candidate in enumerate(candidates):
+                if legs_fit(leg, candidate):
+                    match = candidates.pop(i)
+                    break
+            if match is not None:
+                break
+        if match is not None:
+            pairs.append((leg, match))
+    return pairs
+
+
+def merge_transfer(outgoing, incoming):
+    """One transaction moving the money between both accounts, described by the outgoing leg."""
+    return outgoing._replace(
+        tags=outgoing.tags | incoming.tags,
+        links=outgoing.links | incoming.links,
+        postings=[outgoing.postings[0], incoming.postings[0]],
+    )
+
+
+def link_transfer(outgoing, incoming):
+    """Both legs booked against the other account, beancount-import merges the two."""
+    return (
+        outgoing._replace(postings=[
+            outgoing.postings[0],
+            outgoing.postings[1]._replace(account=incoming.postings[0].account),
+        ]),
+        incoming._replace(postings=[
+            incoming.postings[0],
+            incoming.postings[1]._replace(account=outgoing.postings[0].account),
+        ]),
+    )
+
+
+def copy_entry(entry):
+    """entry with metadata dicts of its own, for callers that edit them."""
+    entry = entry._replace(meta=dict(entry.meta))
+    if isinstance(entry, data.Transaction):
+        entry = entry._replace(postings=[
+            posting if posting.meta is None else posting._replace(meta=dict(posting.meta))
+            for posting in entry.postings
+        ])
+    return entry
+
+
+class TransferMatcher:
+    """Extracts the statements of all sources together to pair transfers between them.
+
+    beancount-import asks each source for its files one at a time, so the first
+    request extracts every file of every source and links the transfer legs
+    found across them. Asking for a file again, e.g. after beancount-import
+    reloads, only extracts that file again, and the legs are paired again
+    with what the other files extracted before if its entries changed.
+    """
+
+    def __init__(self, window=TRANSFER_WINDOW):
+        self.window = window
+        self.sources = []
+        # (id of the wrapped importer, file) -> entries as extracted
+        self.extracted = {}
+        # Wrapped importers whose files were all extracted
+        self.complete = set()
+        self.served = set()
+        # id of an extracted transfer leg -> the leg linked to the other one
+        self.links = {}
+
+    def wrap(self, importer, directory, account):
+        # A source rebuilt after its config changed replaces the old one
+        self.remove(directory)
+        wrapped = TransferMatchedImporter(importer, self)
+        self.sources.append((wrapped, directory, account))
+        return wrapped
+
+    def remove(self, directory):
+        removed = {id(source[0]) for source in self.sources if source[1] == directory}
+        if not removed:
+            return
+        self.sources = [source for source in self.sources if id(source[0]) not in removed]
+        self.complete -= removed
+        self.extracted = {
+            key: entries for key, entries in self.extracted.items() if key[0] not in removed
+        }
+        self.served = {key for key in self.served if key[0] not in removed}
+        self.link()
+
+    def extract(self, wrapped, filepath, existing):
+        key = (id(wrapped), os.path.abspath(filepath))
+        changed = False
+        for source_wrapped, directory, _ in self.sources:
+            if id(source_wrapped) not in self.complete:
+                self.extract_source(source_wrapped, directory, existing)
+                changed = True
+        if key in self.served or key not in self.extracted:
+            changed = self.extract_file(wrapped, key, existing) or changed
+        if changed:
+            self.link()
+        self.served.add(key)
+        # beancount-import edits the metadata of what it gets, the entries kept
+        # here are compared and linked again later
+        return [copy_entry(self.links.get(id(entry), entry)) for entry in self.extracted[key]]
+
+    def extract_source(self, wrapped, directory, existing):
+        for filepath in source_files(directory):
+            if wrapped.importer.identify(filepath):
+                key = (id(wrapped), os.path.abspath(filepath))
+                self.extracted[key] = list(wrapped.importer.extract(filepath, existing))
+        self.complete.add(id(wrapped))
+
+    def extract_file(self, wrapped, key, existing):
+        """Extract one file again, returns whether any of the source's entries changed."""
+        entries = list(wrapped.importer.extract(key[1], existing))
+        changed = entries != self.extracted.get(key)
+        if changed:
+            # Unchanged entries are kept, the links are by their id
+            self.extracted[key] = entries
+        # Statements deleted since they were extracted
+        for other in [other for other in self.extracted if other[0] == key[0]]:
+            if not os.path.exists(other[1]):
+                del self.extracted[other]
+                self.served.discard(other)
+                changed = True
+        return changed
+
+    def link(self):
+        with metrics.scope(metrics.RUN_SOURCE), metrics.stage("match_transfers"):
+            entries = [entry for file_entries in self.extracted.values() for entry in file_entries]
+            accounts = {account for _, _, account in self.sources}
+            self.links = {}
+            for outgoing, incoming in match_transfers(entries, accounts, self.window):
+                linked = link_transfer(outgoing, incoming)
+                self.links[id(outgoing)], self.links[id(incoming)] = linked
+
+
+class TransferMatchedImporter(WrappedImporter):
+    def __init__(self, importer, matcher):
+        super().__init__(importer)
+        self.matcher = matcher
+
+    def extract(self, filepath, existing):
+        return self.matcher.extract(self, filepath, existing)
@@ -0,0 +1,166 @@
+from abc import ABC, abstractmethod
+import os
+import sys
+import time
+import traceback
+
+import watchdog.events
+import watchdog.observers
+import watchdog.observers.polling
+
+from beancount_importers import metrics
+from beancount_importers.identify import source_files
+
+# How long statements must stay unchanged before they are imported, so that
+# files still being copied or downloaded are not read half written
+SETTLE_SECONDS = 1.0
+
+
+def statement_state(directories):
+    """mtime and size of every file in the source directories."""
+    state = {}
+    for directory in directories:
+        for filepath in source_files(directory):
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            state[filepath] = (stat.st_mtime_ns, stat.st_size)
+    return state
+
+
+def wait_for_change(directories, state, interval):
+    """Poll the source directories until their files differ from state and settle."""
+    current = state
+    while True:
+        time.sleep(interval)
+        polled = statement_state(directories)
+        if polled != state and polled == current:
+            return polled
+        current = polled
+
+
+class ReloadOnChange(watchdog.events.FileSystemEventHandler, ABC):
+    """Calls reload() on beancount-import's event loop once files stop changing.
+
+    Reloads wait for beancount-import to finish loading, so they never race
+    with one it is already doing.
+    """
+
+    def __init__(self, application, settle=SETTLE_SECONDS):
+        super().__init__()
+        self.application = application
+        self.settle = settle
+        self.pending = None
+
+    def watches(self, event):
+        return not event.is_directory
+
+    def on_any_event(self, event):
+        if self.watches(event):
+            self.application.ioloop.add_callback(self.changed)
+
+    def changed(self):
+        ioloop = self.application.ioloop
+        if self.pending is not None:
+            ioloop.remove_timeout(self.pending)
+        self.pending = ioloop.call_later(self.settle, self.run_reload)
+
+    def run_reload(self):
+        self.pending = None
+        if not self.application.reconciler.loaded_future.done():
+            # Try again once the running load is done
+            self.changed()
+            return
+        self.reload()
+
+    @abstractmethod
+    def reload(self):
+        """Pick up the change, called on the event loop."""
+
+
+class StatementWatcher(ReloadOnChange):
+    """Makes beancount-import import statements added to or changed in the data directories.
+
+    beancount-import's sources list their statements when they are created,
+    so the sources of the directories whose files changed are created again
+    and the others are kept. The journal and unchanged statements come from
+    their caches, so only the new files are actually parsed.
+    """
+
+    def __init__(self, application, directories, interval=0, settle=SETTLE_SECONDS):
+        super().__init__(application, settle)
+        self.interval = interval
+        self.states = {directory: statement_state([directory]) for directory in directories}
+        self.observer = None
+
+    def reload(self):
+        from beancount_import import reconcile
+
+        states = {directory: statement_state([directory]) for directory in self.states}
+        changed = {
+            directory for directory, state in states.items() if state != self.states[directory]
+        }
+        if not changed:
+            return
+
+        reconciler = self.application.reconciler
+        loaded = reconciler.loaded_future.result()
+        sources = []
+        try:
+            for data_source, source in zip(reconciler.options["data_sources"], loaded.sources):
+                if data_source["directory"] in changed:
+                    source = reconcile.load_source(data_source, log_status=reconciler.log_status)
+                sources.append(source)
+        except Exception:
+            traceback.print_exc()
+            print("Not reloading sources", file=sys.stderr)
+            return
+
+        self.states = states
+        print(f"Statements changed in {', '.join(sorted(changed))}, reloading", file=sys.stderr)
+        metrics.count("statement_reloads")
+        reconciler.loaded_future = reconcile.call_in_new_thread(
+            reconcile.LoadedReconciler,
+            reconciler=reconciler,
+            classifier=loaded.classifier,
+            sources=sources,
+        )
+        self.application.reset()
+
+    def watch(self, directory):
+        """Also watch directory, e.g. for a source added to the config file.
+
+        Its statements were just listed by the new source, so they count as
+        seen.
+        """
+        os.makedirs(directory, exist_ok=True)
+        if directory not in self.states and self.observer is not None:
+            self.observer.schedule(self, directory, recursive=True)
+        self.states[directory] = statement_state([directory])
+
+    def start(self):
+        if self.interval:
+            self.observer = watchdog.observers.polling.PollingObserver(timeout=self.interval)
+        else:
+            self.observer = watchdog.observers.Observer()
+        for directory in self.states:
+            os.makedirs(directory, exist_ok=True)
+            self.observer.schedule(self, directory, recursive=True)
+        self.observer.daemon = True
+        self.observer.start()
+
+
+def install(directories, interval=0):
+    """Make beancount-import's web server watch the source directories."""
+    from beancount_import import webserver
+
+    init = webserver.Application.__init__
+
+    def __init__(application, *args, **kwargs):
+        init(application, *args, **kwargs)
+        # Kept so the config watcher can add the directories of new sources
+        application.statement_watcher = StatementWatcher(application, directories, interval)
+        application.statement_watcher.start()
+
+    webserver.Application.__init__ = __init__
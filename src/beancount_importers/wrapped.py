@@ -0,0 +1,33 @@
+import beangulp
+
+
+class WrappedImporter(beangulp.Importer):
+    """Importer delegating everything to another one, for wrappers to override extract()."""
+
+    def __init__(self, importer):
+        self.importer = importer
+
+    @property
+    def name(self):
+        return self.importer.name
+
+    def identify(self, filepath):
+        return self.importer.identify(filepath)
+
+    def account(self, filepath):
+        return self.importer.account(filepath)
+
+    def date(self, filepath):
+        return self.importer.date(filepath)
+
+    def filename(self, filepath):
+        return self.importer.filename(filepath)
+
+    def extract(self, filepath, existing):
+        return self.importer.extract(filepath, existing)
+
+    def deduplicate(self, entries, existing):
+        return self.importer.deduplicate(entries, existing)
+
+    def sort(self, entries, reverse=False):
+        return self.importer.sort(entries, reverse)
@@ -1,18 +1,27 @@
 #!/usr/bin/env python3
-from contextlib import nullcontext
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import csv
+import functools
+import json
 import os
 import pprint
+import random
+import sqlite3
 import sys
+import threading
 import time
 from typing import Any
 import webbrowser
 from datetime import datetime as dt, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from urllib.parse import urlencode, parse_qs, urlparse
 from dateutil import parser
 from dotenv import load_dotenv
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 import click
 
 load_dotenv(override=True)
@@ -22,9 +31,21 @@ CLIENT_SECRET = os.getenv("MONZO_CLIENT_SECRET") or "YOUR_CLIENT_SECRET"
 REDIRECT_URI = os.getenv("MONZO_REDIRECT_URI") or "http://localhost:8080/callback"
 
 TOKEN_FILE = ".monzo_token"
+SYNC_STATE_FILE = ".monzo_sync.json"
 CSV_FILE = "monzo_transactions.csv"
 AUTH_URL = "https://auth.monzo.com/"
-API_ROOT = "https://api.monzo.com/"
+API_ROOT = os.getenv("MONZO_API_ROOT") or "https://api.monzo.com/"
+
+# HTTP behaviour, see send()
+REQUEST_TIMEOUT = 30
+MAX_RETRIES = int(os.getenv("MONZO_MAX_RETRIES") or 5)
+BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 60
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Sending these again has the same effect as sending them once. Others, like
+# the single-use refresh token exchange, are only retried when they could not
+# have reached the API
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
 
 OUTPUT_DIRECTORY = "beancount_data/beancount_import_data/"
 
@@ -32,7 +53,89 @@ ACCOUNTS = {
 }
 
 
+class RateLimiter:
+    """Spaces out requests so that at most `rate` are started per second."""
+
+    def __init__(self, rate: float = 0):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+RATE_LIMITER = RateLimiter(float(os.getenv("MONZO_RATE_LIMIT") or 0))
+
+# A single session keeps connections to the API alive between requests
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# Latest access token, shared by every caller of api_get
+_access_token = None
+_token_lock = threading.Lock()
+
+
+def retry_delay(response: requests.Response | None, attempt: int) -> float:
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(retry_after) - dt.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0), MAX_BACKOFF_SECONDS)
+    delay = BACKOFF_SECONDS * 2**attempt
+    return min(delay + random.uniform(0, delay / 2), MAX_BACKOFF_SECONDS)
+
+
+def never_sent(error: requests.RequestException) -> bool:
+    """Whether a failed request never got to the API, because no connection was made."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def send(method: str, url: str, **kwargs) -> requests.Response:
+    """Send a request through the shared session.
+
+    Rate limited, and retried with exponential backoff on connection errors,
+    429 and 5xx responses, honouring Retry-After when the API sends it. Requests
+    that aren't idempotent are only retried if they failed to connect: the
+    API may have handled one that timed out or failed.
+    """
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    for attempt in range(MAX_RETRIES + 1):
+        RATE_LIMITER.wait()
+        try:
+            r = SESSION.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == MAX_RETRIES or not (idempotent or never_sent(e)):
+                raise
+            r = None
+        else:
+            if r.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES or not idempotent:
+                return r
+        delay = retry_delay(r, attempt)
+        print(f"Retrying {url} in {delay:.1f}s", file=sys.stderr)
+        time.sleep(delay)
+
+
 def save_tokens(access: str, refresh: str):
+    global _access_token
+    _access_token = access
     with open(TOKEN_FILE, "w") as fh:
         fh.write(f"{access}\n{refresh}")
 
@@ -59,7 +162,7 @@ def refresh_access_token(refresh: str):
         "client_id": CLIENT_ID,
         "client_secret": CLIENT_SECRET,
     }
-    r = requests.post(url, data=data)
+    r = send("POST", url, data=data)
     r.raise_for_status()
     js = r.json()
     save_tokens(js["access_token"], js["refresh_token"])
@@ -76,11 +179,15 @@ def start_oauth():
             "state": state,
         }
     )
-    print("\nOpening browser so you can authorise this app…\n")
+    print("\nOpening browser so you can authorise this app…\n", file=sys.stderr)
     webbrowser.open(f"{AUTH_URL}?{qs}")
 
-    print("After you authorise, Monzo will redirect to a localhost URL.")
-    resp_url = input("Paste the FULL redirect URL here → ").strip()
+    print(
+        "After you authorise, Monzo will redirect to a localhost URL.", file=sys.stderr
+    )
+    # Prompt on stderr too, stdout may be the CSV
+    print("Paste the FULL redirect URL here → ", end="", file=sys.stderr, flush=True)
+    resp_url = input().strip()
     parsed = urlparse(resp_url)
     qs_back = parse_qs(parsed.query)
     if qs_back.get("state") != [state]:
@@ -99,25 +206,37 @@ def start_oauth():
         "code": auth_code,
     }
 
-    r = requests.post(url, data=data)
+    r = send("POST", url, data=data)
     r.raise_for_status()
     js = r.json()
     save_tokens(js["access_token"], js.get("refresh_token", ""))
     return js["access_token"]
 
 
+def refresh_expired_token(expired: str):
+    """Refresh the access token once, however many callers saw it expire."""
+    with _token_lock:
+        if _access_token is not None and _access_token != expired:
+            # Another caller has already refreshed it
+            return _access_token
+        refresh_token = load_tokens()[1]
+        if refresh_token is None:
+            return None
+        return refresh_access_token(refresh_token)
+
+
 def api_get(path: str, token: str, params=None):
     """Convenience wrapper around GET requests."""
     url = API_ROOT + path.lstrip("/")
+    token = _access_token or token
     hdr = {"Authorization": f"Bearer {token}"}
-    r = requests.get(url, headers=hdr, params=params or {})
+    r = send("GET", url, headers=hdr, params=params or {})
     if r.status_code == 401:  # expired token – refresh once
-        refresh_token = load_tokens()[1]
-        if refresh_token is None:
+        token = refresh_expired_token(token)
+        if token is None:
             return
-        token = refresh_access_token(refresh_token)
         hdr = {"Authorization": f"Bearer {token}"}
-        r = requests.get(url, headers=hdr, params=params or {})
+        r = send("GET", url, headers=hdr, params=params or {})
     r.raise_for_status()
     return r.json()
 
@@ -142,23 +261,50 @@ def get_pots(token: str, account_id: str) -> list[dict[str, Any]]:
     )
     if data is None:
         sys.exit("No data returned")
+    if STORE is not None:
+        # Closed pots too, older transactions may still refer to them
+        STORE.upsert_pots(data.get("pots", []))
 
     accounts = [a for a in data.get("pots", []) if not a.get("closed")]
 
     return accounts
 
 
-def fetch_all_transactions(
+def parse_created(created: str) -> dt:
+    """Parse an API timestamp. These are ISO-8601, which fromisoformat handles
+    much faster than dateutil; anything it rejects still goes through isoparse."""
+    try:
+        return dt.fromisoformat(created)
+    except ValueError:
+        return parser.isoparse(created)
+
+
+@functools.lru_cache(maxsize=4096)
+def format_day(day: str, frmt: str) -> str:
+    return dt.strptime(day, "%Y-%m-%d").strftime(frmt)
+
+
+def format_created(created: str, frmt: str) -> str:
+    """Format the date of an API timestamp, caching the result per day.
+
+    The date is the one written in the timestamp (no timezone conversion), so
+    it can be taken straight from the first 10 characters.
+    """
+    if len(created) >= 10 and created[4] == "-" and created[7] == "-":
+        return format_day(created[:10], frmt)
+    return parser.parse(created).strftime(frmt)
+
+
+def iter_transaction_pages(
     token: str,
     account: dict[str, Any],
     start_date: str,
     end_date: str | None = None,
 ):
-    """Download every transaction using pagination."""
+    """Yield transactions page by page, so callers don't have to hold them all."""
 
     # Pagination is broken. Need to just keep going from the date of the last
     # transaction in each request until nothing is returned
-    txns = []
     while True:
         params = {
             "account_id": account.get("id"),
@@ -169,20 +315,24 @@ def fetch_all_transactions(
         if end_date is not None:
             params["before"] = end_date
 
-        print(f"Fetching transactions for {account["id"]} from {start_date}")
+        print(
+            f"Fetching transactions for {account["id"]} from {start_date}",
+            file=sys.stderr,
+        )
         data = api_get("/transactions", token, params)
         if data is None or len(data["transactions"]) == 0:
             break
 
-        print(f"Got {len(data["transactions"])} transactions")
-        txns.extend(data["transactions"])
+        page = data["transactions"]
+        print(f"Got {len(page)} transactions", file=sys.stderr)
+        if STORE is not None:
+            STORE.upsert_transactions(account["id"], page)
+        yield page
 
-        sd = parser.isoparse(txns[-1]["created"])
+        sd = parse_created(page[-1]["created"])
         sd = sd + timedelta(seconds=1)
         start_date = sd.astimezone().isoformat()
 
-    return txns
-
 
 def extract_payee(txn) -> str:
     if txn["metadata"] and txn["metadata"].get("pot_id", None) is not None:
@@ -208,7 +358,7 @@ TX_FIELDS = [
         "key": "Transaction ID",
         "fn": lambda x: x["id"],
     },
-    {"key": "Date", "fn": lambda x: parser.parse(x["created"]).strftime("%d/%m/%Y")},
+    {"key": "Date", "fn": lambda x: format_created(x["created"], "%d/%m/%Y")},
     {"key": "Name", "fn": extract_payee},
     {
         "key": "Description",
@@ -229,39 +379,348 @@ TX_FIELDS = [
 ]
 
 
-def write_csv(transactions, pots, filename: str | None = None):
-    """Write list of transaction dicts to CSV."""
+# Time spent in each TX_FIELDS function, only collected with --field-timings
+FIELD_TIMINGS: dict[str, float] | None = None
+
+
+def transaction_rows(transactions, pots):
+    """Turn transaction dicts into CSV rows, skipping declined ones.
 
-    rows = []
+    Pot transfers are named after their pot, or keep the pot id if pots is None.
+    """
+    timings = FIELD_TIMINGS
     for t in transactions:
         r = {}
         
         if "decline_reason" in t:
             continue
 
-        for k in TX_FIELDS:
-            r[k["key"]] = k["fn"](t)
-
-        rows.append(r)
+        if timings is None:
+            for k in TX_FIELDS:
+                r[k["key"]] = k["fn"](t)
+        else:
+            for k in TX_FIELDS:
+                started = time.perf_counter()
+                r[k["key"]] = k["fn"](t)
+                timings[k["key"]] += time.perf_counter() - started
 
-        if r["Name"].startswith("pot_"):
+        if pots is not None and r["Name"].startswith("pot_"):
             r["Name"] = pots[r["Name"]]["name"]
 
         if r["Name"] == "UNKNOWN":
-            print(t)
-
-    with (
-        open(filename, "x", newline="", encoding="utf-8")
-        if filename
-        else nullcontext(sys.stdout)
-    ) as fh:
-        writer = csv.DictWriter(
-            fh, fieldnames=[x["key"] for x in TX_FIELDS], extrasaction="ignore"
+            print(t, file=sys.stderr)
+
+        yield r
+
+
+_sync_state_lock = threading.Lock()
+
+
+def load_sync_state() -> dict[str, dict[str, str]]:
+    if not os.path.isfile(SYNC_STATE_FILE):
+        return {}
+    with open(SYNC_STATE_FILE) as fh:
+        return json.load(fh)
+
+
+def save_sync_state(state: dict[str, dict[str, str]]):
+    with open(SYNC_STATE_FILE + ".tmp", "w") as fh:
+        json.dump(state, fh, indent=2, sort_keys=True)
+    os.replace(SYNC_STATE_FILE + ".tmp", SYNC_STATE_FILE)
+
+
+class TransactionStore:
+    """Local SQLite copy of the API's transactions and pots.
+
+    Transactions are upserted by id, so fetching overlapping ranges never
+    duplicates them and updated ones (e.g. settled amounts) replace the old
+    version. The raw API JSON is kept, merchant included, so CSV columns can
+    be derived again without calling the API.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id TEXT PRIMARY KEY,
+            account_id TEXT NOT NULL,
+            created TEXT NOT NULL,
+            raw TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS transactions_account_created
+            ON transactions (account_id, created);
+        CREATE INDEX IF NOT EXISTS transactions_created ON transactions (created);
+        CREATE TABLE IF NOT EXISTS pots (
+            id TEXT PRIMARY KEY,
+            account_id TEXT,
+            raw TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, filename: str):
+        # Accounts are fetched from several threads, writes go one at a time
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(self.SCHEMA)
+
+    def upsert_transactions(self, account_id: str, transactions):
+        with self.lock, self.db:
+            self.db.executemany(
+                """
+                INSERT INTO transactions (id, account_id, created, raw) VALUES (?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    account_id = excluded.account_id,
+                    created = excluded.created,
+                    raw = excluded.raw
+                """,
+                [(t["id"], account_id, t["created"], json.dumps(t)) for t in transactions],
+            )
+
+    def upsert_pots(self, pots):
+        with self.lock, self.db:
+            self.db.executemany(
+                """
+                INSERT INTO pots (id, account_id, raw) VALUES (?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET account_id = excluded.account_id, raw = excluded.raw
+                """,
+                [(p["id"], p.get("current_account_id"), json.dumps(p)) for p in pots],
+            )
+
+    def latest_created(self, account_id: str) -> str | None:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT MAX(created) FROM transactions WHERE account_id = ?", (account_id,)
+            ).fetchone()
+        return row[0]
+
+    def transactions(self, account_id: str, start_day: str | None = None, end_day: str | None = None):
+        """Transactions of an account created from start_day up to, not including, end_day.
+
+        Days are YYYY-MM-DD and compared with the date written in the API
+        timestamps, the same one that ends up in the CSV.
+        """
+        query = "SELECT raw FROM transactions WHERE account_id = ?"
+        params = [account_id]
+        if start_day is not None:
+            query += " AND created >= ?"
+            params.append(start_day)
+        if end_day is not None:
+            query += " AND created < ?"
+            params.append(end_day)
+        with self.lock:
+            rows = self.db.execute(query + " ORDER BY created, id", params).fetchall()
+        return [json.loads(raw) for raw, in rows]
+
+    def pots(self) -> dict[str, dict[str, Any]]:
+        with self.lock:
+            rows = self.db.execute("SELECT raw FROM pots").fetchall()
+        return {p["id"]: p for p in (json.loads(raw) for raw, in rows)}
+
+
+# Where fetched transactions and pots are also kept, set with --store
+STORE: TransactionStore | None = None
+
+
+def merge_monthly_csvs(transactions, get_pots, directory: str, name: str):
+    """Merge transactions into one CSV per month, replacing rows by Transaction ID.
+
+    get_pots() is only called for pot transfers not already named in their
+    month's file, so re-fetching synced days doesn't list the pots again.
+    """
+    rows_by_month = defaultdict(list)
+    for r in transaction_rows(transactions, None):
+        # Date is dd/mm/yyyy
+        rows_by_month[f"{r["Date"][6:10]}-{r["Date"][3:5]}"].append(r)
+
+    fieldnames = [x["key"] for x in TX_FIELDS]
+    for month, rows in sorted(rows_by_month.items()):
+        filename = os.path.join(directory, f"MonzoExport_{name}_{month}.csv")
+        merged = {}
+        if os.path.isfile(filename):
+            with open(filename, newline="", encoding="utf-8") as fh:
+                merged = {r["Transaction ID"]: r for r in csv.DictReader(fh)}
+        existing = dict(merged)
+        for r in rows:
+            r = {k: str(v) for k, v in r.items()}
+            if r["Name"].startswith("pot_"):
+                known = existing.get(r["Transaction ID"])
+                if known is not None and not known["Name"].startswith("pot_"):
+                    r["Name"] = known["Name"]
+                else:
+                    r["Name"] = get_pots()[r["Name"]]["name"]
+            merged[r["Transaction ID"]] = r
+        if merged == existing:
+            continue
+
+        with open(filename + ".tmp", "w", newline="", encoding="utf-8") as fh:
+            writer = csv.DictWriter(fh, fieldnames=fieldnames, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(merged.values())
+        os.replace(filename + ".tmp", filename)
+        print(
+            f"✅  {len(merged) - len(existing)} new transactions merged into "
+            f"{filename}",
+            file=sys.stderr,
         )
+
+
+def stream_csv(
+    token: str,
+    account: dict[str, Any],
+    pots,
+    start_date: str,
+    end_date: str | None,
+    directory: str | None,
+    name: str,
+):
+    """Write an account's transactions to CSV one page at a time.
+
+    Rows go to MonzoExport_<name>.partial.csv, next to a small JSON cursor
+    that's updated after every page. If the run is interrupted, the next run
+    for the same account and end date carries on from the cursor, unless it
+    starts earlier than the interrupted one did. Once done, the file is
+    renamed to MonzoExport_<name>_<first>_<last>.csv.
+    """
+    fieldnames = [x["key"] for x in TX_FIELDS]
+    if directory is None:
+        writer = csv.DictWriter(sys.stdout, fieldnames=fieldnames, extrasaction="ignore")
         writer.writeheader()
-        for r in rows:
-            writer.writerow(r)
-    print(f"\n✅  {len(transactions)} transactions written to {filename}")
+        count = 0
+        for page in iter_transaction_pages(token, account, start_date, end_date):
+            writer.writerows(transaction_rows(page, pots))
+            count += len(page)
+        print(f"\n✅  {count} transactions written to stdout", file=sys.stderr)
+        return
+
+    partial = os.path.join(directory, f"MonzoExport_{name}.partial.csv")
+    cursor_file = partial + ".json"
+    cursor = dict(
+        account_id=account["id"], start_date=start_date, end_date=end_date, count=0
+    )
+    mode = "w"
+    if os.path.isfile(cursor_file):
+        with open(cursor_file) as fh:
+            previous = json.load(fh)
+        # The default start date moves with the clock, a later one is still covered
+        if (
+            previous.get("account_id") == account["id"]
+            and previous["end_date"] == end_date
+            and parse_created(previous["start_date"]) <= parse_created(start_date)
+        ):
+            cursor = previous
+            mode = "a"
+            sd = parse_created(cursor["last_created"]) + timedelta(seconds=1)
+            start_date = sd.astimezone().isoformat()
+            print(
+                f"Resuming {partial} after {cursor["count"]} transactions",
+                file=sys.stderr,
+            )
+
+    with open(partial, mode, newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=fieldnames, extrasaction="ignore")
+        if mode == "w":
+            writer.writeheader()
+        for page in iter_transaction_pages(token, account, start_date, end_date):
+            writer.writerows(transaction_rows(page, pots))
+            fh.flush()
+            cursor.setdefault("first_created", page[0]["created"])
+            cursor["last_created"] = page[-1]["created"]
+            cursor["count"] += len(page)
+            with open(cursor_file + ".tmp", "w") as cfh:
+                json.dump(cursor, cfh)
+            os.replace(cursor_file + ".tmp", cursor_file)
+
+    if cursor["count"] == 0:
+        os.remove(partial)
+        return
+
+    first_date = format_created(cursor["first_created"], "%Y-%m-%d")
+    last_date = format_created(cursor["last_created"], "%Y-%m-%d")
+    filename = os.path.join(directory, f"MonzoExport_{name}_{first_date}_{last_date}.csv")
+    if os.path.exists(filename):
+        raise FileExistsError(f"{filename} already exists, {partial} was left in place")
+    os.replace(partial, filename)
+    os.remove(cursor_file)
+    print(
+        f"\n✅  {cursor["count"]} transactions written to {filename}", file=sys.stderr
+    )
+
+
+def stream_sync(
+    token: str,
+    account: dict[str, Any],
+    get_pots_once,
+    sync_state: dict[str, dict[str, str]],
+    start_date: str,
+    end_date: str | None,
+    directory: str,
+    name: str,
+):
+    """Merge new transactions into the monthly files, moving the cursor every month.
+
+    Pages are kept until the next month starts, so each month's file is only
+    rewritten once, and the cursor never moves past what was written.
+    """
+    buffered = []
+    month = None
+
+    def flush():
+        if not buffered:
+            return
+        merge_monthly_csvs(buffered, get_pots_once, directory, name)
+        with _sync_state_lock:
+            sync_state[account["id"]] = dict(
+                last_id=buffered[-1]["id"], last_created=buffered[-1]["created"]
+            )
+            save_sync_state(sync_state)
+        buffered.clear()
+
+    for page in iter_transaction_pages(token, account, start_date, end_date):
+        for t in page:
+            t_month = format_created(t["created"], "%Y-%m")
+            if t_month != month:
+                flush()
+                month = t_month
+            buffered.append(t)
+    flush()
+
+
+def export_store(
+    store: TransactionStore,
+    account_id: str,
+    start_day: str | None,
+    end_day: str | None,
+    directory: str | None,
+    name: str,
+    monthly: bool,
+):
+    """Write an account's stored transactions in the layout of a download, without the API."""
+    transactions = store.transactions(account_id, start_day, end_day)
+    pots = store.pots()
+    if directory is not None and monthly:
+        merge_monthly_csvs(transactions, lambda: pots, directory, name)
+        return
+
+    fieldnames = [x["key"] for x in TX_FIELDS]
+    if directory is None:
+        writer = csv.DictWriter(sys.stdout, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(transaction_rows(transactions, pots))
+        return
+    if not transactions:
+        return
+
+    first_date = format_created(transactions[0]["created"], "%Y-%m-%d")
+    last_date = format_created(transactions[-1]["created"], "%Y-%m-%d")
+    filename = os.path.join(directory, f"MonzoExport_{name}_{first_date}_{last_date}.csv")
+    with open(filename + ".tmp", "w", newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(transaction_rows(transactions, pots))
+    os.replace(filename + ".tmp", filename)
+    print(
+        f"✅  {len(transactions)} transactions written to {filename}", file=sys.stderr
+    )
 
 
 @click.command("txn")
@@ -287,9 +746,82 @@ def txn(txid: str|None) -> None:
 @click.option("--end-date", "end_date")
 @click.option("--save/--no-save", default=False)
 @click.option("--out-dir", "out_dir")
+@click.option(
+    "--sync/--no-sync",
+    default=False,
+    help="Fetch only what's new since the last sync and merge it into monthly files "
+    + "(MonzoExport_<account>_<YYYY-MM>.csv), instead of writing a new export",
+)
+@click.option(
+    "--sync-overlap-days",
+    "sync_overlap_days",
+    type=int,
+    default=3,
+    help="In sync mode, also re-fetch this many days before the last synced "
+    + "transaction to pick up updates to them, e.g. pending payments settling",
+)
+@click.option(
+    "--field-timings/--no-field-timings",
+    "field_timings",
+    default=False,
+    help="Print how long each CSV column took to compute",
+)
+@click.option(
+    "--store",
+    "store_file",
+    help="Also keep every fetched transaction and pot in this SQLite database, "
+    + "upserted by transaction id with the raw API JSON",
+)
+@click.option(
+    "--from-store/--from-api",
+    "from_store",
+    default=False,
+    help="Write the CSVs from the --store database instead of calling the API "
+    + "(all stored transactions unless --start-date/--end-date are given)",
+)
+@click.option(
+    "--concurrency",
+    type=int,
+    default=1,
+    help="Number of accounts and pots fetched in parallel",
+)
+@click.option(
+    "--rate-limit",
+    "rate_limit",
+    type=float,
+    default=None,
+    help="Maximum API requests per second (defaults to MONZO_RATE_LIMIT, unlimited if unset)",
+)
 def download(
-    start_date: str | None, end_date: str | None, save: bool, out_dir: str | None
+    start_date: str | None,
+    end_date: str | None,
+    save: bool,
+    out_dir: str | None,
+    rate_limit: float | None,
+    concurrency: int,
+    sync: bool,
+    sync_overlap_days: int,
+    field_timings: bool,
+    store_file: str | None,
+    from_store: bool,
 ):
+    global FIELD_TIMINGS, STORE
+    if rate_limit is not None:
+        RATE_LIMITER.rate = rate_limit
+    if field_timings:
+        FIELD_TIMINGS = {k["key"]: 0.0 for k in TX_FIELDS}
+
+    if store_file is not None:
+        STORE = TransactionStore(store_file)
+    if from_store:
+        if STORE is None:
+            sys.exit("--from-store needs a --store database")
+        for account_id, name in ACCOUNTS.items():
+            directory = None
+            if save:
+                directory = os.path.join(os.getcwd(), out_dir or "", name if out_dir else "")
+            export_store(STORE, account_id, start_date, end_date, directory, name, sync)
+        return
 
     if start_date is None:
         start_date = (dt.now(timezone.utc) - timedelta(10)).astimezone().isoformat()
@@ -308,48 +840,96 @@ def download(
         access = start_oauth()
     elif not refresh:
         sys.exit("Refresh token missing – delete .monzo_token and rerun.")
-    else:
-        # ensure token is alive
+    elif not sync:
+        # ensure token is alive (in sync mode api_get refreshes it if needed,
+        # to keep the number of calls down)
         access = refresh_access_token(refresh)
 
-    accounts = get_accounts(access)
-    pots_list = []
-    for a in accounts:
-        pots_list.extend(get_pots(access, a["id"]))
-
-    pots = {}
-    for p in pots_list:
-        pots[p["id"]] = p
-
-    for a in accounts:
-        if a["id"] in ACCOUNTS.keys():
-            txns = fetch_all_transactions(
-                access,
-                a,
-                start_date=start_date,
-                end_date=end_date,
-            )
-            if len(txns) == 0:
-                continue
-
-            first_date = parser.parse(txns[0]["created"]).strftime("%Y-%m-%d")
-            last_date = parser.parse(txns[-1]["created"]).strftime("%Y-%m-%d")
-            filename = f"MonzoExport_{ACCOUNTS[a["id"]]}_{first_date}_{last_date}.csv"
-
-            write_csv(
-                txns,
-                pots,
-                (
-                    os.path.join(
-                        os.getcwd(),
-                        out_dir if out_dir else "",
-                        ACCOUNTS[a["id"]] if out_dir else "",
-                        filename,
-                    )
-                    if save
-                    else None
-                ),
+    sync_state = {}
+    if sync:
+        # The configured accounts are all that's needed, skip listing them
+        accounts = [{"id": account_id} for account_id in ACCOUNTS.keys()]
+        sync_state = load_sync_state()
+    else:
+        accounts = get_accounts(access)
+    selected = [a for a in accounts if a["id"] in ACCOUNTS.keys()]
+
+    def since(account):
+        cursor = sync_state.get(account["id"])
+        if cursor is None and STORE is not None:
+            latest = STORE.latest_created(account["id"])
+            if latest is not None:
+                cursor = dict(last_created=latest)
+        if cursor is None:
+            return start_date
+        sd = parse_created(cursor["last_created"])
+        sd = sd + timedelta(seconds=1) - timedelta(days=sync_overlap_days)
+        return sd.astimezone().isoformat()
+
+    def output_directory(account_id):
+        return os.path.join(os.getcwd(), out_dir or "", ACCOUNTS[account_id] if out_dir else "")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if sync:
+            # Pots are only needed to name pot transfers not in the monthly files
+            # yet, so only fetch them then. Transfers can name pots of any
+            # account, e.g. a joint account's, not just the configured ones.
+            get_pots_once = functools.cache(
+                lambda: {
+                    p["id"]: p
+                    for a in get_accounts(access)
+                    for p in get_pots(access, a["id"])
+                }
             )
+            futures = [
+                pool.submit(
+                    stream_sync,
+                    access,
+                    a,
+                    get_pots_once,
+                    sync_state,
+                    since(a),
+                    end_date,
+                    output_directory(a["id"]),
+                    ACCOUNTS[a["id"]],
+                )
+                for a in selected
+            ]
+        else:
+            pots = {}
+            for pots_list in pool.map(lambda a: get_pots(access, a["id"]), accounts):
+                for p in pots_list:
+                    pots[p["id"]] = p
+
+            def export(a):
+                stream_csv(
+                    access,
+                    a,
+                    pots,
+                    start_date,
+                    end_date,
+                    output_directory(a["id"]) if save else None,
+                    ACCOUNTS[a["id"]],
+                )
+
+            if save:
+                futures = [pool.submit(export, a) for a in selected]
+            else:
+                # Accounts are written one after another so stdout isn't interleaved
+                futures = []
+                for a in selected:
+                    export(a)
+        try:
+            for f in futures:
+                f.result()
+        except BaseException:
+            # Don't start the remaining accounts, partial files can be resumed
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    if FIELD_TIMINGS is not None:
+        for key, elapsed in FIELD_TIMINGS.items():
+            print(f"{key:<16} {elapsed:8.3f}s", file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# pull_monzo.py is a standalone script next to the package, not installed with it
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
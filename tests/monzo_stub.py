@@ -0,0 +1,197 @@
+"""A local stand-in for the parts of the Monzo API pull_monzo uses."""
+
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+def timestamp(moment):
+    return moment.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def make_transactions(account_id, count, start=None, step=timedelta(hours=1)):
+    """Settled card payments, one every step from start."""
+    start = start or datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        dict(
+            id=f"tx_{account_id}_{i:07d}",
+            created=timestamp(start + i * step),
+            amount=-(100 + i % 5000),
+            currency="GBP",
+            description=f"SHOP {i % 300}",
+            notes="",
+            metadata={},
+            merchant=dict(name=f"Shop {i % 300}"),
+            counterparty={},
+            category="eating_out",
+        )
+        for i in range(count)
+    ]
+
+
+def pot_transfer(account_id, pot_id, created, amount=-500):
+    return dict(
+        id=f"tx_{account_id}_{pot_id}_{created}",
+        created=created,
+        amount=amount,
+        currency="GBP",
+        description=pot_id,
+        notes="",
+        metadata=dict(pot_id=pot_id),
+        merchant=None,
+        counterparty={},
+        category="savings",
+    )
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.stub.handle(self, "GET")
+
+    def do_POST(self):
+        self.server.stub.handle(self, "POST")
+
+
+class MonzoStub:
+    """Serves accounts, pots and transactions, with scripted failures and latency.
+
+    Refresh tokens are single use like Monzo's: exchanging one rotates both
+    tokens, and requests with an old access token get a 401.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.accounts = []
+        # account id -> pots / transactions
+        self.pots = defaultdict(list)
+        self.transactions = defaultdict(list)
+        self.created = defaultdict(list)
+        self.tokens = 0
+        self.access_token = "access-0"
+        self.refresh_token = "refresh-0"
+        # path -> statuses to answer with before serving it normally
+        self.failures = defaultdict(list)
+        # Delay before answering a token exchange, after it took effect
+        self.token_delay = 0.0
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_account(self, account_id, transactions=(), pots=()):
+        self.accounts.append(dict(id=account_id, closed=False))
+        self.pots[account_id].extend(pots)
+        self.add_transactions(account_id, transactions)
+
+    def add_transactions(self, account_id, transactions):
+        listed = self.transactions[account_id]
+        listed.extend(transactions)
+        listed.sort(key=lambda t: parse_time(t["created"]))
+        self.created[account_id] = [parse_time(t["created"]) for t in listed]
+
+    def fail(self, path, *statuses):
+        self.failures[path].extend(statuses)
+
+    def count(self, method, path):
+        return self.requests.count((method, path))
+
+    def handle(self, request, method):
+        url = urlparse(request.path)
+        query = parse_qs(url.query)
+        with self.lock:
+            self.requests.append((method, url.path))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            failures = self.failures[url.path]
+            failure = failures.pop(0) if failures else None
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if failure is not None:
+                headers = {"Retry-After": "0"}
+                return self.respond(request, failure, dict(error="scripted"), headers)
+            if method == "POST":
+                length = int(request.headers.get("Content-Length") or 0)
+                form = parse_qs(request.rfile.read(length).decode())
+                return self.exchange_token(request, form)
+            if request.headers.get("Authorization") != f"Bearer {self.access_token}":
+                error = dict(code="unauthorized.bad_access_token")
+                return self.respond(request, 401, error)
+            if url.path == "/accounts":
+                return self.respond(request, 200, dict(accounts=self.accounts))
+            if url.path == "/pots":
+                pots = self.pots[query["current_account_id"][0]]
+                return self.respond(request, 200, dict(pots=pots))
+            if url.path == "/transactions":
+                page = self.list_transactions(query)
+                return self.respond(request, 200, dict(transactions=page))
+            return self.respond(request, 404, dict(code="not_found"))
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def exchange_token(self, request, form):
+        with self.lock:
+            if form.get("refresh_token") != [self.refresh_token]:
+                error = dict(code="unauthorized.bad_refresh_token")
+                return self.respond(request, 401, error)
+            self.tokens += 1
+            self.access_token = f"access-{self.tokens}"
+            self.refresh_token = f"refresh-{self.tokens}"
+            tokens = dict(
+                access_token=self.access_token, refresh_token=self.refresh_token
+            )
+        if self.token_delay:
+            time.sleep(self.token_delay)
+        return self.respond(request, 200, tokens)
+
+    def list_transactions(self, query):
+        since = parse_time(query["since"][0])
+        before = parse_time(query["before"][0]) if "before" in query else None
+        limit = int(query.get("limit", ["100"])[0])
+        account_id = query["account_id"][0]
+        created = self.created[account_id]
+        start = bisect_left(created, since)
+        end = len(created) if before is None else bisect_left(created, before)
+        return self.transactions[account_id][start:min(end, start + limit)]
+
+    def respond(self, request, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        try:
+            request.send_response(status)
+            request.send_header("Content-Type", "application/json")
+            request.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                request.send_header(name, value)
+            request.end_headers()
+            request.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting
+            pass
@@ -0,0 +1,54 @@
+import datetime
+
+from beancount.core import data
+from beancount.core.amount import Amount
+from beancount.core.number import D
+
+from beancount_importers.bank_classifier import REFUND_WINDOW, filter_refunds
+
+REFUND_DAY = datetime.date(2024, 3, 31)
+
+
+def transaction(date, amount, other):
+    units = Amount(D(amount), "GBP")
+    return data.Transaction(
+        data.new_metadata("statement.csv", 0),
+        date,
+        "*",
+        None,
+        "",
+        data.EMPTY_SET,
+        data.EMPTY_SET,
+        [
+            data.Posting("Assets:Monzo:Cash", units, None, None, None, None),
+            data.Posting(other, -units, None, None, None, None),
+        ],
+    )
+
+
+def skipped(entries):
+    return [entry for entry in entries if "skip_transaction" in entry.meta]
+
+
+def test_refund_skips_the_earliest_expense_inside_the_window():
+    window_start = REFUND_DAY - REFUND_WINDOW
+    too_old = transaction(window_start, "-20", "Expenses:Shopping")
+    day_after = window_start + datetime.timedelta(1)
+    first = transaction(day_after, "-20", "Expenses:Shopping")
+    second = transaction(REFUND_DAY - datetime.timedelta(1), "-20", "Expenses:Shopping")
+    refund = transaction(REFUND_DAY, "20", "Expenses:Unclassified")
+    entries = filter_refunds([too_old, first, second, refund])
+    assert skipped(entries) == [first, refund]
+
+
+def test_refund_prefers_the_expense_seen_first_when_out_of_order():
+    late = transaction(REFUND_DAY - datetime.timedelta(2), "-20", "Expenses:Shopping")
+    early = transaction(REFUND_DAY - datetime.timedelta(5), "-20", "Expenses:Shopping")
+    refund = transaction(REFUND_DAY, "20", "Expenses:Unclassified")
+    assert skipped(filter_refunds([late, early, refund])) == [late, refund]
+
+
+def test_refund_outside_the_window_is_kept():
+    expense = transaction(REFUND_DAY - REFUND_WINDOW, "-20", "Expenses:Shopping")
+    refund = transaction(REFUND_DAY, "20", "Expenses:Unclassified")
+    assert skipped(filter_refunds([expense, refund])) == []
@@ -0,0 +1,30 @@
+from importlib.metadata import EntryPoint, EntryPoints
+
+import pytest
+
+from beancount_importers import beancount_import_run
+
+GROUP = beancount_import_run.IMPORTERS_ENTRY_POINT_GROUP
+
+
+def get_importer(account, currency, importer_params):
+    return (account, currency, importer_params)
+
+
+ENTRY_POINT = EntryPoint("mybank", f"{__name__}:get_importer", GROUP)
+
+
+@pytest.mark.parametrize(
+    "discovered",
+    [
+        EntryPoints([ENTRY_POINT]),
+        # What entry_points() returns before Python 3.10
+        {GROUP: (ENTRY_POINT,), "console_scripts": ()},
+    ],
+)
+def test_plugin_importers_are_found(monkeypatch, discovered):
+    monkeypatch.setattr(beancount_import_run, "entry_points", lambda: discovered)
+    source = beancount_import_run.plugin_source("mybank")
+    config = source("mybank", "Assets:MyBank", "GBP", {}, None, None)
+    assert config["importer"] == ("Assets:MyBank", "GBP", {})
+    assert beancount_import_run.plugin_source("otherbank") is None
@@ -0,0 +1,65 @@
+from beangulp.importers import csvbase
+from beangulp.importers.csvbase import Amount, Column, CSVReader, Date
+
+from beancount_importers.columnar import read_columns
+
+# Nationwide's layout: account details and a blank line before the column names
+NATIONWIDE = """\
+"Account Name:","FlexDirect ****12345"
+"Account Balance:","£1,234.56"
+"Available Balance: ","£1,234.56"
+
+"Date","Transaction type","Description","Paid out","Paid in","Balance"
+"01 Mar 2024","Contactless Payment","TESCO STORES","£12.30","","£1,222.26"
+"02 Mar 2024","Direct debit","O2","£20.00","","£1,202.26"
+
+"03 Mar 2024","Bank credit","SALARY","","£2,000.00","£3,202.26"
+"""
+
+
+class NationwideShaped(CSVReader):
+    date = Date(0, frmt="%d %b %Y")
+    tx_type = Column(1)
+    narration = Column("Description")
+    paid_out = Column(3)
+    paid_in = Column(4)
+    balance = Amount(5, subs={"[^\\d.]": ""})
+
+    encoding = "iso-8859-1"
+    # Both spellings, whichever the installed beangulp reads
+    skiplines = 4
+    header = 4
+    names = True
+
+
+def write(tmp_path, text, name="statement.csv"):
+    filepath = tmp_path / name
+    filepath.write_text(text, encoding="iso-8859-1")
+    return str(filepath)
+
+
+def test_reads_the_same_values_as_csvreader(tmp_path):
+    filepath = write(tmp_path, NATIONWIDE)
+    reader = NationwideShaped()
+    columns = read_columns(reader, filepath)
+    rows = [row for row in reader.read(filepath) if row]
+    for name in reader.columns:
+        assert columns[name] == [getattr(row, name) for row in rows]
+    assert columns["narration"] == ["TESCO STORES", "O2", "SALARY"]
+    # Line numbers count the preamble, the column names and the blank line
+    assert columns["lineno"] == [6, 7, 9]
+
+
+def test_footer_lines_are_left_out(tmp_path, monkeypatch):
+    # What beangulp versions with header and footer do
+    monkeypatch.setattr(csvbase.CSVReader, "header", 0, raising=False)
+    footer = '"Closing balance","£3,202.26"\n'
+    filepath = write(tmp_path, NATIONWIDE + footer)
+
+    reader = NationwideShaped()
+    reader.footer = 1
+    columns = read_columns(reader, filepath)
+    plain = write(tmp_path, NATIONWIDE, "plain.csv")
+    expected = read_columns(NationwideShaped(), plain)
+    assert columns == expected
+    assert columns["narration"] == ["TESCO STORES", "O2", "SALARY"]
@@ -0,0 +1,130 @@
+from collections import defaultdict
+import os
+import types
+
+import pytest
+
+from beancount_importers import extract_cache
+from beancount_importers.extract_cache import CachedImporter
+
+
+class LineImporter:
+    """Extracts the lines of a file, counting the files it reads."""
+
+    def __init__(self):
+        self.extracted = []
+
+    def extract(self, filepath, existing):
+        self.extracted.append(os.path.basename(filepath))
+        with open(filepath, "r") as fh:
+            return fh.read().splitlines()
+
+
+@pytest.fixture
+def run(monkeypatch):
+    """Starts a new process as far as the cache is concerned."""
+
+    def run():
+        monkeypatch.setattr(extract_cache, "USED", defaultdict(set))
+
+    run()
+    return run
+
+
+def write(filename, text):
+    with open(filename, "w") as fh:
+        fh.write(text)
+
+
+def cached(cache_dir, currency="GBP"):
+    importer = LineImporter()
+    wrapped = CachedImporter(importer, cache_dir, "lines", "Assets:Cash", currency, {})
+    return importer, wrapped
+
+
+def cache_files(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir) if name.endswith(".pickle"))
+
+
+def test_unchanged_files_are_read_from_the_cache(tmp_path, run):
+    cache_dir = str(tmp_path / "cache")
+    statement = str(tmp_path / "march.csv")
+    write(statement, "a\nb\n")
+    importer, wrapped = cached(cache_dir)
+    assert wrapped.extract(statement, []) == ["a", "b"]
+
+    run()
+    importer, wrapped = cached(cache_dir)
+    assert wrapped.extract(statement, []) == ["a", "b"]
+    assert importer.extracted == []
+
+
+def test_prune_drops_entries_the_run_did_not_use(tmp_path, run):
+    cache_dir = str(tmp_path / "cache")
+    march = str(tmp_path / "march.csv")
+    april = str(tmp_path / "april.csv")
+    deleted = str(tmp_path / "deleted.csv")
+    write(march, "a\n")
+    write(april, "b\n")
+    write(deleted, "c\n")
+    _, gbp = cached(cache_dir)
+    _, eur = cached(cache_dir, "EUR")
+    for statement in [march, april, deleted]:
+        gbp.extract(statement, [])
+    eur.extract(march, [])
+    assert len(cache_files(cache_dir)) == 4
+
+    run()
+    write(april, "b\nc\n")
+    os.remove(deleted)
+    _, gbp = cached(cache_dir)
+    _, eur = cached(cache_dir, "EUR")
+    gbp.extract(march, [])
+    gbp.extract(april, [])
+    eur.extract(march, [])
+    kept = set(extract_cache.USED[cache_dir])
+    extract_cache.prune(cache_dir)
+    assert set(cache_files(cache_dir)) == kept
+    assert len(kept) == 3
+
+    # The remaining entries are still hits
+    run()
+    importer, gbp = cached(cache_dir)
+    assert gbp.extract(april, []) == ["b", "c"]
+    assert importer.extracted == []
+
+
+def test_prune_keeps_other_caches(tmp_path, run):
+    cache_dir = tmp_path / "cache"
+    (cache_dir / "ledger").mkdir(parents=True)
+    write(str(cache_dir / "imported_ids.json"), "{}")
+    extract_cache.prune(str(cache_dir))
+    assert sorted(os.listdir(cache_dir)) == ["imported_ids.json", "ledger"]
+
+
+def test_editing_a_shared_module_invalidates_the_cache(tmp_path, run, monkeypatch):
+    module_file = tmp_path / "engine.py"
+    module_file.write_text("RULES = 1\n")
+    engine = types.SimpleNamespace(__file__=str(module_file))
+    modules = extract_cache.EXTRACTING_MODULES + (engine,)
+    monkeypatch.setattr(extract_cache, "EXTRACTING_MODULES", modules)
+    cache_dir = str(tmp_path / "cache")
+    statement = str(tmp_path / "march.csv")
+    write(statement, "a\n")
+    importer, wrapped = cached(cache_dir)
+    wrapped.extract(statement, [])
+
+    run()
+    module_file.write_text("RULES = 2\n")
+    importer, wrapped = cached(cache_dir)
+    assert wrapped.extract(statement, []) == ["a"]
+    assert importer.extracted == ["march.csv"]
+
+
+def test_parsing_and_rule_modules_are_part_of_the_key():
+    names = {module.__name__ for module in extract_cache.EXTRACTING_MODULES}
+    assert {
+        "beancount_importers.rules",
+        "beancount_importers.batch_categorize",
+        "beancount_importers.columnar",
+    } <= names
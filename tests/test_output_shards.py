@@ -0,0 +1,104 @@
+import datetime
+import os
+
+from beancount import loader
+from beancount.core import data
+from beancount.core.amount import Amount
+from beancount.core.number import D
+
+from beancount_importers.output_shards import (
+    ShardedEntryFileSelector,
+    output_options,
+    write_index,
+)
+
+MONZO = "Assets:Monzo:Cash"
+
+
+def selector(options):
+    return ShardedEntryFileSelector(
+        default_map=options["transaction_output_map"],
+        open_map=options["open_account_output_map"],
+        balance_map=options["balance_account_output_map"],
+        price_output=options["price_output"],
+        default_output=options["default_output"],
+    )
+
+
+def balance(account, date=datetime.date(2024, 3, 5)):
+    meta = data.new_metadata("statement.csv", 0)
+    return data.Balance(meta, date, account, Amount(D("10"), "GBP"), None, None)
+
+
+def transaction(account, date=datetime.date(2024, 3, 5)):
+    units = Amount(D("-10"), "GBP")
+    return data.Transaction(
+        data.new_metadata("statement.csv", 0),
+        date,
+        "*",
+        None,
+        "Coffee",
+        data.EMPTY_SET,
+        data.EMPTY_SET,
+        [
+            data.Posting(account, units, None, None, None, None),
+            data.Posting("Expenses:FIXME", -units, None, None, None, None),
+        ],
+    )
+
+
+def test_unsharded_output_goes_where_it_always_did(tmp_path):
+    out = str(tmp_path)
+    default_output = os.path.join(out, "transactions.bean")
+    options, files, includes = output_options(out, default_output, [MONZO])
+    select = selector(options)
+    assert select(transaction(MONZO)) == os.path.join(out, "transactions.bean")
+    assert select(balance(MONZO)) == os.path.join(out, "balance_accounts.bean")
+    assert os.path.join(out, "transactions*.bean") in includes
+    assert os.path.join(out, "balances*.bean") not in includes
+
+
+def test_period_shards_balances_without_shard_by_source(tmp_path):
+    out = str(tmp_path)
+    options, files, includes = output_options(
+        out, os.path.join(out, "transactions.bean"), [MONZO], period="month"
+    )
+    select = selector(options)
+    assert select(transaction(MONZO)) == os.path.join(out, "transactions-2024-03.bean")
+    assert select(balance(MONZO)) == os.path.join(out, "balances-2024-03.bean")
+    assert os.path.isfile(os.path.join(out, "balances-2024-03.bean"))
+    # The glob must match a file even before the first balance is written
+    assert os.path.join(out, "balances.bean") in files
+    assert os.path.join(out, "balances*.bean") in includes
+
+
+def test_shard_by_source_and_period(tmp_path):
+    out = str(tmp_path)
+    options, files, includes = output_options(
+        out, os.path.join(out, "transactions.bean"), [MONZO, MONZO], True, "year"
+    )
+    monzo = os.path.join(out, "Assets-Monzo-Cash")
+    select = selector(options)
+    assert select(transaction(MONZO)) == os.path.join(monzo, "transactions-2024.bean")
+    assert select(balance(MONZO)) == os.path.join(monzo, "balances-2024.bean")
+    wise = balance("Assets:Wise:Cash")
+    assert select(wise) == os.path.join(out, "balances-2024.bean")
+    meta = data.new_metadata("statement.csv", 0)
+    open_entry = data.Open(meta, datetime.date(2024, 1, 1), MONZO, None, None)
+    assert select(open_entry) == os.path.join(monzo, "accounts.bean")
+    assert includes.count(os.path.join(monzo, "transactions*.bean")) == 1
+    assert os.path.join(monzo, "balances.bean") in files
+
+
+def test_index_globs_match_created_files(tmp_path):
+    out = str(tmp_path)
+    options, files, includes = output_options(
+        out, os.path.join(out, "transactions.bean"), [MONZO], True, "month"
+    )
+    for filename in files:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        open(filename, "w").close()
+    index = os.path.join(out, "index.bean")
+    write_index(index, includes)
+    _, errors, _ = loader.load_file(index)
+    assert errors == []
@@ -0,0 +1,291 @@
+from concurrent.futures import ThreadPoolExecutor
+import csv
+from datetime import datetime, timedelta, timezone
+import glob
+import io
+import os
+import socket
+import sys
+import tracemalloc
+
+import pytest
+import requests
+
+from monzo_stub import MonzoStub, make_transactions, pot_transfer, timestamp
+
+if sys.version_info < (3, 12):
+    pytest.skip("pull_monzo.py needs Python 3.12", allow_module_level=True)
+
+import pull_monzo  # noqa: E402
+
+START = "2023-12-01T00:00:00+00:00"
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    with MonzoStub() as stub:
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(pull_monzo, "API_ROOT", stub.url)
+        monkeypatch.setattr(pull_monzo, "BACKOFF_SECONDS", 0.01)
+        monkeypatch.setattr(pull_monzo, "ACCOUNTS", {})
+        monkeypatch.setattr(pull_monzo, "STORE", None)
+        monkeypatch.setattr(pull_monzo, "_access_token", None)
+        pull_monzo.save_tokens(stub.access_token, stub.refresh_token)
+        yield stub
+
+
+def test_get_is_retried_on_rate_limit_and_server_errors(stub):
+    stub.add_account("acc_1")
+    stub.fail("/accounts", 429, 503)
+    accounts = pull_monzo.get_accounts(stub.access_token)
+    assert [a["id"] for a in accounts] == ["acc_1"]
+    assert stub.count("GET", "/accounts") == 3
+
+
+def test_get_gives_up_after_max_retries(stub, monkeypatch):
+    monkeypatch.setattr(pull_monzo, "MAX_RETRIES", 2)
+    stub.fail("/accounts", 500, 500, 500, 500)
+    with pytest.raises(requests.HTTPError):
+        pull_monzo.get_accounts(stub.access_token)
+    assert stub.count("GET", "/accounts") == 3
+
+
+def test_refresh_is_not_retried_on_server_error(stub):
+    stub.fail("/oauth2/token", 503)
+    with pytest.raises(requests.HTTPError):
+        pull_monzo.refresh_access_token("refresh-0")
+    assert stub.count("POST", "/oauth2/token") == 1
+
+
+def test_refresh_timing_out_is_not_sent_again(stub, monkeypatch):
+    # The API used up the refresh token, resending it would lose the session
+    monkeypatch.setattr(pull_monzo, "REQUEST_TIMEOUT", 0.2)
+    stub.token_delay = 1.0
+    with pytest.raises(requests.Timeout):
+        pull_monzo.refresh_access_token("refresh-0")
+    assert stub.count("POST", "/oauth2/token") == 1
+
+
+def test_refresh_is_retried_when_it_cannot_connect(monkeypatch):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    attempts = []
+    monkeypatch.setattr(pull_monzo, "API_ROOT", f"http://127.0.0.1:{port}/")
+    monkeypatch.setattr(pull_monzo, "BACKOFF_SECONDS", 0.01)
+    monkeypatch.setattr(pull_monzo, "MAX_RETRIES", 2)
+    monkeypatch.setattr(pull_monzo.RATE_LIMITER, "wait", lambda: attempts.append(1))
+    with pytest.raises(requests.ConnectionError):
+        pull_monzo.refresh_access_token("refresh-0")
+    assert len(attempts) == 3
+
+
+def test_expired_token_is_refreshed_once_for_all_callers(stub):
+    stub.add_account("acc_1", make_transactions("acc_1", 3))
+    # Expire the token the client has
+    stub.access_token = "access-expired"
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        calls = [pool.submit(pull_monzo.get_accounts, "access-0") for _ in range(4)]
+        results = [call.result() for call in calls]
+    assert all([a["id"] for a in accounts] == ["acc_1"] for accounts in results)
+    assert stub.count("POST", "/oauth2/token") == 1
+    assert pull_monzo.load_tokens() == ("access-1", "refresh-1")
+
+
+def read_csv(filename):
+    with open(filename, newline="", encoding="utf-8") as fh:
+        return list(csv.DictReader(fh))
+
+
+def exports(directory, pattern="MonzoExport_*.csv"):
+    return sorted(glob.glob(os.path.join(directory, pattern)))
+
+
+def download(stub, directory=None, start_date=START):
+    pull_monzo.stream_csv(
+        stub.access_token, dict(id="acc_1"), {}, start_date, None, directory, "main"
+    )
+
+
+def test_stdout_only_gets_the_csv(stub, capsys):
+    stub.add_account("acc_1", make_transactions("acc_1", 250))
+    download(stub)
+    out, err = capsys.readouterr()
+    assert len(list(csv.DictReader(io.StringIO(out)))) == 250
+    assert "Got 100 transactions" in err
+    assert "250 transactions written to stdout" in err
+
+
+def test_interrupted_download_resumes_with_a_later_start(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(pull_monzo, "MAX_RETRIES", 0)
+    stub.add_account("acc_1", make_transactions("acc_1", 250))
+    stub.fail("/transactions", None, None, 500)
+    with pytest.raises(requests.HTTPError):
+        download(stub, str(tmp_path))
+
+    # Without --start-date the next run starts later, the partial file covers that
+    download(stub, str(tmp_path), "2023-12-05T00:00:00+00:00")
+    assert stub.count("GET", "/transactions") == 3 + 2
+    [filename] = exports(str(tmp_path))
+    rows = read_csv(filename)
+    assert len({r["Transaction ID"] for r in rows}) == len(rows) == 250
+
+
+def test_download_starting_earlier_starts_over(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(pull_monzo, "MAX_RETRIES", 0)
+    stub.add_account("acc_1", make_transactions("acc_1", 250))
+    stub.fail("/transactions", None, 500)
+    with pytest.raises(requests.HTTPError):
+        download(stub, str(tmp_path), "2024-01-03T00:00:00+00:00")
+
+    download(stub, str(tmp_path))
+    [filename] = exports(str(tmp_path))
+    rows = read_csv(filename)
+    assert len({r["Transaction ID"] for r in rows}) == len(rows) == 250
+
+
+def test_download_memory_does_not_grow_with_transactions(stub, tmp_path):
+    count = 20000
+    step = timedelta(minutes=5)
+    stub.add_account("acc_1", make_transactions("acc_1", count, step=step))
+    account = dict(id="acc_1")
+    tracemalloc.start()
+    try:
+        pages = pull_monzo.iter_transaction_pages(stub.access_token, account, START)
+        pages = list(pages)
+        _, holding_all = tracemalloc.get_traced_memory()
+        del pages
+        tracemalloc.reset_peak()
+        download(stub, str(tmp_path))
+        _, streaming = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    [filename] = exports(str(tmp_path))
+    assert len(read_csv(filename)) == count
+    assert streaming < holding_all / 10
+
+
+def sync(stub, directory, state, start_date=START):
+    account = dict(id="acc_1")
+    pull_monzo.stream_sync(
+        stub.access_token, account, dict, state, start_date, None, directory, "main"
+    )
+
+
+def test_sync_writes_each_month_once(stub, tmp_path, monkeypatch):
+    # 12 a day from January 1st to March 24th
+    transactions = make_transactions("acc_1", 1000, step=timedelta(hours=2))
+    stub.add_account("acc_1", transactions)
+    merged = []
+    merge = pull_monzo.merge_monthly_csvs
+
+    def counted_merge(transactions, *args):
+        merged.append(len(transactions))
+        return merge(transactions, *args)
+
+    monkeypatch.setattr(pull_monzo, "merge_monthly_csvs", counted_merge)
+    state = {}
+    sync(stub, str(tmp_path), state)
+    assert merged == [372, 348, 280]
+    assert [len(read_csv(f)) for f in exports(str(tmp_path))] == [372, 348, 280]
+    assert state["acc_1"]["last_created"] == transactions[-1]["created"]
+    assert pull_monzo.load_sync_state() == state
+
+
+def test_interrupted_sync_only_moves_past_written_months(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(pull_monzo, "MAX_RETRIES", 0)
+    transactions = make_transactions("acc_1", 1000, step=timedelta(hours=2))
+    stub.add_account("acc_1", transactions)
+    # Fails in the middle of February
+    stub.fail("/transactions", None, None, None, None, None, 500)
+    state = {}
+    with pytest.raises(requests.HTTPError):
+        sync(stub, str(tmp_path), state)
+    assert state["acc_1"]["last_created"] == transactions[371]["created"]
+    assert len(exports(str(tmp_path))) == 1
+
+    last_created = pull_monzo.parse_created(state["acc_1"]["last_created"])
+    resumed = last_created + timedelta(seconds=1)
+    sync(stub, str(tmp_path), state, resumed.isoformat())
+    assert [len(read_csv(f)) for f in exports(str(tmp_path))] == [372, 348, 280]
+
+
+def run(*args):
+    pull_monzo.download.main(list(args), standalone_mode=False)
+
+
+def test_sync_names_pots_of_accounts_it_does_not_export(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(pull_monzo, "ACCOUNTS", {"acc_1": "main"})
+    created = timestamp(datetime(2024, 1, 2, tzinfo=timezone.utc))
+    stub.add_account("acc_1", [pot_transfer("acc_1", "pot_joint", created)])
+    stub.add_account("acc_joint", pots=[dict(id="pot_joint", name="Holiday")])
+    run("--sync", "--start-date", "2024-01-01")
+    [row] = read_csv(tmp_path / "MonzoExport_main_2024-01.csv")
+    assert row["Name"] == "Holiday"
+    assert stub.count("GET", "/pots") == 2
+
+
+def test_sync_only_lists_pots_for_new_pot_transfers(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(pull_monzo, "ACCOUNTS", {"acc_1": "main"})
+    created = timestamp(datetime(2024, 1, 2, tzinfo=timezone.utc))
+    noon = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+    transactions = make_transactions("acc_1", 10, start=noon)
+    transactions.append(pot_transfer("acc_1", "pot_1", created))
+    pots = [dict(id="pot_1", name="Rainy day"), dict(id="pot_2", name="Holiday")]
+    stub.add_account("acc_1", transactions, pots)
+    run("--sync", "--start-date", "2024-01-01")
+    assert stub.count("GET", "/pots") == 1
+
+    # The overlap fetches the same days again, their pots are already named
+    run("--sync")
+    assert stub.count("GET", "/transactions") == 4
+    assert stub.count("GET", "/accounts") == 1
+    assert stub.count("GET", "/pots") == 1
+
+    later = timestamp(datetime(2024, 1, 3, tzinfo=timezone.utc))
+    stub.add_transactions("acc_1", [pot_transfer("acc_1", "pot_2", later)])
+    run("--sync")
+    assert stub.count("GET", "/pots") == 2
+    rows = read_csv(tmp_path / "MonzoExport_main_2024-01.csv")
+    assert [r["Name"] for r in rows if r["Category"] == "Savings"] == [
+        "Rainy day",
+        "Holiday",
+    ]
+
+
+def test_sync_picks_up_recent_transactions_changing(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(pull_monzo, "ACCOUNTS", {"acc_1": "main"})
+    transactions = make_transactions("acc_1", 48)
+    stub.add_account("acc_1", transactions)
+    run("--sync", "--start-date", "2024-01-01")
+    # A pending payment settles for a different amount a few hours later
+    transactions[40]["amount"] = -1234
+    run("--sync")
+    rows = read_csv(tmp_path / "MonzoExport_main_2024-01.csv")
+    assert len(rows) == 48
+    assert rows[40]["Amount"] == "-12.34"
+
+
+def download_all(directory, *args):
+    for name in pull_monzo.ACCOUNTS.values():
+        os.makedirs(os.path.join(directory, name))
+    run("--save", "--out-dir", directory, "--start-date", "2024-01-01", *args)
+
+
+def test_accounts_are_fetched_concurrently(stub, tmp_path, monkeypatch):
+    # How much faster that is: python -m beancount_importers.benchmark monzo
+    ids = [f"acc_{i}" for i in range(4)]
+    monkeypatch.setattr(pull_monzo, "ACCOUNTS", {i: f"main_{i}" for i in ids})
+    for account_id in ids:
+        pots = [dict(id=f"pot_{account_id}", name="Savings")]
+        stub.add_account(account_id, make_transactions(account_id, 150), pots)
+    stub.latency = 0.05
+
+    download_all("sequential", "--concurrency", "1")
+    assert stub.max_active == 1
+    stub.max_active = 0
+    download_all("parallel", "--concurrency", "4")
+    assert 1 < stub.max_active <= 4
+    for account_id, name in pull_monzo.ACCOUNTS.items():
+        [filename] = exports(str(tmp_path / "parallel" / name))
+        assert len(read_csv(filename)) == 150
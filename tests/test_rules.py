@@ -0,0 +1,162 @@
+from decimal import Decimal
+import re
+
+import pytest
+
+from beancount_importers.rules import (
+    LiteralMatcher,
+    RegexIndex,
+    RuleSet,
+    literal_prefix,
+)
+
+
+def test_first_rule_in_config_order_wins_across_indexes():
+    rules = RuleSet(
+        [
+            dict(payee_regex="COFFEE", account="Expenses:Regex"),
+            dict(payee_prefix="COFFEE", account="Expenses:Prefix"),
+            dict(payee="COFFEE SHOP", account="Expenses:Exact"),
+            dict(min_amount=0, account="Income:Unknown"),
+        ]
+    )
+    assert rules.match("COFFEE SHOP", "", Decimal("-3")) == "Expenses:Regex"
+    rules = RuleSet(
+        [
+            dict(payee="COFFEE SHOP", account="Expenses:Exact"),
+            dict(payee_regex="COFFEE", account="Expenses:Regex"),
+        ]
+    )
+    assert rules.match("COFFEE SHOP", "", Decimal("-3")) == "Expenses:Exact"
+    assert rules.match("MY COFFEE", "", Decimal("-3")) == "Expenses:Regex"
+
+
+def test_amount_only_rule_keeps_its_place():
+    rules = RuleSet(
+        [
+            dict(max_amount=-1000, account="Expenses:Large"),
+            dict(payee="RENT", account="Expenses:Rent"),
+        ]
+    )
+    assert rules.match("RENT", "", Decimal("-1200")) == "Expenses:Large"
+    assert rules.match("RENT", "", Decimal("-900")) == "Expenses:Rent"
+
+
+def test_all_conditions_must_hold():
+    rule = dict(payee="TFL", sign="negative", narration_prefix="Bus", account="A")
+    rules = RuleSet([rule])
+    assert rules.match("TFL", "Bus fare", Decimal("-2")) == "A"
+    assert rules.match("TFL", "Bus fare", Decimal("2")) is None
+    assert rules.match("TFL", "Tube fare", Decimal("-2")) is None
+
+
+@pytest.mark.parametrize(
+    "regex, matching, other",
+    [
+        ("^AMZN", "AMZN MKTP", "PAY AMZN"),
+        ("MKTP$", "AMZN MKTP", "AMZN MKTP UK"),
+        (r"\bUBER\b", "UBER TRIP", "UBERX"),
+        ("^SPOTIFY$", "SPOTIFY", "SPOTIFY P1"),
+    ],
+)
+def test_anchors(regex, matching, other):
+    rules = RuleSet([dict(payee_regex=regex, account="A")])
+    assert rules.match(matching, "", Decimal("-1")) == "A"
+    assert rules.match(other, "", Decimal("-1")) is None
+
+
+def test_case_insensitive_regex_matches_any_case():
+    rules = RuleSet([dict(narration_regex="(?i)netflix", account="A")])
+    for narration in ["NETFLIX.COM", "Netflix", "paid netflix"]:
+        assert rules.match("", narration, Decimal("-9")) == "A"
+
+
+@pytest.mark.parametrize(
+    "regex, matching",
+    [
+        (r"\d{4} CARD", "1234 CARD"),
+        ("[Cc]afe", "cafe nero"),
+        ("(GREGGS|PRET)", "PRET A MANGER"),
+        ("GREGGS|PRET", "PRET A MANGER"),
+        ("x?PRET", "PRET A MANGER"),
+        (".*", "anything"),
+    ],
+)
+def test_regexes_without_a_literal_prefix_are_always_searched(regex, matching):
+    rules = RuleSet([dict(payee_regex=regex, account="A")])
+    assert rules.match(matching, "", Decimal("-1")) == "A"
+    assert rules.match_batch([matching], [""], [Decimal("-1")]) == ["A"]
+
+
+@pytest.mark.parametrize(
+    "regex, literal",
+    [
+        ("COFFEE", "COFFEE"),
+        ("^COFFEE", "COFFEE"),
+        ("COFFEE$", "COFFEE"),
+        ("COFFEE.*", "COFFEE"),
+        ("COFFEES?", "COFFEE"),
+        ("COFFEE+", "COFFEE"),
+        (r"WWW\.SHOP", "WWW.SHOP"),
+        (r"A\|B", "A|B"),
+        (r"A\\|B", ""),
+        ("A|B", ""),
+        (r"\bCOFFEE", ""),
+        ("(?i)COFFEE", ""),
+        ("[A-Z]+", ""),
+    ],
+)
+def test_literal_prefix(regex, literal):
+    assert literal_prefix(re.compile(regex)) == literal
+
+
+def test_literal_prefix_ignores_patterns_compiled_with_flags():
+    assert literal_prefix(re.compile("COFFEE", re.IGNORECASE)) == ""
+
+
+def test_literal_matcher_finds_overlapping_literals():
+    matcher = LiteralMatcher({"he": [0], "she": [1], "his": [2], "hers": [3]})
+    assert matcher.find("ushers") == {0, 1, 3}
+    assert matcher.find("this") == {2}
+    assert matcher.find("nothing") == set()
+
+
+def test_regex_index_candidates():
+    index = RegexIndex([(0, re.compile("^PRET")), (1, re.compile("(?i)greggs"))])
+    assert index.candidates("PRET A MANGER") == {0, 1}
+    assert index.candidates("TESCO") == {1}
+
+
+def test_match_batch_agrees_with_match():
+    rules = RuleSet(
+        [
+            dict(id=42, account="Expenses:Known"),
+            dict(payee_regex="^TESCO", account="Expenses:Groceries"),
+            dict(narration_regex="(?i)refund", sign="positive", account="Income:Back"),
+            dict(payee_prefix="TFL", account="Expenses:Transport"),
+        ]
+    )
+    payees = ["TESCO STORES", "TFL", "ACME", "TESCO STORES", None]
+    narrations = ["", "Bus", "Refund", "Refund", "x"]
+    amounts = [Decimal(a) for a in ["-5", "-2", "10", "10", "-1"]]
+    ids = [None, None, None, None, 42]
+    expected = [
+        rules.match(p, n, a, i) for p, n, a, i in zip(payees, narrations, amounts, ids)
+    ]
+    assert expected == [
+        "Expenses:Groceries",
+        "Expenses:Transport",
+        "Income:Back",
+        "Expenses:Groceries",
+        "Expenses:Known",
+    ]
+    assert rules.match_batch(payees, narrations, amounts, ids) == expected
+
+
+def test_invalid_rules_are_rejected():
+    with pytest.raises(ValueError):
+        RuleSet([dict(payee="X")])
+    with pytest.raises(ValueError):
+        RuleSet([dict(payee="X", account="A", colour="red")])
+    with pytest.raises(ValueError):
+        RuleSet([dict(payee="X", account="A", sign="zero")])
@@ -0,0 +1,193 @@
+import datetime
+import os
+
+from beancount.core import data
+from beancount.core.amount import Amount
+from beancount.core.number import D
+
+from beancount_importers.transfers import (
+    TransferMatcher,
+    link_transfer,
+    match_transfers,
+    merge_transfer,
+)
+
+MONZO = "Assets:Monzo:Cash"
+REVOLUT = "Assets:Revolut:Cash"
+ACCOUNTS = {MONZO, REVOLUT}
+
+
+def transaction(day, account, amount, other="Expenses:FIXME", narration=""):
+    units = Amount(D(amount), "GBP")
+    return data.Transaction(
+        data.new_metadata("statement.csv", 0),
+        datetime.date(2024, 3, day),
+        "*",
+        None,
+        narration,
+        data.EMPTY_SET,
+        data.EMPTY_SET,
+        [
+            data.Posting(account, units, None, None, None, {}),
+            data.Posting(other, -units, None, None, None, None),
+        ],
+    )
+
+
+def test_pairs_closest_day_first():
+    outgoing = transaction(10, MONZO, "-100")
+    far = transaction(12, REVOLUT, "100", narration="far")
+    near = transaction(11, REVOLUT, "100", narration="near")
+    pairs = match_transfers([far, outgoing, near], ACCOUNTS)
+    assert pairs == [(outgoing, near)]
+
+
+def test_needs_same_amount_other_account_and_window():
+    outgoing = transaction(10, MONZO, "-100")
+    candidates = [
+        transaction(10, REVOLUT, "99.99"),
+        transaction(10, MONZO, "100"),
+        transaction(20, REVOLUT, "100"),
+        transaction(10, REVOLUT, "100", other="Expenses:Groceries"),
+    ]
+    assert match_transfers([outgoing] + candidates, ACCOUNTS) == []
+
+
+def test_categorized_leg_only_pairs_with_its_account():
+    outgoing = transaction(10, MONZO, "-100", other=REVOLUT)
+    incoming = transaction(10, REVOLUT, "100")
+    assert match_transfers([outgoing, incoming], ACCOUNTS) == [(outgoing, incoming)]
+    elsewhere = transaction(10, MONZO, "-100", other="Assets:Wise:Cash")
+    assert match_transfers([elsewhere, incoming], ACCOUNTS) == []
+
+
+def test_each_incoming_leg_pairs_once():
+    first = transaction(10, MONZO, "-100", narration="first")
+    second = transaction(10, MONZO, "-100", narration="second")
+    incoming = transaction(10, REVOLUT, "100")
+    assert len(match_transfers([first, second, incoming], ACCOUNTS)) == 1
+
+
+def test_link_transfer_returns_new_entries():
+    outgoing = transaction(10, MONZO, "-100")
+    incoming = transaction(11, REVOLUT, "100")
+    linked_outgoing, linked_incoming = link_transfer(outgoing, incoming)
+    assert linked_outgoing.postings[1].account == REVOLUT
+    assert linked_incoming.postings[1].account == MONZO
+    assert outgoing.postings[1].account == "Expenses:FIXME"
+    assert incoming.postings[1].account == "Expenses:FIXME"
+
+
+def test_merge_transfer():
+    outgoing = transaction(10, MONZO, "-100")
+    merged = merge_transfer(outgoing, transaction(11, REVOLUT, "100"))
+    assert merged.date == datetime.date(2024, 3, 10)
+    assert [posting.account for posting in merged.postings] == [MONZO, REVOLUT]
+
+
+class StatementImporter:
+    """Reads "day,amount" lines, counting the files it extracts."""
+
+    def __init__(self, account):
+        self.account = account
+        self.extracted = []
+
+    def identify(self, filepath):
+        return filepath.endswith(".csv")
+
+    def extract(self, filepath, existing):
+        self.extracted.append(os.path.basename(filepath))
+        with open(filepath, "r") as fh:
+            return [
+                transaction(int(day), self.account, amount)
+                for day, amount in (line.strip().split(",") for line in fh)
+            ]
+
+
+def write(filename, text):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "w") as fh:
+        fh.write(text)
+
+
+def accounts_of(entries):
+    return [entry.postings[1].account for entry in entries]
+
+
+def test_matcher_extracts_each_file_again_only_when_asked(tmp_path):
+    monzo_dir = str(tmp_path / "monzo")
+    revolut_dir = str(tmp_path / "revolut")
+    write(os.path.join(monzo_dir, "march.csv"), "10,-100\n12,-5\n")
+    write(os.path.join(monzo_dir, "april.csv"), "1,-7\n")
+    write(os.path.join(revolut_dir, "march.csv"), "11,100\n")
+    monzo = StatementImporter(MONZO)
+    revolut = StatementImporter(REVOLUT)
+    matcher = TransferMatcher()
+    wrapped_monzo = matcher.wrap(monzo, monzo_dir, MONZO)
+    wrapped_revolut = matcher.wrap(revolut, revolut_dir, REVOLUT)
+
+    monzo_march = wrapped_monzo.extract(os.path.join(monzo_dir, "march.csv"), [])
+    assert accounts_of(monzo_march) == [REVOLUT, "Expenses:FIXME"]
+    assert sorted(monzo.extracted) == ["april.csv", "march.csv"]
+    assert revolut.extracted == ["march.csv"]
+    revolut_march = wrapped_revolut.extract(os.path.join(revolut_dir, "march.csv"), [])
+    assert accounts_of(revolut_march) == [MONZO]
+    assert revolut.extracted == ["march.csv"]
+
+    # Asked again, e.g. after a reload: only that file is extracted again
+    again = wrapped_revolut.extract(os.path.join(revolut_dir, "march.csv"), [])
+    assert accounts_of(again) == [MONZO]
+    assert sorted(monzo.extracted) == ["april.csv", "march.csv"]
+    assert revolut.extracted == ["march.csv", "march.csv"]
+
+
+def test_matcher_pairs_new_statement_with_extracted_ones(tmp_path):
+    monzo_dir = str(tmp_path / "monzo")
+    revolut_dir = str(tmp_path / "revolut")
+    write(os.path.join(monzo_dir, "march.csv"), "10,-100\n")
+    os.makedirs(revolut_dir)
+    monzo = StatementImporter(MONZO)
+    revolut = StatementImporter(REVOLUT)
+    matcher = TransferMatcher()
+    wrapped_monzo = matcher.wrap(monzo, monzo_dir, MONZO)
+    wrapped_revolut = matcher.wrap(revolut, revolut_dir, REVOLUT)
+    first = wrapped_monzo.extract(os.path.join(monzo_dir, "march.csv"), [])
+    assert accounts_of(first) == ["Expenses:FIXME"]
+
+    write(os.path.join(revolut_dir, "march.csv"), "11,100\n")
+    incoming = wrapped_revolut.extract(os.path.join(revolut_dir, "march.csv"), [])
+    assert accounts_of(incoming) == [MONZO]
+    outgoing = wrapped_monzo.extract(os.path.join(monzo_dir, "march.csv"), [])
+    assert accounts_of(outgoing) == [REVOLUT]
+    # What was extracted stays as the importer returned it
+    assert accounts_of(first) == ["Expenses:FIXME"]
+    assert monzo.extracted == ["march.csv", "march.csv"]
+
+    matcher.remove(revolut_dir)
+    alone = wrapped_monzo.extract(os.path.join(monzo_dir, "march.csv"), [])
+    assert accounts_of(alone) == ["Expenses:FIXME"]
+
+
+def test_matcher_hands_out_copies(tmp_path):
+    monzo_dir = str(tmp_path / "monzo")
+    revolut_dir = str(tmp_path / "revolut")
+    write(os.path.join(monzo_dir, "march.csv"), "10,-100\n12,-5\n")
+    write(os.path.join(revolut_dir, "march.csv"), "11,100\n")
+    matcher = TransferMatcher()
+    wrapped_monzo = matcher.wrap(StatementImporter(MONZO), monzo_dir, MONZO)
+    matcher.wrap(StatementImporter(REVOLUT), revolut_dir, REVOLUT)
+    statement = os.path.join(monzo_dir, "march.csv")
+
+    # What beancount-import's importer source does with the entries
+    for entry in wrapped_monzo.extract(statement, []):
+        entry.meta.pop("filename")
+        entry.postings[0].meta["source_desc"] = "edited"
+
+    kept = [entry for entries in matcher.extracted.values() for entry in entries]
+    assert all("filename" in entry.meta for entry in kept)
+    assert all(not entry.postings[0].meta for entry in kept)
+
+    again = wrapped_monzo.extract(statement, [])
+    assert [entry.meta["filename"] for entry in again] == ["statement.csv"] * 2
+    assert [entry.postings[0].meta for entry in again] == [{}, {}]
+    assert accounts_of(again) == [REVOLUT, "Expenses:FIXME"]
@@ -0,0 +1,217 @@
+import datetime
+import glob
+import os
+
+from beancount.core import data
+from beancount.core.amount import Amount
+from beancount.core.number import D
+from beancount_import import reconcile, webserver
+from beancount_import.matching import FIXME_ACCOUNT
+from beancount_import.source import ImportResult, Source
+
+from beancount_importers import output_shards
+from beancount_importers.config_reload import (
+    ConfigWatcher,
+    read_config,
+    source_specs,
+)
+from beancount_importers.watch import StatementWatcher
+
+ACCOUNT = "Assets:Bank:Cash"
+
+
+class StatementSource(Source):
+    """Lists its statements once, when created, like beancount-import's own sources."""
+
+    def __init__(self, directory, account, **kwargs):
+        super().__init__(**kwargs)
+        self.account = account
+        pattern = os.path.join(directory, "**", "*.csv")
+        self.files = sorted(glob.glob(pattern, recursive=True))
+
+    @property
+    def name(self):
+        return "statements"
+
+    def prepare(self, journal, results):
+        results.add_account(self.account)
+        for filename in self.files:
+            with open(filename, "r") as fh:
+                for lineno, line in enumerate(fh, 1):
+                    date, amount, narration = line.strip().split(",")
+                    date = datetime.date.fromisoformat(date)
+                    units = Amount(D(amount), "GBP")
+                    entry = data.Transaction(
+                        data.new_metadata(filename, lineno),
+                        date,
+                        "*",
+                        None,
+                        narration,
+                        data.EMPTY_SET,
+                        data.EMPTY_SET,
+                        [
+                            data.Posting(self.account, units, None, None, None, {}),
+                            data.Posting(FIXME_ACCOUNT, -units, None, None, None, {}),
+                        ],
+                    )
+                    info = dict(filename=filename, line=lineno)
+                    results.add_pending_entry(
+                        ImportResult(date=date, entries=[entry], info=info)
+                    )
+
+
+def load(spec, log_status):
+    return StatementSource(log_status=log_status, **spec)
+
+
+class Application:
+    def __init__(self, reconciler):
+        self.reconciler = reconciler
+        self.resets = 0
+
+    def reset(self):
+        self.resets += 1
+
+
+def write(filename, text):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "w") as fh:
+        fh.write(text)
+
+
+def pending_narrations(reconciler):
+    loaded = reconciler.loaded_future.result()
+    return sorted(pending.entries[0].narration for pending in loaded.pending_data)
+
+
+def make_reconciler(tmp_path, data_sources):
+    journal = tmp_path / "main.bean"
+    write(str(journal), f"2020-01-01 open {ACCOUNT}\n")
+    write(str(tmp_path / "ignored.bean"), "")
+    args = webserver.parse_arguments(
+        [],
+        journal_input=str(journal),
+        ignored_journal=str(tmp_path / "ignored.bean"),
+        default_output=str(tmp_path / "transactions.bean"),
+        data_sources=data_sources,
+    )
+    return reconcile.Reconciler(
+        journal_path=args.journal_input,
+        ignore_path=args.ignored_journal,
+        log_status=lambda message: None,
+        options=vars(args),
+    )
+
+
+def test_dropped_statement_becomes_pending(tmp_path):
+    bank = str(tmp_path / "data" / "bank")
+    other = str(tmp_path / "data" / "other")
+    write(os.path.join(bank, "2024-01.csv"), "2024-01-05,-10.00,Coffee\n")
+    os.makedirs(other)
+    reconciler = make_reconciler(
+        tmp_path,
+        [
+            dict(module=__name__, directory=bank, account=ACCOUNT),
+            dict(module=__name__, directory=other, account="Assets:Other:Cash"),
+        ],
+    )
+    application = Application(reconciler)
+    watcher = StatementWatcher(application, [bank, other])
+    assert pending_narrations(reconciler) == ["Coffee"]
+    unchanged = reconciler.loaded_future.result().sources[1]
+
+    write(os.path.join(bank, "2024-02.csv"), "2024-02-07,-25.50,Groceries\n")
+    watcher.reload()
+
+    assert pending_narrations(reconciler) == ["Coffee", "Groceries"]
+    assert application.resets == 1
+    # Only the source of the directory that changed is created again
+    assert reconciler.loaded_future.result().sources[1] is unchanged
+
+    watcher.reload()
+    assert application.resets == 1
+
+
+def test_statements_of_source_added_to_config_are_watched(tmp_path):
+    data_dir = tmp_path / "data"
+    bank = str(data_dir / "bank")
+    os.makedirs(bank)
+    config = str(tmp_path / "importers_config.yml")
+    write(config, f"importers:\n  bank:\n    importer: bank\n    account: {ACCOUNT}\n")
+
+    def build_source(key, params, shared_rules):
+        directory = str(data_dir / key)
+        return dict(module=__name__, directory=directory, account=params["account"])
+
+    params = read_config(config)["importers"]["bank"]
+    reconciler = make_reconciler(tmp_path, [build_source("bank", params, [])])
+    application = Application(reconciler)
+    application.statement_watcher = StatementWatcher(application, [bank], interval=60)
+    application.statement_watcher.start()
+    config_watcher = ConfigWatcher(
+        application, config, source_specs(read_config(config)), build_source, None
+    )
+    try:
+        with open(config, "a") as fh:
+            fh.write("  savings:\n    importer: bank\n    account: Assets:Savings\n")
+        config_watcher.reload()
+        reconciler.loaded_future.result()
+        savings = str(data_dir / "savings")
+        observer = application.statement_watcher.observer
+        assert savings in {emitter.watch.path for emitter in observer.emitters}
+
+        write(os.path.join(savings, "2024-01.csv"), "2024-01-09,-3.00,Transfer\n")
+        application.statement_watcher.reload()
+        assert pending_narrations(reconciler) == ["Transfer"]
+        assert application.resets == 2
+    finally:
+        application.statement_watcher.observer.stop()
+
+
+def test_source_added_to_config_gets_its_own_shard(tmp_path):
+    data_dir = tmp_path / "data"
+    out = str(tmp_path / "out")
+    default_output = os.path.join(out, "transactions.bean")
+    config = str(tmp_path / "importers_config.yml")
+    write(config, f"importers:\n  bank:\n    importer: bank\n    account: {ACCOUNT}\n")
+
+    def build_source(key, params, shared_rules):
+        directory = str(data_dir / key)
+        os.makedirs(directory, exist_ok=True)
+        return dict(module=__name__, directory=directory, account=params["account"])
+
+    def update_output(data_sources):
+        accounts = [source["account"] for source in data_sources]
+        return output_shards.update_output(
+            out, default_output, accounts, by_source=True
+        )
+
+    params = read_config(config)["importers"]["bank"]
+    reconciler = make_reconciler(tmp_path, [build_source("bank", params, [])])
+    specs = source_specs(read_config(config))
+    config_watcher = ConfigWatcher(
+        Application(reconciler), config, specs, build_source, None, update_output
+    )
+    with open(config, "a") as fh:
+        fh.write("  savings:\n    importer: bank\n    account: Assets:Savings\n")
+    config_watcher.reload()
+
+    units = Amount(D("5"), "GBP")
+    entry = data.Transaction(
+        data.new_metadata("statement.csv", 0),
+        datetime.date(2024, 1, 9),
+        "*",
+        None,
+        "Transfer",
+        data.EMPTY_SET,
+        data.EMPTY_SET,
+        [
+            data.Posting("Assets:Savings", units, None, None, None, None),
+            data.Posting(FIXME_ACCOUNT, -units, None, None, None, None),
+        ],
+    )
+    shard = os.path.join(out, "Assets-Savings", "transactions.bean")
+    assert reconciler.entry_file_selector(entry) == shard
+    assert os.path.exists(shard)
+    with open(os.path.join(out, "index.bean")) as fh:
+        assert 'include "Assets-Savings/transactions*.bean"' in fh.read().splitlines()